@@ -0,0 +1,39 @@
+import argparse
+import time
+
+import numpy as np
+
+from particle_tracking import track_particles_np
+
+parser = argparse.ArgumentParser(description='Micro-benchmark of the centroid update for a single dense particle.')
+parser.add_argument('--events', type=int, default=500000, help='Number of events per run.')
+parser.add_argument('--rates', type=float, nargs='+', default=[0.1, 0.5, 1.0, 2.0, 4.0], help='Events per microsecond to sweep.')
+parser.add_argument('--centroid-window', type=float, default=2000.0, help='Centroid window [us].')
+parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+args = parser.parse_args()
+
+# Parameters for particle tracking (same as trackParticlesC.py)
+sigma_x = 6.0
+sigma_t = 10000.0
+gaussian_threshold = 0.8
+m_threshold = 500
+
+
+def make_dense_blob(num_events, rate, rng, radius=15.0):
+    """Events of one blob drifting across the sensor, so the centroid window holds about rate * window events."""
+    t = np.sort(rng.uniform(0, num_events / rate, size=num_events))
+    angle = rng.uniform(0, 2 * np.pi, size=num_events)
+    r = radius * np.sqrt(rng.uniform(0, 1, size=num_events))
+    x = 200 + 1e-4 * t + r * np.cos(angle)
+    y = 300 + r * np.sin(angle)
+    return x.astype(np.int32), y.astype(np.int32), t.astype(np.float32)
+
+
+rng = np.random.default_rng(args.seed)
+print(f"{'rate/us':>8} {'window events':>14} {'seconds':>9} {'events/s':>12}")
+for rate in args.rates:
+    x, y, t = make_dense_blob(args.events, rate, rng)
+    start = time.perf_counter()
+    track_particles_np(x, y, t, sigma_x, sigma_t, gaussian_threshold, m_threshold, centroid_window=args.centroid_window)
+    elapsed = time.perf_counter() - start
+    print(f'{rate:>8.2f} {int(rate * args.centroid_window):>14} {elapsed:>9.3f} {args.events / elapsed:>12.0f}')
@@ -0,0 +1,41 @@
+import argparse
+import time
+
+import numpy as np
+
+from particle_tracking import track_particles_np
+
+parser = argparse.ArgumentParser(description='Benchmark of merging many fragments of one particle.')
+parser.add_argument('--fragments', type=int, nargs='+', default=[100, 200, 400, 800], help='Numbers of fragments to sweep.')
+parser.add_argument('--events-per-fragment', type=int, default=200, help='Events of each fragment before the merges.')
+args = parser.parse_args()
+
+# Parameters for particle tracking (same as trackParticlesC.py)
+sigma_x = 6.0
+sigma_t = 10000.0
+gaussian_threshold = 0.8
+m_threshold = 500
+
+
+def make_fragments(num_fragments, events_per_fragment, spacing=6, duration=1000.0):
+    """A row of fragments just out of reach of each other, then one bridging event per gap from the right end to the
+    left end, so every merge joins a new fragment to everything merged so far."""
+    num_events = num_fragments * events_per_fragment
+    fragment = np.tile(np.arange(num_fragments), events_per_fragment)
+    x = 100 + spacing * fragment
+    t = np.linspace(0, duration, num_events)
+    bridge_x = 100 + spacing * np.arange(num_fragments - 2, -1, -1) + spacing // 2
+    bridge_t = duration + np.arange(1, num_fragments)
+    x = np.concatenate([x, bridge_x])
+    t = np.concatenate([t, bridge_t])
+    return x.astype(np.int32), np.full(len(x), 100, dtype=np.int32), t.astype(np.float32)
+
+
+print(f"{'fragments':>9} {'events':>9} {'seconds':>9} {'events/s':>12}")
+for num_fragments in args.fragments:
+    x, y, t = make_fragments(num_fragments, args.events_per_fragment)
+    start = time.perf_counter()
+    columns = track_particles_np(x, y, t, sigma_x, sigma_t, gaussian_threshold, m_threshold)
+    elapsed = time.perf_counter() - start
+    assert len(columns['particle_id']) == 1
+    print(f'{num_fragments:>9} {len(x):>9} {elapsed:>9.3f} {len(x) / elapsed:>12.0f}')
@@ -0,0 +1,47 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from particle_tracking import read_events
+
+parser = argparse.ArgumentParser(description='Compare the native event reader with pandas on a synthetic recording.')
+parser.add_argument('--events', type=int, default=5000000, help='Number of events in the synthetic recording.')
+parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+args = parser.parse_args()
+
+CSV_DTYPES = {'x': np.int32, 'y': np.int32, 'polarity': np.int8, 'time': np.float32}
+
+
+def timed(function, *arguments, **keywords):
+    start = time.perf_counter()
+    function(*arguments, **keywords)
+    return time.perf_counter() - start
+
+
+rng = np.random.default_rng(args.seed)
+frame = pd.DataFrame({
+    'x': rng.integers(0, 1280, args.events),
+    'y': rng.integers(0, 720, args.events),
+    'polarity': rng.integers(0, 2, args.events),
+    'time': np.sort(rng.integers(0, 60000000, args.events)),
+})
+
+with tempfile.TemporaryDirectory() as directory:
+    csv_path = os.path.join(directory, 'events.csv')
+    npy_path = os.path.join(directory, 'events.npy')
+    frame.to_csv(csv_path, header=False, index=False)
+    np.save(npy_path, frame.to_numpy())
+    size_mb = os.path.getsize(csv_path) / 1e6
+
+    print(f"{'reader':>24} {'seconds':>9} {'events/s':>12}")
+    for name, seconds in [
+        ('pandas.read_csv', timed(pd.read_csv, csv_path, header=None, names=list(CSV_DTYPES), dtype=CSV_DTYPES)),
+        ('read_events (csv)', timed(read_events, csv_path)),
+        ('read_events (npy)', timed(read_events, npy_path)),
+    ]:
+        print(f'{name:>24} {seconds:>9.3f} {args.events / seconds:>12.0f}')
+    print(f'CSV size: {size_mb:.0f} MB')
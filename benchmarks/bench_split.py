@@ -0,0 +1,74 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from particle_results import open_results
+from splitTrajectory import compute_smoothed_centroid, nearest_time_index
+
+parser = argparse.ArgumentParser(description='Compare the vectorized upper/lower split with the former per-event loop.')
+parser.add_argument('-i', '--input', default='sampleData/particle_tracking_results_both_recording_2023-09-14_20-42-19_39.npz',
+                    help='Particle tracking results whose densest particle is split (default: the sample recording).')
+parser.add_argument('--events', type=int, default=200000, help='Events of the synthetic bat pass used when --input does not exist.')
+parser.add_argument('--loop-events', type=int, default=2000, help='Events timed with the per-event loop (its time is extrapolated).')
+args = parser.parse_args()
+
+
+def synthetic_pass(num_events, rng, duration=3e6):
+    """One bat crossing the sensor with a flapping wing, with a centroid entry per event like the tracker's"""
+    t = np.sort(rng.uniform(0, duration, num_events)).astype(np.float32)
+    centre_y = 360 + 40 * np.sin(2 * np.pi * 10 * t * 1e-6)
+    events = np.column_stack((200 + t * 3e-4 + rng.normal(0, 5, num_events), centre_y + rng.normal(0, 15, num_events), t))
+    history = np.column_stack((t, 200 + t * 3e-4, centre_y))
+    return {'events': events.astype(np.float32), 'centroid_history': history}
+
+
+def upper_mask_loop(events, centroid_history, smoothed_y):
+    """The former per-event loop: nearest centroid of each event by argmin over the whole history"""
+    is_upper = []
+    for event in events:
+        time_index = int(np.argmin(np.abs(centroid_history[:, 0] - event[2])))
+        is_upper.append(event[1] > smoothed_y[time_index])
+    return np.asarray(is_upper, dtype=bool)
+
+
+def upper_mask_vectorized(events, centroid_history, smoothed_y):
+    """The split_events_by_centroid lookup: searchsorted nearest centroid and a boolean mask"""
+    return events[:, 1] > smoothed_y[nearest_time_index(centroid_history[:, 0], events[:, 2])]
+
+
+if os.path.exists(args.input):
+    with open_results(args.input) as results:
+        particle = results.particle(results.densest())
+    print(f'{args.input}: densest particle')
+else:
+    particle = synthetic_pass(args.events, np.random.default_rng(0))
+    print(f'{args.input} not found: synthetic bat pass')
+events = np.asarray(particle['events'], dtype=np.float32)
+centroid_history = np.asarray(particle['centroid_history'], dtype=np.float32)
+num_events = len(events)
+print(f'{num_events} events, {len(centroid_history)} centroid entries')
+
+# The Savitzky-Golay smoothing is shared by both versions and timed on its own
+start = time.perf_counter()
+smoothed_x, smoothed_y = compute_smoothed_centroid(centroid_history)
+smoothing = time.perf_counter() - start
+
+start = time.perf_counter()
+is_upper = upper_mask_vectorized(events, centroid_history, smoothed_y)
+upper, lower = events[is_upper], events[~is_upper]
+vectorized = time.perf_counter() - start
+
+# The loop is O(events x history): time it on the first events (against the full history) and extrapolate
+loop_events = min(args.loop_events, num_events)
+start = time.perf_counter()
+loop_is_upper = upper_mask_loop(events[:loop_events], centroid_history, smoothed_y)
+loop = (time.perf_counter() - start) * num_events / loop_events
+assert np.array_equal(loop_is_upper, is_upper[:loop_events])
+
+print(f"{'step':>12} {'seconds':>9} {'events/s':>12}")
+print(f"{'smoothing':>12} {smoothing:>9.3f} {num_events / smoothing:>12.0f}")
+print(f"{'loop':>12} {loop:>9.3f} {num_events / loop:>12.0f}  (extrapolated from {loop_events} events)")
+print(f"{'vectorized':>12} {vectorized:>9.3f} {num_events / vectorized:>12.0f}")
+print(f'{len(upper)} upper, {len(lower)} lower events; identical to the loop on the timed events')
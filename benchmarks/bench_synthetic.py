@@ -0,0 +1,124 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+
+from particle_tracking import track_particles_cpp
+from plotEventCountFFT import count_events, estimate_wingfreqs
+from plot_lod import stratified_sample
+from synthetic_events import DURATION, NOISE_RATE, WING_SPAN, bat_centres, generate_events
+
+parser = argparse.ArgumentParser(description='Tracker throughput, peak memory and wingbeat estimate error on synthetic bats, '
+                                             'swept over the number of bats and their event rate.')
+parser.add_argument('--particles', type=int, nargs='+', default=[1, 4, 16], help='Numbers of bats to sweep.')
+parser.add_argument('--rates', type=float, nargs='+', default=[10.0, 20.0, 50.0], help='Events per ms of each bat to sweep.')
+parser.add_argument('--duration', type=float, default=DURATION, help='Length of each recording (ms).')
+parser.add_argument('--noise', type=float, default=NOISE_RATE, help='Background events per ms over the whole sensor.')
+parser.add_argument('--crossings', type=float, default=0.25, help='Fraction of the bats flying through another one.')
+parser.add_argument('--tolerance', type=float, default=1.0, help='Wingbeat estimate error (Hz) below which a bat counts as found.')
+parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+args = parser.parse_args()
+
+# Parameters for particle tracking (same as trackParticlesC.py)
+sigma_x = 6.0
+sigma_t = 10000.0
+gaussian_threshold = 0.8
+m_threshold = 500
+
+MATCH_SAMPLE = 200  # Events of a particle compared with the bat positions
+MATCH_DISTANCE = 2 * WING_SPAN  # Events further than this from every bat are not attributed to one (pixels)
+
+
+def resident_bytes():
+    """Resident set size of this process, or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class PeakMemory:
+    """Peak growth of the resident memory while the block runs, sampled by a thread (the tracker releases the GIL)"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+
+    def __enter__(self):
+        self.baseline = self.peak = resident_bytes()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        if self.baseline is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.baseline is not None:
+            self.done.set()
+            self.thread.join()
+            self.peak = max(self.peak, resident_bytes())
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, resident_bytes())
+
+    @property
+    def megabytes(self):
+        return np.nan if self.baseline is None else (self.peak - self.baseline) / 1024**2
+
+
+def match_bat(synthetic, events):
+    """Bat most of a particle's (sampled) events lie next to, or -1 for a particle of noise"""
+    events = events[stratified_sample(events[:, 2], MATCH_SAMPLE)]
+    offsets = bat_centres(synthetic, events[:, 2]) - events[:, None, :2]
+    distances = np.hypot(offsets[..., 0], offsets[..., 1])
+    nearest = np.where(distances.min(axis=1) <= MATCH_DISTANCE, distances.argmin(axis=1), -1)
+    votes = np.bincount(nearest + 1, minlength=2)
+    return int(np.argmax(votes)) - 1
+
+
+def wingbeat_errors(synthetic, particles):
+    """Wingbeat estimate minus the true frequency of every bat, estimated as the pipeline does from the
+    event counts of the largest particle attributed to the bat (NaN for a bat no particle was attributed to)"""
+    largest = {}
+    for particle in particles:
+        events = np.array(particle.events, dtype=np.float64)
+        bat = match_bat(synthetic, events)
+        if bat >= 0 and len(events) > len(largest.get(bat, ())):
+            largest[bat] = events
+    errors = np.full(len(synthetic['wingbeat']), np.nan)
+    if largest:
+        bats = sorted(largest)
+        _, _, wingfreqs = estimate_wingfreqs([count_events(largest[bat]) for bat in bats])
+        errors[bats] = wingfreqs - synthetic['wingbeat'][bats]
+    return errors
+
+
+def run(num_bats, rate, seed):
+    """Generate and track one recording. Runs in a fresh process, so that the memory freed by earlier runs is
+    not reused by the tracker and the peak memory of every run is measured from the same state"""
+    rng = np.random.default_rng(seed)
+    crossings = int(num_bats * args.crossings) // 2
+    synthetic = generate_events(num_bats, rate, args.duration, args.noise, crossings, rng=rng)
+    data = list(zip(synthetic['x'].tolist(), synthetic['y'].tolist(), synthetic['t'].tolist()))
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        particles = track_particles_cpp(data, sigma_x, sigma_t, gaussian_threshold, m_threshold)
+        elapsed = time.perf_counter() - start
+    return len(data), len(particles), elapsed, memory.megabytes, wingbeat_errors(synthetic, particles)
+
+
+configurations = [(num_bats, rate) for num_bats in args.particles for rate in args.rates]
+seeds = np.random.SeedSequence(args.seed).spawn(len(configurations))
+print(f"{'bats':>5} {'rate':>6} {'events':>9} {'tracked':>8} {'seconds':>9} {'events/s':>12} {'peak MB':>8} "
+      f"{'found':>6} {'median err Hz':>14}")
+for (num_bats, rate), seed in zip(configurations, seeds):
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        num_events, num_tracked, elapsed, megabytes, errors = pool.apply(run, (num_bats, rate, seed))
+    found = np.sum(np.abs(errors) <= args.tolerance)
+    median_error = np.nanmedian(np.abs(errors)) if np.isfinite(errors).any() else np.nan
+    print(f'{num_bats:>5} {rate:>6g} {num_events:>9} {num_tracked:>8} {elapsed:>9.3f} {num_events / elapsed:>12.0f} '
+          f'{megabytes:>8.1f} {f"{found}/{num_bats}":>6} {median_error:>14.2f}')
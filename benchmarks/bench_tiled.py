@@ -0,0 +1,72 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from particle_tracking import track_particles_np, track_particles_tiled
+
+parser = argparse.ArgumentParser(description='Scaling of tiled tracking with the number of threads, checked against the single-threaded tracker.')
+parser.add_argument('--events', type=int, default=1000000, help='Number of events.')
+parser.add_argument('--bats', type=int, default=16, help='Number of simulated bats.')
+parser.add_argument('--tiles', type=int, nargs=2, default=[4, 2], metavar=('X', 'Y'), help='Tile grid.')
+parser.add_argument('--threads', type=int, nargs='+', default=None, help='Thread counts to sweep (default: 1 up to every core).')
+parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+args = parser.parse_args()
+
+# Parameters for particle tracking (same as trackParticlesC.py)
+sigma_x = 6.0
+sigma_t = 10000.0
+gaussian_threshold = 0.8
+m_threshold = 500
+
+
+def make_bats(num_bats, num_events, rng, width=1280, height=720, radius=8.0):
+    """Time-ordered blobs spread over the sensor, each drifting a few hundred pixels so some of them cross tile seams."""
+    per_bat = num_events // num_bats
+    duration = per_bat / 2.0
+    xs, ys, ts = [], [], []
+    for _ in range(num_bats):
+        t = np.sort(rng.uniform(0, duration, per_bat))
+        start = rng.uniform(50, [width - 50, height - 50])
+        velocity = rng.uniform(-1, 1, 2) * 400 / duration
+        angle = rng.uniform(0, 2 * np.pi, per_bat)
+        r = radius * np.sqrt(rng.uniform(0, 1, per_bat))
+        xs.append(start[0] + velocity[0] * t + r * np.cos(angle))
+        ys.append(start[1] + velocity[1] * t + r * np.sin(angle))
+        ts.append(t)
+    order = np.argsort(np.concatenate(ts), kind='stable')
+    return (np.concatenate(xs)[order].astype(np.int32), np.concatenate(ys)[order].astype(np.int32),
+            np.concatenate(ts)[order].astype(np.float32))
+
+
+def event_sets(columns):
+    """Set of particles, each as the frozenset of its (x, y, t) events"""
+    events = list(zip(columns['x'].tolist(), columns['y'].tolist(), columns['t'].tolist()))
+    offsets = columns['event_offsets']
+    return {frozenset(events[offsets[k]:offsets[k + 1]]) for k in range(len(offsets) - 1)}
+
+
+def agreement(reference, columns):
+    """Fraction of the reference's tracked events that belong to an identical particle in columns"""
+    reference_sets = event_sets(reference)
+    identical = reference_sets & event_sets(columns)
+    return sum(len(s) for s in identical) / max(1, sum(len(s) for s in reference_sets))
+
+
+rng = np.random.default_rng(args.seed)
+x, y, t = make_bats(args.bats, args.events, rng)
+thread_counts = args.threads or list(range(1, (os.cpu_count() or 1) + 1))
+
+start = time.perf_counter()
+reference = track_particles_np(x, y, t, sigma_x, sigma_t, gaussian_threshold, m_threshold)
+single = time.perf_counter() - start
+print(f'single-threaded: {single:.3f} s, {len(reference["particle_id"])} particles')
+
+print(f"{'threads':>8} {'seconds':>9} {'speedup':>8} {'agreement':>10}")
+for num_threads in thread_counts:
+    start = time.perf_counter()
+    columns = track_particles_tiled(x, y, t, sigma_x, sigma_t, gaussian_threshold, m_threshold,
+                                    tiles_x=args.tiles[0], tiles_y=args.tiles[1], num_threads=num_threads)
+    elapsed = time.perf_counter() - start
+    print(f'{num_threads:>8} {elapsed:>9.3f} {single / elapsed:>8.2f} {agreement(reference, columns):>10.4f}')
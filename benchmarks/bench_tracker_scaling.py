@@ -0,0 +1,59 @@
+import argparse
+import time
+
+import numpy as np
+
+from particle_tracking import track_particles_cpp
+
+parser = argparse.ArgumentParser(description='Measure tracker throughput against the number of concurrent particles.')
+parser.add_argument('--events', type=int, default=200000, help='Total number of events per run.')
+parser.add_argument('--particles', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64], help='Particle counts to sweep.')
+parser.add_argument('--rate', type=float, default=0.01, help='Events per microsecond emitted by each particle.')
+parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+args = parser.parse_args()
+
+# Parameters for particle tracking (same as trackParticlesC.py)
+sigma_x = 6.0
+sigma_t = 10000.0
+gaussian_threshold = 0.8
+m_threshold = 500
+
+
+def make_blobs(num_particles, num_events, rate, rng, width=1280, height=720, radius=8.0):
+    """Generate time-ordered events from blobs moving on straight lines across the sensor."""
+    per_particle = num_events // num_particles
+    duration = per_particle / rate
+    columns = int(np.ceil(np.sqrt(num_particles * width / height)))
+    rows = int(np.ceil(num_particles / columns))
+    xs, ys, ts = [], [], []
+    for k in range(num_particles):
+        start_x = (k % columns + 0.5) * width / columns
+        start_y = (k // columns + 0.5) * height / rows
+        velocity = rng.uniform(-1, 1, size=2) * 20.0 / duration  # pixels per microsecond
+        t = np.sort(rng.uniform(0, duration, size=per_particle))
+        angle = rng.uniform(0, 2 * np.pi, size=per_particle)
+        r = radius * np.sqrt(rng.uniform(0, 1, size=per_particle))
+        xs.append(start_x + velocity[0] * t + r * np.cos(angle))
+        ys.append(start_y + velocity[1] * t + r * np.sin(angle))
+        ts.append(t)
+    x = np.concatenate(xs).astype(np.int32)
+    y = np.concatenate(ys).astype(np.int32)
+    t = np.concatenate(ts).astype(np.float32)
+    order = np.argsort(t, kind='stable')
+    return x[order], y[order], t[order]
+
+
+def run(num_particles, rng):
+    x, y, t = make_blobs(num_particles, args.events, args.rate, rng)
+    data = list(zip(x.tolist(), y.tolist(), t.tolist()))
+    start = time.perf_counter()
+    particles = track_particles_cpp(data, sigma_x, sigma_t, gaussian_threshold, m_threshold)
+    elapsed = time.perf_counter() - start
+    return len(data), len(particles), elapsed
+
+
+rng = np.random.default_rng(args.seed)
+print(f"{'particles':>10} {'events':>10} {'tracked':>8} {'seconds':>9} {'events/s':>12}")
+for num_particles in args.particles:
+    num_events, num_tracked, elapsed = run(num_particles, rng)
+    print(f'{num_particles:>10} {num_events:>10} {num_tracked:>8} {elapsed:>9.3f} {num_events / elapsed:>12.0f}')
@@ -46,62 +46,118 @@ def peak_detection(fft_amplitude, fft_freq):
     return peaks, max_height_index
 
 
+def octave_bounds(fft_fq):
+    """Index range [lower, upper) of the frequencies within one octave of each
+    frequency (above half of it, up to twice it), for an ascending frequency axis"""
+    fft_fq = np.asarray(fft_fq)
+    lower = np.searchsorted(fft_fq, fft_fq / 2, side="right")
+    upper = np.searchsorted(fft_fq, fft_fq * 2, side="right")
+    return lower, upper
+
+
+def range_max(fft_amp, start, stop):
+    """Maximum of fft_amp[..., start[k]:stop[k]] for every k (NaN ignored, -inf for
+    empty ranges), from a sparse table of the maxima of power-of-two windows"""
+    levels = [fft_amp]
+    width = 1
+    while 2 * width <= fft_amp.shape[-1]:
+        levels.append(np.fmax(levels[-1][..., :-width], levels[-1][..., width:]))
+        width *= 2
+
+    length = stop - start
+    result = np.full(fft_amp.shape[:-1] + length.shape, -np.inf)
+    # floor(log2(length)): the two windows of that level cover the range
+    level = np.frexp(np.maximum(length, 1))[1] - 1
+    for k in np.unique(level[length > 0]):
+        cols = np.flatnonzero((length > 0) & (level == k))
+        result[..., cols] = np.fmax(
+            levels[k][..., start[cols]], levels[k][..., stop[cols] - 2**k]
+        )
+    return result
+
+
+def batch_custom_peak_detection(fft_amp, fft_fq):
+    """custom_peak_detection over every row of an (n_series, n_freqs) amplitude array
+    sharing the ascending frequency axis fft_fq.
+
+    A point that the spectrum rises to is a peak when no amplitude within one octave
+    of it is higher and it stands more than 10 above their average. Returns a boolean
+    (n_series, n_freqs) mask of the peaks between FILTER_LOW and FILTER_HIGH and the
+    index of each row's highest one (-1 if there is none)"""
+    fft_amp = np.atleast_2d(np.asarray(fft_amp, dtype=float))
+    fft_fq = np.asarray(fft_fq)
+    n_series, n_freqs = fft_amp.shape
+    peak_mask = np.zeros((n_series, n_freqs), dtype=bool)
+    if n_freqs < 2:
+        return peak_mask, np.full(n_series, -1)
+
+    # Every candidate i (a point not above its predecessor) tests the peak p = i - 1
+    # against the octave [lower, upper) around it, leaving out the point i itself
+    p = np.arange(n_freqs - 1)
+    i = p + 1
+    lower, upper = octave_bounds(fft_fq)
+    lower, upper = lower[p], upper[p]
+    peak_amp = fft_amp[:, p]
+
+    # The scan stops at the first higher amplitude: before the peak, the rise is
+    # over; after it, the rise continues
+    left_higher = range_max(fft_amp, lower, p) > peak_amp
+    right_higher = range_max(fft_amp, i + 1, upper) > peak_amp
+    higher = left_higher | right_higher
+
+    # Average of the octave without the point i, non-finite amplitudes counted apart
+    finite = np.isfinite(fft_amp)
+    zero_pad = np.zeros((n_series, 1))
+    amp_sum = np.concatenate((zero_pad, np.cumsum(np.where(finite, fft_amp, 0), axis=1)), axis=1)
+    non_finite = np.concatenate((zero_pad, np.cumsum(~finite, axis=1)), axis=1)
+    i_in_octave = (lower <= i) & (i < upper)
+    octave_sum = amp_sum[:, upper] - amp_sum[:, lower] - np.where(
+        i_in_octave & finite[:, i], fft_amp[:, i], 0
+    )
+    octave_count = upper - lower - i_in_octave
+    octave_non_finite = non_finite[:, upper] - non_finite[:, lower] - (
+        i_in_octave & ~finite[:, i]
+    )
+    amp_diff = peak_amp - octave_sum / np.maximum(octave_count, 1)
+    accepted = (
+        ~higher
+        & (octave_non_finite == 0)
+        & np.isfinite(peak_amp)
+        & (amp_diff > 10.0)
+    )
+    # The rise counter is reset by a higher amplitude before the peak, by reaching
+    # the end of the octave before the end of the spectrum, or by a peak
+    resets = left_higher | (~higher & ((upper < n_freqs) | accepted))
+
+    # i is tested when the spectrum rose since the last reset
+    rises = fft_amp[:, 1:] > fft_amp[:, :-1]
+    columns = np.arange(n_freqs - 1)
+    last_rise = np.maximum.accumulate(np.where(rises, columns, -1), axis=1)
+    reset_count = np.cumsum(~rises & resets, axis=1)
+    last_rise_before = np.concatenate((np.full((n_series, 1), -1), last_rise[:, :-1]), axis=1)
+    resets_before = np.concatenate((np.zeros((n_series, 1), dtype=int), reset_count[:, :-1]), axis=1)
+    resets_since_rise = resets_before - np.take_along_axis(
+        reset_count, np.maximum(last_rise_before, 0), axis=1
+    )
+    tested = ~rises & (last_rise_before >= 0) & (resets_since_rise == 0)
+
+    peak_mask[:, p] = tested & accepted
+    peak_mask &= (FILTER_LOW <= fft_fq) & (fft_fq <= FILTER_HIGH)
+    max_peak_idx = np.where(
+        peak_mask.any(axis=1),
+        np.argmax(np.where(peak_mask, fft_amp, -np.inf), axis=1),
+        -1,
+    )
+    return peak_mask, max_peak_idx
+
+
 def custom_peak_detection(fft_amp, fft_fq):
-    increase_cnter = 0
-    last_amp_point = fft_amp[0]
-    list_peak_idx = []
-
-    for i, amp_point in enumerate(fft_amp):
-        if amp_point > last_amp_point:
-            increase_cnter += 1
-        elif increase_cnter >= 1:
-            fq = fft_fq[i - 1]
-            top_fq = fq * 2
-            bottom_fq = fq / 2
-            peak_flg = 1
-
-            avg_amp = 0.0
-            tmp_cnter = 0
-            for j, fq_point in enumerate(fft_fq):
-                if fq_point <= bottom_fq:
-                    continue
-                elif top_fq < fq_point:
-                    increase_cnter = 0
-                    break
-                elif i == j:
-                    continue
-
-                if fft_amp[j] > last_amp_point:
-                    peak_flg = 0
-                    if j < i:
-                        increase_cnter = 0
-                    break
-
-                avg_amp += fft_amp[j]
-                tmp_cnter += 1
-
-            if peak_flg:
-                avg_amp /= tmp_cnter
-                amp_diff = last_amp_point - avg_amp
-                if (amp_diff > 10.0) and (amp_diff != np.inf):
-                    list_peak_idx.append(i - 1)
-                    increase_cnter = 0
-
-        last_amp_point = amp_point
-
-    if list_peak_idx:
-        # Extract only the largest peak
-        valid_peak_indices = [
-            idx
-            for idx in list_peak_idx
-            if FILTER_LOW <= fft_fq[idx] <= FILTER_HIGH
-        ]
-        if valid_peak_indices:
-
-            max_peak_idx = max(valid_peak_indices, key=lambda idx: fft_amp[idx])
-            # return [max_peak_idx]
-            return valid_peak_indices, max_peak_idx
-    return []
+    """Peaks between FILTER_LOW and FILTER_HIGH and the highest of them (see
+    batch_custom_peak_detection), or [] if there is none"""
+    peak_mask, max_peak_idx = batch_custom_peak_detection(fft_amp, fft_fq)
+    if max_peak_idx[0] < 0:
+        return []
+    return np.flatnonzero(peak_mask[0]).tolist(), int(max_peak_idx[0])
 
 
 def detect_wingfreq(peak_freqs: list, max_peak_freq: float):
@@ -149,3 +205,60 @@ def detect_wingfreq(peak_freqs: list, max_peak_freq: float):
         wingfreq = max_peak_freq
 
     return wingfreq
+
+
+def batch_peak_detection(fft_amplitude, fft_freq):
+    """peak_detection over every row of an (n_series, n_freqs) amplitude array.
+    Returns the peak indices, an (n_series, 2) array with the two highest peaks
+    (highest first, -1 where a row has fewer), and the index of each row's highest
+    peak (-1 if the row has none)"""
+    fft_amplitude = np.atleast_2d(fft_amplitude)
+    filter_idx = np.flatnonzero((fft_freq >= FILTER_LOW) & (fft_freq <= FILTER_HIGH))
+    min_area_idx = filter_idx[0]
+    band = fft_amplitude[:, min_area_idx : filter_idx[-1] + 1]
+    threshold = np.max(band, axis=1, keepdims=True) * 0.85
+
+    # Strict local maxima above the threshold, as find_peaks reports them
+    centre = band[:, 1:-1]
+    is_peak = (centre > band[:, :-2]) & (centre > band[:, 2:]) & (centre >= threshold)
+    # find_peaks also reports the middle of flat-topped peaks: rows with equal
+    # neighbouring amplitudes are handed to it
+    for row in np.flatnonzero(np.any(band[:, 1:] == band[:, :-1], axis=1)):
+        is_peak[row] = False
+        peaks, _ = find_peaks(band[row], height=threshold[row, 0])
+        is_peak[row, peaks - 1] = True
+
+    heights = np.where(is_peak, centre, -np.inf)
+    has_peak = is_peak.any(axis=1)
+    max_peak_idx = np.where(has_peak, np.argmax(heights, axis=1) + 1 + min_area_idx, -1)
+
+    # Two highest peaks, ordered as peak_detection orders them
+    top_2 = np.argsort(heights, axis=1, kind="stable")[:, :-3:-1]
+    # The order of equal heights is left to its (unstable) argsort: rows where a
+    # tie decides the top two are ordered by the same call
+    top_3 = np.sort(np.pad(heights, ((0, 0), (3, 0)), constant_values=-np.inf), axis=1)[:, -3:]
+    tied = np.isfinite(top_3[:, -2]) & (
+        (top_3[:, -1] == top_3[:, -2]) | (top_3[:, -2] == top_3[:, -3])
+    )
+    for row in np.flatnonzero(tied):
+        peaks = np.flatnonzero(is_peak[row])
+        top_2[row] = peaks[np.argsort(centre[row, peaks])[-2:][::-1]]
+    peak_indices = np.where(
+        np.take_along_axis(is_peak, top_2, axis=1), top_2 + 1 + min_area_idx, -1
+    )
+    return peak_indices, max_peak_idx
+
+
+def batch_detect_wingfreq(peak_freqs, max_peak_freq):
+    """detect_wingfreq for a batch: peak_freqs is an (n_series, n_peaks) array
+    (NaN for missing peaks) and max_peak_freq the highest peak of each row.
+    The lowest peak around half the highest one is the wingbeat frequency,
+    otherwise the highest peak is"""
+    peak_freqs = np.asarray(peak_freqs, dtype=float)
+    max_peak_freq = np.asarray(max_peak_freq, dtype=float)
+    half = max_peak_freq[:, None]
+    is_half = (
+        ((half - 1) / 2 <= peak_freqs) & (peak_freqs <= (half + 1) / 2) & (peak_freqs != 0)
+    )
+    half_freq = np.min(np.where(is_half, peak_freqs, np.inf), axis=1)
+    return np.where(is_half.any(axis=1), half_freq, max_peak_freq)
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+CACHE_DIRNAME = "cache"  # Sub-directory of windowed_fft_results holding the entries
+CACHE_MAX_BYTES = 512 * 1024**2  # Size above which the least recently used entries are evicted
+CACHE_VERSION = 1  # Bumped when the cached analysis changes, so older entries are not reused
+DIGESTS_FILE = "digests.json"  # Content hashes of the input files (reused while their size and mtime do not change) and the input file of each entry
+HASH_BLOCK = 1 << 20  # Bytes read at a time when hashing an input file
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, read block by block"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FFTCache:
+    """Content-addressed cache of per-file analysis results (arrays) in a directory.
+
+    An entry is keyed by the SHA-256 of the input file and the analysis parameters,
+    so a renamed file is still found and a modified one (or a parameter change) is
+    recomputed. Entries are .npz files; once they exceed max_bytes, the least recently
+    used ones are deleted. The directory is scanned once, when the cache is opened:
+    after that, the entries, their recency and their total size are tracked in memory.
+    Use as a context manager so the file digests are saved"""
+
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.digests_path = os.path.join(directory, DIGESTS_FILE)
+        try:
+            with open(self.digests_path) as f:
+                index = json.load(f)
+            self.digests = dict(index["digests"])
+            self.entry_files = dict(index["entries"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self.digests = {}
+            self.entry_files = {}  # Entry key -> input file it was computed from
+        self.digests_changed = False
+
+        # Entries from the least to the most recently used, with their sizes
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime_ns, name[:-len(".npz")], stat.st_size))
+        self.entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self.total_bytes = sum(self.entries.values())
+        self.entry_files = {key: name for key, name in self.entry_files.items() if key in self.entries}
+        self.file_entries = Counter(self.entry_files.values())  # Input file -> number of entries computed from it
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.digests_changed:
+            index = {"digests": self.digests, "entries": self.entry_files}
+            self._write_atomic(self.digests_path, lambda f: f.write(json.dumps(index).encode()))
+            self.digests_changed = False
+
+    def digest(self, path):
+        """Content hash of an input file, recomputed only when its size or mtime changed"""
+        stat = os.stat(path)
+        name = os.path.abspath(path)
+        known = self.digests.get(name)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        digest = file_digest(path)
+        self.digests[name] = [stat.st_size, stat.st_mtime_ns, digest]
+        self.digests_changed = True
+        return digest
+
+    def key(self, path, parameters):
+        """Entry name of an input file analysed with the given parameters (a JSON-serialisable dict)"""
+        parameters = json.dumps({"version": CACHE_VERSION, **parameters}, sort_keys=True)
+        key = hashlib.sha256(f"{self.digest(path)}\n{parameters}".encode()).hexdigest()
+        name = os.path.abspath(path)
+        previous = self.entry_files.get(key)
+        if previous != name:
+            if previous is not None:
+                self.file_entries[previous] -= 1
+            self.entry_files[key] = name
+            self.file_entries[name] += 1
+            self.digests_changed = True
+        return key
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key):
+        """Arrays of an entry, or None if it is not cached"""
+        path = self.entry_path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # Most recently used, also for the next time the cache is opened
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        return arrays
+
+    def store(self, key, arrays):
+        """Write an entry, then evict the least recently used entries above max_bytes"""
+        path = self.entry_path(key)
+        self._write_atomic(path, lambda f: np.savez(f, **arrays))
+        self.total_bytes -= self.entries.pop(key, 0)
+        self.entries[key] = os.path.getsize(path)
+        self.total_bytes += self.entries[key]
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until they fit in max_bytes, and forget the digests of the input
+        files that no longer have an entry"""
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.entry_path(key))
+            except FileNotFoundError:
+                pass
+            name = self.entry_files.pop(key, None)
+            if name is None:
+                continue
+            self.digests_changed = True
+            self.file_entries[name] -= 1
+            if self.file_entries[name] <= 0:
+                del self.file_entries[name]
+                self.digests.pop(name, None)
+
+    def _write_atomic(self, path, write):
+        """Write through a temporary file renamed into place, so readers never see a partial entry"""
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,343 @@
+import json
+import os
+import pickle
+import zipfile
+
+import numpy as np
+
+# Columnar result files written by trackParticlesC.py: an uncompressed .npz holding one typed array per column, with
+# per-particle offset tables into the event and centroid columns (particle k owns x[event_offsets[k]:event_offsets[k + 1]])
+# and a JSON metadata header with the tracking parameters. Version 2 adds per-particle summary columns, so that the
+# summary of a particle is read without touching its events
+RESULTS_FORMAT = 'evsbat-particles'
+RESULTS_VERSION = 2
+RESULTS_EXTENSION = '.npz'
+RESULTS_EXTENSIONS = (RESULTS_EXTENSION, '.pkl')  # Files accepted by load_particles: columnar results and legacy pickles
+
+COLUMN_DTYPES = {
+    'particle_id': np.int32,
+    'event_offsets': np.int64,
+    'x': np.int32,
+    'y': np.int32,
+    't': np.float32,
+    'centroid_offsets': np.int64,
+    'centroid_t': np.float32,
+    'centroid_x': np.float64,
+    'centroid_y': np.float64,
+}
+
+# Optional per-particle event counts (tracked with count_bin_width > 0): particle k has counts[count_offsets[k]:
+# count_offsets[k + 1]] events in successive bins of count_bin_width (recorded in the tracking parameters) from count_start[k]
+COUNT_DTYPES = {
+    'count_offsets': np.int64,
+    'count_start': np.float64,
+    'counts': np.int32,
+}
+
+# Upper/lower event sets of every particle of a recording, written by splitTrajectory.py --all-particles
+SPLIT_FORMAT = 'evsbat-split'
+SPLIT_VERSION = 1
+SPLIT_HALVES = ('upper', 'lower')
+
+SUMMARY_DTYPES = {
+    't_start': np.float32,
+    't_end': np.float32,
+    'x_min': np.int32,
+    'x_max': np.int32,
+    'y_min': np.int32,
+    'y_max': np.int32,
+}
+
+
+def results_path(file_path, extension=RESULTS_EXTENSION):
+    """Path of the tracking results of an event file, next to it"""
+    base_filename = os.path.basename(file_path).split(".")[0]
+    return os.path.join(os.path.dirname(file_path), f'particle_tracking_results_both_{base_filename}{extension}')
+
+
+def results_files(file_paths):
+    """The results files among file_paths, in order, without the legacy pickles whose columnar copy is listed too
+    (trackParticlesC.py --pickle writes both, which would otherwise be processed twice)"""
+    file_paths = [f for f in file_paths if f.endswith(RESULTS_EXTENSIONS)]
+    listed = set(file_paths)
+    return [f for f in file_paths if not (f.endswith('.pkl') and f[:-len('.pkl')] + RESULTS_EXTENSION in listed)]
+
+
+def particle_summary(columns):
+    """Per-particle event count, time span and bounding box of columnar output (particles without events get zeros)"""
+    offsets = np.asarray(columns['event_offsets'])
+    counts = np.diff(offsets)
+    summary = {'particle_id': np.asarray(columns['particle_id'], dtype=np.int32), 'event_count': counts}
+    nonempty = counts > 0
+    starts = offsets[:-1][nonempty]
+    for key, column, reduce in [('t_start', 't', np.minimum), ('t_end', 't', np.maximum), ('x_min', 'x', np.minimum),
+                                ('x_max', 'x', np.maximum), ('y_min', 'y', np.minimum), ('y_max', 'y', np.maximum)]:
+        values = np.zeros(len(counts), dtype=SUMMARY_DTYPES[key])
+        if len(starts):
+            values[nonempty] = reduce.reduceat(np.asarray(columns[column])[:offsets[-1]], starts)
+        summary[key] = values
+    return summary
+
+
+def save_results(path, columns, metadata=None):
+    """Write the tracker's columnar output to path (.npz) with metadata (a JSON-serialisable dict, e.g. the tracking
+    parameters) in its header"""
+    header = {'format': RESULTS_FORMAT, 'version': RESULTS_VERSION, 'num_particles': len(columns['particle_id'])}
+    header.update(metadata or {})
+    arrays = {key: np.ascontiguousarray(columns[key], dtype=dtype) for key, dtype in COLUMN_DTYPES.items()}
+    if 'counts' in columns:
+        arrays.update((key, np.ascontiguousarray(columns[key], dtype=dtype)) for key, dtype in COUNT_DTYPES.items())
+    summary = particle_summary(arrays)
+    arrays.update((key, summary[key]) for key in SUMMARY_DTYPES)
+    with open(path, 'wb') as f:  # A file object keeps np.savez from appending .npz to other extensions
+        np.savez(f, metadata=np.array(json.dumps(header)), **arrays)
+
+
+def read_metadata(path, members):
+    metadata = json.loads(str(members['metadata'][()]))
+    if metadata.get('format') != RESULTS_FORMAT or metadata.get('version', 0) > RESULTS_VERSION:
+        raise ValueError(f"{path} is not a particle tracking results file this version can read")
+    return metadata
+
+
+def load_results(path):
+    """Read a results file written by save_results. Returns (columns, metadata)"""
+    with np.load(path, allow_pickle=False) as data:
+        metadata = read_metadata(path, data)
+        columns = {key: data[key] for key in list(COLUMN_DTYPES) + list(COUNT_DTYPES) if key in data.files}
+    return columns, metadata
+
+
+def map_npz(path):
+    """{name: array} of the members of an .npz file. Uncompressed members (as written by save_results) are
+    memory-mapped in place, so only the pages that are indexed get read; compressed ones are loaded"""
+    members = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    members[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            # The member's data follows its local file header (30 bytes, then the file name and extra field)
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+            version = np.lib.format.read_magic(f)
+            if version not in ((1, 0), (2, 0)):
+                with archive.open(info) as member:
+                    members[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path} holds Python objects in {name}")
+            if shape == ():
+                with archive.open(info) as member:
+                    members[name] = np.lib.format.read_array(member, allow_pickle=False)
+            elif int(np.prod(shape)) == 0:
+                members[name] = np.empty(shape, dtype)
+            else:
+                members[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                          order='F' if fortran_order else 'C')
+    return members
+
+
+def particles_to_columnar(particle_data):
+    """Columnar form of {particle_id: {'centroid_history': ..., 'events': ...}} dicts (the legacy pickle)"""
+    particle_ids = sorted(particle_data)
+    events = [np.asarray(particle_data[k].get('events', []), dtype=np.float64).reshape(-1, 3) for k in particle_ids]
+    centroids = [np.asarray(particle_data[k].get('centroid_history', []), dtype=np.float64).reshape(-1, 3) for k in particle_ids]
+    all_events = np.concatenate(events) if events else np.empty((0, 3))
+    all_centroids = np.concatenate(centroids) if centroids else np.empty((0, 3))
+    return {
+        'particle_id': np.asarray(particle_ids, dtype=np.int32),
+        'event_offsets': np.concatenate([[0], np.cumsum([len(e) for e in events], dtype=np.int64)]).astype(np.int64),
+        'x': all_events[:, 0].astype(np.int32),
+        'y': all_events[:, 1].astype(np.int32),
+        't': all_events[:, 2].astype(np.float32),
+        'centroid_offsets': np.concatenate([[0], np.cumsum([len(c) for c in centroids], dtype=np.int64)]).astype(np.int64),
+        'centroid_t': all_centroids[:, 0].astype(np.float32),
+        'centroid_x': all_centroids[:, 1],
+        'centroid_y': all_centroids[:, 2],
+    }
+
+
+class ParticleResults:
+    """Lazy reader of a results file. The columns are memory-mapped: the per-particle summary and the choice of a
+    particle only read the offset and summary tables, and a particle's events are read when they are asked for"""
+
+    def __init__(self, columns, metadata=None, summary=None):
+        self.columns = columns
+        self.metadata = metadata or {}
+        self.particle_ids = np.asarray(columns['particle_id'])
+        self._rows = {particle_id: row for row, particle_id in enumerate(self.particle_ids.tolist())}
+        self._summary = summary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Drop the memory maps (arrays handed out keep theirs alive)"""
+        self.columns = {}
+        self._summary = None
+
+    def __len__(self):
+        return len(self.particle_ids)
+
+    def __contains__(self, particle_id):
+        return particle_id in self._rows
+
+    def summary(self):
+        """{column: array} with one entry per particle: particle_id, event_count, t_start, t_end, x_min, x_max,
+        y_min, y_max (computed from the events for files written before the summary columns existed)"""
+        if self._summary is None:
+            self._summary = particle_summary(self.columns)
+        return self._summary
+
+    def event_counts(self):
+        """{particle_id: number of events}"""
+        return dict(zip(self.particle_ids.tolist(), np.diff(self.columns['event_offsets']).tolist()))
+
+    def densest(self):
+        """ID of the particle with the most events (the smallest ID on ties), or None without events"""
+        counts = np.diff(self.columns['event_offsets'])
+        if len(counts) == 0 or counts.max() == 0:
+            return None
+        return int(self.particle_ids[counts == counts.max()].min())
+
+    def event_columns(self, particle_id):
+        """x, y and t columns of a particle's events, as views of the mapped file"""
+        row = self._rows[particle_id]
+        start, end = self.columns['event_offsets'][row:row + 2]
+        return self.columns['x'][start:end], self.columns['y'][start:end], self.columns['t'][start:end]
+
+    def events(self, particle_id):
+        """(M, 3) float32 array of a particle's events (x, y, time)"""
+        x, y, t = self.event_columns(particle_id)
+        events = np.empty((len(t), 3), dtype=np.float32)
+        events[:, 0] = x
+        events[:, 1] = y
+        events[:, 2] = t
+        return events
+
+    def centroid_history(self, particle_id):
+        """(N, 3) array of a particle's centroid history (time, x, y)"""
+        row = self._rows[particle_id]
+        start, end = self.columns['centroid_offsets'][row:row + 2]
+        return np.column_stack((self.columns['centroid_t'][start:end], self.columns['centroid_x'][start:end],
+                                self.columns['centroid_y'][start:end]))
+
+    @property
+    def count_bin_width(self):
+        """Bin width of the recorded event counts, or None when the file has none"""
+        if 'counts' not in self.columns:
+            return None
+        return self.metadata.get('parameters', {}).get('count_bin_width')
+
+    def count_series(self, particle_id):
+        """Event counts of a particle recorded by the tracker: (start time of the first bin, counts in bins of
+        count_bin_width), or None when the file has none"""
+        if 'counts' not in self.columns:
+            return None
+        row = self._rows[particle_id]
+        start, end = self.columns['count_offsets'][row:row + 2]
+        return float(self.columns['count_start'][row]), self.columns['counts'][start:end]
+
+    def particle(self, particle_id):
+        """Legacy dict of one particle: {'centroid_history': (N, 3) array, 'events': (M, 3) array}"""
+        return {'centroid_history': self.centroid_history(particle_id), 'events': self.events(particle_id)}
+
+
+def open_results(path):
+    """ParticleResults of a columnar results file (memory-mapped) or of a legacy pickle of particle dicts (loaded in
+    full)"""
+    if not path.endswith(RESULTS_EXTENSION):
+        with open(path, 'rb') as f:
+            particle_data = pickle.load(f)
+        if not isinstance(particle_data, dict):
+            raise ValueError(f"{path} does not hold particle tracking results")
+        return ParticleResults(particles_to_columnar(particle_data))
+    members = map_npz(path)
+    metadata = read_metadata(path, members)
+    columns = {key: members[key] for key in list(COLUMN_DTYPES) + list(COUNT_DTYPES) if key in members}
+    summary = None
+    if all(key in members for key in SUMMARY_DTYPES):  # Version 1 files have no summary columns
+        summary = {key: members[key] for key in SUMMARY_DTYPES}
+        summary.update(particle_id=columns['particle_id'], event_count=np.diff(columns['event_offsets']))
+    return ParticleResults(columns, metadata, summary)
+
+
+def save_split_results(path, particle_ids, halves, metadata=None):
+    """Write the upper and lower event sets of several particles (halves[k] = (upper, lower) (M, 3) arrays of x, y,
+    time for particle_ids[k]) to one .npz: particle_id, then upper_offsets, upper_x, upper_y, upper_t and the same
+    lower_* columns"""
+    header = {'format': SPLIT_FORMAT, 'version': SPLIT_VERSION, 'num_particles': len(particle_ids)}
+    header.update(metadata or {})
+    arrays = {'particle_id': np.asarray(particle_ids, dtype=np.int32)}
+    for k, half in enumerate(SPLIT_HALVES):
+        events = [np.asarray(pair[k], dtype=np.float32).reshape(-1, 3) for pair in halves]
+        all_events = np.concatenate(events) if events else np.empty((0, 3), dtype=np.float32)
+        arrays[f'{half}_offsets'] = np.concatenate([[0], np.cumsum([len(e) for e in events])]).astype(np.int64)
+        arrays[f'{half}_x'] = all_events[:, 0].astype(np.int32)
+        arrays[f'{half}_y'] = all_events[:, 1].astype(np.int32)
+        arrays[f'{half}_t'] = all_events[:, 2]
+    with open(path, 'wb') as f:
+        np.savez(f, metadata=np.array(json.dumps(header)), **arrays)
+
+
+def load_split_results(path):
+    """Read a file written by save_split_results. Returns ({particle_id: (upper, lower)}, metadata), each half an
+    (M, 3) float32 array of x, y, time"""
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data['metadata']))
+        if metadata.get('format') != SPLIT_FORMAT or metadata.get('version', 0) > SPLIT_VERSION:
+            raise ValueError(f"{path} is not an upper/lower split file this version can read")
+        columns = {key: data[key] for key in data.files if key != 'metadata'}
+
+    halves = {}
+    for row, particle_id in enumerate(columns['particle_id'].tolist()):
+        pair = []
+        for half in SPLIT_HALVES:
+            start, end = columns[f'{half}_offsets'][row:row + 2]
+            pair.append(np.column_stack((columns[f'{half}_x'][start:end], columns[f'{half}_y'][start:end],
+                                         columns[f'{half}_t'][start:end])).astype(np.float32))
+        halves[particle_id] = tuple(pair)
+    return halves, metadata
+
+
+def columnar_to_particles(columns):
+    """Split the tracker's columnar output into {particle_id: {'centroid_history': (N, 3) array, 'events': (M, 3) array}}"""
+    events = np.empty((len(columns['t']), 3), dtype=np.float32)
+    events[:, 0] = columns['x']
+    events[:, 1] = columns['y']
+    events[:, 2] = columns['t']
+    centroids = np.column_stack((columns['centroid_t'], columns['centroid_x'], columns['centroid_y']))
+
+    event_offsets = columns['event_offsets']
+    centroid_offsets = columns['centroid_offsets']
+    particle_ids = columns['particle_id']
+    particle_output = {}
+    for k in np.argsort(particle_ids, kind='stable').tolist():  # Particles retired while streaming come out of ID order
+        particle_output[int(particle_ids[k])] = {
+            'centroid_history': centroids[centroid_offsets[k]:centroid_offsets[k + 1]],  # Centroid coordinates (time, x, y)
+            'events': events[event_offsets[k]:event_offsets[k + 1]]  # All events [(x, y, time), ...]
+        }
+    return particle_output
+
+
+def save_particles_pickle(path, columns):
+    """Legacy export: pickle of {particle_id: {'centroid_history': ..., 'events': ...}}"""
+    with open(path, 'wb') as f:
+        pickle.dump(columnar_to_particles(columns), f)
+
+
+def load_particles(path):
+    """Particle dicts of a results file, either columnar (.npz) or a legacy pickle"""
+    if path.endswith(RESULTS_EXTENSION):
+        return columnar_to_particles(load_results(path)[0])
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -1,11 +1,39 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
 #include <deque>
 #include <vector>
 #include <tuple>
 #include <cmath>
 #include <algorithm>
 #include <limits>
+#include <unordered_map>
+#include <list>
+#include <map>
+#include <queue>
+#include <functional>
+#include <cstdint>
+#include <iterator>
+#include <stdexcept>
+#include <string>
+#include <cstdio>
+#include <cstring>
+#include <cstdlib>
+#include <cerrno>
+#include <cctype>
+#include <thread>
+#include <atomic>
+#include <exception>
+#include <memory>
+#ifdef _WIN32
+#define NOMINMAX
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
 
 // Struct to store the result of particle tracking
 struct ParticleResult {
@@ -14,79 +42,652 @@ struct ParticleResult {
     std::vector<std::tuple<int, int, float>> events;  // List of events(x, y, time)
 };
 
+// Columnar result of particle tracking. Particle k owns rows event_offsets[k]..event_offsets[k + 1] of the event columns
+// and rows centroid_offsets[k]..centroid_offsets[k + 1] of the centroid columns (CSR layout). When event counts are
+// recorded (count_bin_width > 0), it also owns counts[count_offsets[k]..count_offsets[k + 1]], the number of events in
+// successive bins of count_bin_width starting at count_start[k].
+struct ColumnarResult {
+    double count_bin_width;
+    std::vector<int32_t> particle_id;
+    std::vector<int64_t> event_offsets;
+    std::vector<int32_t> event_x, event_y;
+    std::vector<float> event_t;
+    std::vector<int64_t> centroid_offsets;
+    std::vector<float> centroid_t;
+    std::vector<double> centroid_x, centroid_y;
+    std::vector<int64_t> count_offsets;
+    std::vector<double> count_start;
+    std::vector<int32_t> counts;
+
+    explicit ColumnarResult(double count_bin_width = 0.0)
+        : count_bin_width(count_bin_width), event_offsets(1, 0), centroid_offsets(1, 0), count_offsets(1, 0) {}
+
+    // Append the counts of the events at the given times, on the bins of count_bin_width (nothing when not recorded)
+    template <typename TimeAt>
+    void append_counts(size_t num_events, TimeAt time_at);
+};
+
+// Histogram of the event times of a particle on a fixed grid: bin b spans [b * width, (b + 1) * width). The grid does not
+// depend on the particle, so the histograms of merged particles (or stitched pieces) add up bin by bin.
+struct EventCounts {
+    int64_t first_bin = 0;
+    std::vector<int32_t> values;  // values[k] is the number of events in bin first_bin + k
+
+    static int64_t bin_of(double time, double width) {
+        return static_cast<int64_t>(std::floor(time / width));
+    }
+
+    void add(double time, double width) {
+        add_to_bin(bin_of(time, width), 1);
+    }
+
+    void add_to_bin(int64_t bin, int32_t count) {
+        if (values.empty()) {
+            first_bin = bin;
+        } else if (bin < first_bin) {  // Only for events fed out of time order
+            values.insert(values.begin(), static_cast<size_t>(first_bin - bin), 0);
+            first_bin = bin;
+        }
+        size_t k = static_cast<size_t>(bin - first_bin);
+        if (k >= values.size()) {
+            values.resize(k + 1, 0);
+        }
+        values[k] += count;
+    }
+
+    // Add the counts of other (left empty) to these
+    void merge(EventCounts& other) {
+        if (other.values.empty()) {
+            return;
+        }
+        if (values.empty()) {
+            std::swap(first_bin, other.first_bin);
+            values.swap(other.values);
+            return;
+        }
+        add_to_bin(other.first_bin, 0);  // Extend to the first bin of other
+        add_to_bin(other.first_bin + static_cast<int64_t>(other.values.size()) - 1, 0);  // and to its last one
+        size_t offset = static_cast<size_t>(other.first_bin - first_bin);
+        for (size_t k = 0; k < other.values.size(); ++k) {
+            values[offset + k] += other.values[k];
+        }
+        other.values.clear();
+    }
+
+    void append_to(ColumnarResult& result) const {
+        result.count_start.push_back(first_bin * result.count_bin_width);
+        result.counts.insert(result.counts.end(), values.begin(), values.end());
+        result.count_offsets.push_back(static_cast<int64_t>(result.counts.size()));
+    }
+};
+
+// Raise unless bin_width is a valid bin width for event counts (0 means no counts)
+void check_count_bin_width(double bin_width) {
+    if (!(bin_width >= 0) || std::isinf(bin_width)) {
+        throw std::invalid_argument("count_bin_width must be a finite number, not negative");
+    }
+}
+
+template <typename TimeAt>
+void ColumnarResult::append_counts(size_t num_events, TimeAt time_at) {
+    if (count_bin_width > 0) {
+        EventCounts event_counts;
+        for (size_t k = 0; k < num_events; ++k) {
+            event_counts.add(time_at(k), count_bin_width);
+        }
+        event_counts.append_to(*this);
+    }
+}
+
+// Gaussian distance calculation. Computes spatial (x, y) and temporal (t) distance between two events and returns a score based on a Gaussian distribution.
+// sigma_x is the spatial standard deviation of the Gaussian distribution, and sigma_t is the temporal standard deviation.
+// Minus the log of the Gaussian score of a pair of events (the score is exp(-gaussian_exponent(...)))
+double gaussian_exponent(int x1, int y1, float t1, int x2, int y2, float t2, double sigma_x, double sigma_t) {
+    double spatial_distance_sq = (x1 - x2) * (x1 - x2) + (y1 - y2) * (y1 - y2);  // // Spatial distance squared
+    double time_distance_sq = (t1 - t2) * (t1 - t2);  // Temporal distance squared
+    return spatial_distance_sq / (2 * sigma_x * sigma_x) + time_distance_sq / (2 * sigma_t * sigma_t);
+}
+
+double gaussian_distance(int x1, int y1, float t1, int x2, int y2, float t2, double sigma_x, double sigma_t) {
+    return std::exp(-gaussian_exponent(x1, y1, t1, x2, y2, t2, sigma_x, sigma_t));  // Score based on Gaussian distribution. Closer to 1 means events are closer in space-time.
+}
+
+// Largest distance at which the Gaussian score can still reach the threshold for the given sigma.
+// Used to size the grid cells and to skip candidates without evaluating exp. Infinite when every pair matches.
+double gaussian_reach(double sigma, double gaussian_threshold) {
+    if (!(gaussian_threshold > 0.0)) {
+        return std::numeric_limits<double>::infinity();
+    }
+    if (gaussian_threshold >= 1.0) {
+        return 0.0;
+    }
+    return sigma * std::sqrt(-2.0 * std::log(gaussian_threshold));
+}
+
+// Disjoint sets of particle IDs. Merging particles only links the absorbed ID to the surviving one, so events filed under
+// the ID of an absorbed particle resolve to the particle that owns them now. Only absorbed IDs are stored: a missing ID
+// is its own root, and the IDs absorbed by a particle are forgotten when that particle leaves the tracker.
+class ParticleForest {
+public:
+    ParticleForest() : link_count(0) {}
+
+    // Return the surviving particle ID of a (possibly absorbed) particle ID, compressing the path on the way
+    int find(int particle_id) {
+        if (parent.empty()) {
+            return particle_id;
+        }
+        int root = particle_id;
+        for (auto it = parent.find(root); it != parent.end(); it = parent.find(root)) {
+            root = it->second;
+        }
+        while (particle_id != root) {
+            auto it = parent.find(particle_id);
+            particle_id = it->second;
+            it->second = root;
+        }
+        return root;
+    }
+
+    // Record that the particle absorbed_id now belongs to the surviving particle root_id
+    void link(int absorbed_id, int root_id) {
+        parent[absorbed_id] = root_id;
+        link_count++;
+    }
+
+    // Number of links made so far: an ID resolved when this was unchanged is still resolved
+    uint64_t generation() const {
+        return link_count;
+    }
+
+    void forget(int absorbed_id) {
+        parent.erase(absorbed_id);
+    }
+
+private:
+    std::unordered_map<int, int> parent;  // Absorbed ID -> ID it was merged into
+    uint64_t link_count;
+};
+
+// Spatial hash index over the recent events of all particles.
+// Events are bucketed into square cells sized from the spatial reach of the Gaussian threshold, so a query only scores
+// events in the neighbouring cells instead of every recent event of every particle. Inside a cell the events are grouped
+// by the particle they were filed under: groups of particles that already matched are skipped whole, and a group stops at
+// its first match.
+// While only a few particles are live the cells cost more than they save (a query looks up several of them to find the
+// one or two particles in view), so the groups are then kept in a single list that every query scans, as the tracker did
+// before the index existed (see adapt).
+// Removal is lazy: slots are marked dead and compacted out of their group the next time the group is scanned (or by a
+// full sweep once dead slots dominate).
+class RecentEventIndex {
+public:
+    static const size_t HASH_PARTICLES = 8;  // Live particles above which the groups are filed in cells
+    static const size_t LINEAR_PARTICLES = 4;  // Live particles at or below which they return to the single list
+
+    RecentEventIndex(double sigma_x, double sigma_t, double gaussian_threshold)
+        : sigma_x(sigma_x), sigma_t(sigma_t), gaussian_threshold(gaussian_threshold), hashed(false), live_count(0),
+          dead_count(0) {
+        // Pad the reaches so rounding in gaussian_distance can never accept a pair the filter rejected
+        double spatial_reach = gaussian_reach(sigma_x, gaussian_threshold);
+        double temporal_reach = gaussian_reach(sigma_t, gaussian_threshold);
+        query_radius = std::isfinite(spatial_reach) ? spatial_reach * (1.0 + 1e-9) + 1.0 : 1e9;
+        time_radius = std::isfinite(temporal_reach) ? temporal_reach * (1.0 + 1e-6) + 1.0 : std::numeric_limits<double>::infinity();
+        cell_size = std::isfinite(spatial_reach) ? std::max(1.0, std::ceil(2.0 * query_radius)) : 1e9;
+        // Exponents clearly below (above) -log(gaussian_threshold) match (fail) without evaluating exp; the margin is far
+        // wider than the rounding of exp, so only pairs at the threshold itself are scored as gaussian_distance does
+        double limit = gaussian_threshold > 0.0 ? -std::log(gaussian_threshold) : std::numeric_limits<double>::infinity();
+        double margin = 1e-9 * std::max(1.0, std::fabs(limit));
+        accept_exponent = std::isfinite(limit) ? limit - margin : limit;
+        reject_exponent = std::isfinite(limit) ? limit + margin : limit;
+    }
+
+    // Time difference beyond which no pair of events can reach the threshold (infinite when every pair matches)
+    double time_reach() const {
+        return time_radius;
+    }
+
+    // Register an event of a particle and return the slot handle used to remove it later
+    int insert(int particle_id, int x, int y, float time) {
+        int slot;
+        if (!free_slots.empty()) {
+            slot = free_slots.back();
+            free_slots.pop_back();
+            alive[slot] = 1;
+        } else {
+            slot = static_cast<int>(alive.size());
+            alive.push_back(1);
+        }
+        add_entry(hashed ? cells[cell_key(cell_coord(x), cell_coord(y))] : groups, particle_id, Entry{slot, x, y, time});
+        live_count++;
+        return slot;
+    }
+
+    // File the groups in cells or in the single list, whichever suits num_particles live particles (the two thresholds
+    // apart, so that a count moving around one of them does not refile the events at every call)
+    void adapt(size_t num_particles) {
+        if (!hashed && num_particles > HASH_PARTICLES) {
+            build_cells();
+        } else if (hashed && num_particles <= LINEAR_PARTICLES) {
+            merge_cells();
+        }
+    }
+
+    // Mark a slot as removed. The slot is recycled once it has been compacted out of its group.
+    void remove(int slot) {
+        alive[slot] = 0;
+        live_count--;
+        dead_count++;
+        if (dead_count > 1024 && dead_count > live_count) {
+            compact_all();
+        }
+    }
+
+    // Collect into matches the distinct particles (resolved through the forest) that own a recent event whose Gaussian
+    // score against (x, y, time) reaches the threshold
+    void find_matches(int x, int y, float time, ParticleForest& forest, std::vector<int>& matches) {
+        matches.clear();
+        if (!hashed) {
+            scan_groups(groups, x, y, time, forest, matches);
+            return;
+        }
+        // Visit the event's own cell first: it is the most likely to hold a match, which lets the other cells skip
+        // every group of that particle
+        long long home_x = cell_coord(x), home_y = cell_coord(y);
+        scan_cell(home_x, home_y, x, y, time, forest, matches);
+        long long cx_min = cell_coord(x - query_radius), cx_max = cell_coord(x + query_radius);
+        long long cy_min = cell_coord(y - query_radius), cy_max = cell_coord(y + query_radius);
+        for (long long cx = cx_min; cx <= cx_max; ++cx) {
+            for (long long cy = cy_min; cy <= cy_max; ++cy) {
+                if (cx != home_x || cy != home_y) {
+                    scan_cell(cx, cy, x, y, time, forest, matches);
+                }
+            }
+        }
+    }
+
+private:
+    struct Entry {
+        int slot;
+        int x, y;
+        float time;
+    };
+
+    struct Group {
+        int particle_id;  // Particle the entries were filed under, relabelled to the surviving particle after merges
+        uint64_t resolved;  // ParticleForest generation at which particle_id was last resolved
+        int min_x, max_x, min_y, max_y;  // Bounding box of the entries (may be stale-large until the next full sweep)
+        std::vector<Entry> entries;
+    };
+
+    double sigma_x, sigma_t, gaussian_threshold;
+    double query_radius, time_radius, cell_size;
+    double accept_exponent, reject_exponent;  // Gaussian exponents below which a pair matches and above which it does not
+    bool hashed;  // Whether the groups are filed in cells rather than in the single list
+    std::vector<Group> groups;  // Every group, while the index is not hashed
+    std::unordered_map<long long, std::vector<Group>> cells;  // Groups by cell, while the index is hashed
+    std::vector<char> alive;
+    std::vector<int> free_slots;
+    size_t live_count, dead_count;
+
+    long long cell_coord(double v) const {
+        return static_cast<long long>(std::floor(v / cell_size));
+    }
+
+    static long long cell_key(long long cx, long long cy) {
+        return static_cast<long long>((static_cast<uint64_t>(cx) << 32) ^ (static_cast<uint64_t>(cy) & 0xffffffffULL));
+    }
+
+    // Append an entry to the group of particle_id in cell, creating the group if needed
+    void add_entry(std::vector<Group>& cell, int particle_id, const Entry& entry) {
+        Group* group = nullptr;
+        for (auto& candidate : cell) {
+            if (candidate.particle_id == particle_id) {
+                group = &candidate;
+                break;
+            }
+        }
+        if (group == nullptr) {
+            cell.push_back(Group{particle_id, 0, entry.x, entry.x, entry.y, entry.y, std::vector<Entry>()});
+            group = &cell.back();
+        }
+        group->min_x = std::min(group->min_x, entry.x);
+        group->max_x = std::max(group->max_x, entry.x);
+        group->min_y = std::min(group->min_y, entry.y);
+        group->max_y = std::max(group->max_y, entry.y);
+        group->entries.push_back(entry);
+    }
+
+    // File the live entries of the list into cells
+    void build_cells() {
+        for (const auto& group : groups) {
+            for (const auto& entry : group.entries) {
+                if (alive[entry.slot]) {
+                    add_entry(cells[cell_key(cell_coord(entry.x), cell_coord(entry.y))], group.particle_id, entry);
+                } else {
+                    free_slots.push_back(entry.slot);
+                    dead_count--;
+                }
+            }
+        }
+        groups.clear();
+        hashed = true;
+    }
+
+    // Gather the live entries of the cells back into the list, one group per particle ID
+    void merge_cells() {
+        for (const auto& cell : cells) {
+            for (const auto& group : cell.second) {
+                for (const auto& entry : group.entries) {
+                    if (alive[entry.slot]) {
+                        add_entry(groups, group.particle_id, entry);
+                    } else {
+                        free_slots.push_back(entry.slot);
+                        dead_count--;
+                    }
+                }
+            }
+        }
+        cells.clear();
+        hashed = false;
+    }
+
+    void scan_cell(long long cx, long long cy, int x, int y, float time, ParticleForest& forest, std::vector<int>& matches) {
+        auto it = cells.find(cell_key(cx, cy));
+        if (it != cells.end()) {
+            scan_groups(it->second, x, y, time, forest, matches);
+        }
+    }
+
+    // Add the particles of the groups that have a matching event and are not in matches yet
+    void scan_groups(std::vector<Group>& cell, int x, int y, float time, ParticleForest& forest, std::vector<int>& matches) {
+        for (size_t g = 0; g < cell.size(); ++g) {
+            Group& group = cell[g];
+            if (group.resolved != forest.generation()) {
+                group.particle_id = forest.find(group.particle_id);
+                group.resolved = forest.generation();
+            }
+            int particle_id = group.particle_id;
+            if (std::find(matches.begin(), matches.end(), particle_id) != matches.end()) {
+                continue;
+            }
+            if (group_matches(group, x, y, time)) {
+                matches.push_back(particle_id);
+            } else if (group.entries.empty()) {
+                // Every event of the group has been removed: drop the group
+                cell[g] = std::move(cell.back());
+                cell.pop_back();
+                --g;
+            }
+        }
+    }
+
+    // Whether any live event of the group reaches the threshold. Dead entries met on the way are compacted out;
+    // newest entries are checked first since they are the most likely to be close in time.
+    bool group_matches(Group& group, int x, int y, float time) {
+        // Reject groups whose bounding box is out of reach without visiting their entries
+        double dx = std::max(0, std::max(group.min_x - x, x - group.max_x));
+        double dy = std::max(0, std::max(group.min_y - y, y - group.max_y));
+        if (dx * dx + dy * dy > query_radius * query_radius) {
+            return false;
+        }
+        std::vector<Entry>& entries = group.entries;
+        size_t k = entries.size();
+        while (k > 0) {
+            --k;
+            const Entry& entry = entries[k];
+            if (!alive[entry.slot]) {
+                free_slots.push_back(entry.slot);
+                dead_count--;
+                entries[k] = entries.back();
+                entries.pop_back();
+                continue;
+            }
+            if (std::fabs(static_cast<double>(time) - entry.time) > time_radius) {
+                continue;
+            }
+            double exponent = gaussian_exponent(x, y, time, entry.x, entry.y, entry.time, sigma_x, sigma_t);
+            if (exponent < accept_exponent ||
+                (exponent <= reject_exponent && std::exp(-exponent) >= gaussian_threshold)) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    // Drop every dead slot, empty group and empty cell
+    void compact_all() {
+        if (!hashed) {
+            compact_groups(groups);
+        }
+        for (auto it = cells.begin(); it != cells.end();) {
+            compact_groups(it->second);
+            it = it->second.empty() ? cells.erase(it) : std::next(it);
+        }
+        dead_count = 0;
+    }
+
+    void compact_groups(std::vector<Group>& cell) {
+        for (auto& group : cell) {
+            size_t keep = 0;
+            group.min_x = group.min_y = std::numeric_limits<int>::max();
+            group.max_x = group.max_y = std::numeric_limits<int>::min();
+            for (size_t k = 0; k < group.entries.size(); ++k) {
+                if (alive[group.entries[k].slot]) {
+                    const Entry& entry = group.entries[k];
+                    group.min_x = std::min(group.min_x, entry.x);
+                    group.max_x = std::max(group.max_x, entry.x);
+                    group.min_y = std::min(group.min_y, entry.y);
+                    group.max_y = std::max(group.max_y, entry.y);
+                    group.entries[keep++] = entry;
+                } else {
+                    free_slots.push_back(group.entries[k].slot);
+                }
+            }
+            group.entries.resize(keep);
+        }
+        cell.erase(std::remove_if(cell.begin(), cell.end(),
+            [](const Group& group) { return group.entries.empty(); }), cell.end());
+    }
+};
+
+// Ring buffer of the recent events of a particle, stored as separate columns (struct of arrays) together with their
+// index slots. Running sums of x and y make the window centroid available in O(1) as events enter and leave.
+class RecentEvents {
+public:
+    RecentEvents() : head(0), count(0), sum_x(0), sum_y(0) {}
+
+    bool empty() const {
+        return count == 0;
+    }
+
+    size_t size() const {
+        return count;
+    }
+
+    void push_back(int x, int y, float time, int slot) {
+        if (count == xs.size()) {
+            grow();
+        }
+        size_t k = (head + count) & (xs.size() - 1);
+        xs[k] = x;
+        ys[k] = y;
+        times[k] = time;
+        slots[k] = slot;
+        count++;
+        sum_x += x;
+        sum_y += y;
+    }
+
+    // Remove the oldest entry and return its index slot
+    int pop_front() {
+        int slot = slots[head];
+        sum_x -= xs[head];
+        sum_y -= ys[head];
+        head = (head + 1) & (xs.size() - 1);
+        count--;
+        return slot;
+    }
+
+    float front_time() const {
+        return times[head];
+    }
+
+    int slot_at(size_t k) const {
+        return slots[(head + k) & (xs.size() - 1)];
+    }
+
+    // Sums of the positions of the events in the window (exact integers)
+    int64_t total_x() const {
+        return sum_x;
+    }
+
+    int64_t total_y() const {
+        return sum_y;
+    }
+
+    void clear() {
+        head = 0;
+        count = 0;
+        sum_x = 0;
+        sum_y = 0;
+    }
+
+private:
+    std::vector<int> xs, ys;
+    std::vector<float> times;
+    std::vector<int> slots;
+    size_t head, count;
+    int64_t sum_x, sum_y;
+
+    // Double the capacity (kept a power of two) and unwrap the entries to the front
+    void grow() {
+        size_t capacity = xs.empty() ? 8 : xs.size() * 2;
+        std::vector<int> new_xs(capacity), new_ys(capacity), new_slots(capacity);
+        std::vector<float> new_times(capacity);
+        for (size_t k = 0; k < count; ++k) {
+            size_t from = (head + k) & (xs.size() - 1);
+            new_xs[k] = xs[from];
+            new_ys[k] = ys[from];
+            new_times[k] = times[from];
+            new_slots[k] = slots[from];
+        }
+        xs.swap(new_xs);
+        ys.swap(new_ys);
+        times.swap(new_times);
+        slots.swap(new_slots);
+        head = 0;
+    }
+};
+
 // Class to track and manage particles
 class Particle {
 public:
+    typedef std::vector<std::tuple<int, int, float>> EventChunk;
+
     int particle_id; // Particle ID
-    std::deque<std::tuple<int, int, float>> events;  // List of events: (x, y, time)
-    std::deque<std::tuple<int, int, float>> recent_events;  // Recent events for centroid calculation
+    std::list<EventChunk> events;  // List of events: (x, y, time), in chunks so that merging splices lists instead of copying events
+    std::list<std::vector<int64_t>> event_ids;  // Input positions of the events, chunked like events (only when recorded)
+    RecentEvents recent_events;  // Recent events received by this particle, with their RecentEventIndex slots
+    std::vector<RecentEvents> absorbed_events;  // Recent events of absorbed particles, kept until they leave the centroid window
+    std::vector<int> absorbed_ids;  // IDs of the particles merged into this one (linked to it in the ParticleForest)
     double centroid_x, centroid_y; // Current centroid coordinates of the particle
     int mass; // Number of events belonging to the particle
+    float last_time; // Latest event time of the particle
+    float queued_time; // Key of the particle's entry in the tracker's expiry queue
+    int queued_state; // Queue holding that entry: 0 none, 1 light particles, 2 heavy particles
     std::deque<std::tuple<float, double, double>> centroid_history;  // History of centroids(time, centroid_x, centroid_y)
+    EventCounts event_counts;  // Histogram of the event times (only filled when the tracker counts events)
 
     // Constructor. Initializes a Particle. Called when creating a new particle and adds the initial event.
-    Particle(int id, int x, int y, float time) : particle_id(id), centroid_x(x), centroid_y(y), mass(1) {
-        events.push_back(std::make_tuple(x, y, time)); // Add the initial event
-        recent_events.push_back(std::make_tuple(x, y, time));  // Add to recent events
+    // event_id is the event's position in the input, recorded when it is not negative.
+    Particle(int id, int x, int y, float time, RecentEventIndex& index, int64_t event_id = -1) : particle_id(id), centroid_x(x), centroid_y(y), mass(1), last_time(time), queued_time(time), queued_state(0) {
+        events.push_back(EventChunk(1, std::make_tuple(x, y, time))); // Add the initial event
+        if (event_id >= 0) {
+            event_ids.push_back(std::vector<int64_t>(1, event_id));
+        }
+        push_recent(x, y, time, index);  // Add to recent events
         centroid_history.push_back(std::make_tuple(time, centroid_x, centroid_y)); // Add to centroid history
     }
 
-    // Function to merge another particle into this particle. Adds the events of the other particle and integrates mass.
-    void merge(const Particle& other) {
-        // Add all events from the other particle
-        for (const auto& event : other.events) {
-            events.push_back(event);
-            recent_events.push_back(event);  // Also add to recent_events
+    // Function to merge another particle into this particle at the given time. The event chunks of the other particle are
+    // spliced in (in front of ours when other_first is set) and its recent events join the centroid window; the centroid
+    // history of the particle that came first is kept.
+    void merge(Particle& other, float time, bool other_first) {
+        events.splice(other_first ? events.begin() : events.end(), other.events);
+        event_ids.splice(other_first ? event_ids.begin() : event_ids.end(), other.event_ids);
+        if (other_first) {
+            centroid_history.swap(other.centroid_history);
+        }
+        if (!other.recent_events.empty()) {
+            absorbed_events.push_back(std::move(other.recent_events));
         }
+        for (auto& window : other.absorbed_events) {
+            absorbed_events.push_back(std::move(window));
+        }
+        absorbed_ids.push_back(other.particle_id);
+        absorbed_ids.insert(absorbed_ids.end(), other.absorbed_ids.begin(), other.absorbed_ids.end());
+        other.recent_events.clear();
+        other.absorbed_events.clear();
+        event_counts.merge(other.event_counts);
 
         // Merge mass
         mass += other.mass;
+        last_time = std::max(last_time, other.last_time);
 
-        // Recalculate centroid (weighted average based on mass)
-        double total_mass = mass + other.mass;
-        centroid_x = (centroid_x * mass + other.centroid_x * other.mass) / total_mass;
-        centroid_y = (centroid_y * mass + other.centroid_y * other.mass) / total_mass;
-
-        // Update centroid history
-        if (!recent_events.empty()) {
-            float time = std::get<2>(recent_events.back());
-            centroid_history.push_back(std::make_tuple(time, centroid_x, centroid_y));
-        }
+        // Recalculate centroid over the combined window and update centroid history
+        update_centroid();
+        centroid_history.push_back(std::make_tuple(time, centroid_x, centroid_y));
     }
 
     // Function to add a new event to a particle. Also updates centroid and history.
-    void add_event(int x, int y, float time) {
-        events.push_back(std::make_tuple(x, y, time));
-        recent_events.push_back(std::make_tuple(x, y, time));  // Also add to recent_events
-        mass++; // Increase mass
-
-        // Remove old events (remove events older than 2000us)
-        float cutoff_time = time - 2000.0;
-        while (!recent_events.empty() && std::get<2>(recent_events.front()) < cutoff_time) {
-            recent_events.pop_front();
+    void add_event(int x, int y, float time, RecentEventIndex& index, double centroid_window, int64_t event_id = -1) {
+        events.back().push_back(std::make_tuple(x, y, time));
+        if (event_id >= 0) {
+            event_ids.back().push_back(event_id);
         }
+        push_recent(x, y, time, index);  // Also add to recent_events
+        mass++; // Increase mass
+        last_time = std::max(last_time, time);
 
-        // Recalculate centroid by averaging x and y of all events
-        if (!recent_events.empty()) {
-            double sum_x = 0, sum_y = 0;
-            for (const auto& event : recent_events) {
-                sum_x += std::get<0>(event);
-                sum_y += std::get<1>(event);
+        // Remove old events (remove events older than centroid_window, 2000us by default)
+        float cutoff_time = time - centroid_window;
+        drop_before(recent_events, cutoff_time, index);
+        for (size_t k = 0; k < absorbed_events.size();) {
+            drop_before(absorbed_events[k], cutoff_time, index);
+            if (absorbed_events[k].empty()) {
+                absorbed_events[k] = std::move(absorbed_events.back());
+                absorbed_events.pop_back();
+            } else {
+                ++k;
             }
-            centroid_x = sum_x / recent_events.size();
-            centroid_y = sum_y / recent_events.size();
         }
 
+        // Recalculate centroid by averaging x and y of all events (running sums over the window)
+        update_centroid();
+
         // Save the current centroid to history
         centroid_history.push_back(std::make_tuple(time, centroid_x, centroid_y));
     }
 
+    // Remove all recent events of this particle from the index (called when the particle is discarded)
+    void release(RecentEventIndex& index) {
+        release_window(recent_events, index);
+        for (auto& window : absorbed_events) {
+            release_window(window, index);
+        }
+        absorbed_events.clear();
+    }
+
+    // Number of particles joined in this one (used to keep the larger side when merging)
+    size_t fragment_count() const {
+        return absorbed_ids.size() + 1;
+    }
+
     // Function to check if a particle is active based on time and mass
-    bool is_active(float current_time, int m_threshold) const {
-        if (!events.empty() && std::get<2>(events.back()) < current_time - 2000.0) {
-            return mass > m_threshold;  // If no event exists within the last 2000us, return whether mass exceeds threshold
+    bool is_active(float current_time, int m_threshold, double activity_window) const {
+        if (last_time < current_time - activity_window) {
+            return mass > m_threshold;  // If no event exists within the last activity_window (2000us by default), return whether mass exceeds threshold
         }
-        return true;  // If there is an event within 2000us, always active
+        return true;  // If there is an event within activity_window, always active
     }
 
     // Final active check function based only on mass (used to remove small particles at the last time step)
@@ -99,115 +700,1353 @@ public:
         ParticleResult result;
         result.particle_id = particle_id;
         result.centroid_history = std::vector<std::tuple<float, double, double>>(centroid_history.begin(), centroid_history.end());
-        result.events = std::vector<std::tuple<int, int, float>>(events.begin(), events.end());
+        result.events.reserve(mass);
+        for (const auto& chunk : events) {
+            result.events.insert(result.events.end(), chunk.begin(), chunk.end());
+        }
         return result;
     }
+
+    // Function to append the events and centroid history of the Particle to a ColumnarResult
+    // (the offset columns must already hold their leading 0)
+    void append_to(ColumnarResult& result) const {
+        result.particle_id.push_back(particle_id);
+        for (const auto& chunk : events) {
+            for (const auto& event : chunk) {
+                result.event_x.push_back(std::get<0>(event));
+                result.event_y.push_back(std::get<1>(event));
+                result.event_t.push_back(std::get<2>(event));
+            }
+        }
+        result.event_offsets.push_back(static_cast<int64_t>(result.event_t.size()));
+        for (const auto& centroid : centroid_history) {
+            result.centroid_t.push_back(std::get<0>(centroid));
+            result.centroid_x.push_back(std::get<1>(centroid));
+            result.centroid_y.push_back(std::get<2>(centroid));
+        }
+        result.centroid_offsets.push_back(static_cast<int64_t>(result.centroid_t.size()));
+        if (result.count_bin_width > 0) {
+            event_counts.append_to(result);
+        }
+    }
+
+private:
+    void push_recent(int x, int y, float time, RecentEventIndex& index) {
+        recent_events.push_back(x, y, time, index.insert(particle_id, x, y, time));
+    }
+
+    // Centroid of every recent event, received or absorbed (left unchanged when the window is empty)
+    void update_centroid() {
+        int64_t sum_x = recent_events.total_x(), sum_y = recent_events.total_y();
+        size_t count = recent_events.size();
+        for (const auto& window : absorbed_events) {
+            sum_x += window.total_x();
+            sum_y += window.total_y();
+            count += window.size();
+        }
+        if (count > 0) {
+            centroid_x = static_cast<double>(sum_x) / count;
+            centroid_y = static_cast<double>(sum_y) / count;
+        }
+    }
+
+    static void drop_before(RecentEvents& window, float cutoff_time, RecentEventIndex& index) {
+        while (!window.empty() && window.front_time() < cutoff_time) {
+            index.remove(window.pop_front());
+        }
+    }
+
+    static void release_window(RecentEvents& window, RecentEventIndex& index) {
+        for (size_t k = 0; k < window.size(); ++k) {
+            index.remove(window.slot_at(k));
+        }
+        window.clear();
+    }
 };
 
-// Gaussian distance calculation. Computes spatial (x, y) and temporal (t) distance between two events and returns a score based on a Gaussian distribution.
-// sigma_x is the spatial standard deviation of the Gaussian distribution, and sigma_t is the temporal standard deviation.
-double gaussian_distance(int x1, int y1, float t1, int x2, int y2, float t2, double sigma_x, double sigma_t) {
-    double spatial_distance_sq = (x1 - x2) * (x1 - x2) + (y1 - y2) * (y1 - y2);  // // Spatial distance squared
-    double time_distance_sq = (t1 - t2) * (t1 - t2);  // Temporal distance squared
-    return std::exp(-spatial_distance_sq / (2 * sigma_x * sigma_x) - time_distance_sq / (2 * sigma_t * sigma_t));  // Score based on Gaussian distribution. Closer to 1 means events are closer in space-time.
-}
+// Stateful event-based particle tracker. Events are fed in time order (in one go or in chunks); particles that can no
+// longer receive events are retired and can be collected before the end of the recording, so memory stays bounded by the
+// live particles instead of the whole recording.
+//
+// Live particles leave the active set through two time-ordered expiry queues instead of a scan after every event:
+//  - particles at or below the mass threshold are discarded once their newest event is older than activity_window,
+//  - heavier particles are retired once their latest event is beyond the temporal reach of the Gaussian threshold.
+// Each particle keeps one queued entry whose key never exceeds its current key. When the entry reaches the top, the
+// particle either expires or is re-queued under its (later) current key, so most events do not touch the queues at all.
+//
+// An event that overlaps several particles merges all of them. Merging splices event chunk lists and links IDs in a
+// ParticleForest instead of copying events or re-filing them in the index, so it costs O(fragments) rather than O(events).
+class ParticleTracker {
+public:
+    ParticleTracker(double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold,
+        double centroid_window = 2000.0, double activity_window = 2000.0, bool retire_particles = true)
+        : sigma_x(sigma_x), sigma_t(sigma_t), gaussian_threshold(gaussian_threshold), m_threshold(m_threshold), final_m_threshold(m_threshold),
+          centroid_window(centroid_window), activity_window(activity_window), retire_particles(retire_particles),
+          count_bin_width(0.0), particle_id_counter(0), latest_time(-std::numeric_limits<float>::infinity()),
+          index(sigma_x, sigma_t, gaussian_threshold) {}
+
+    // Raise if the chunk would move time backwards (retirement assumes no earlier event can arrive later)
+    void check_time_order(const float* times, size_t num_events) {
+        float previous_time = latest_time;
+        for (size_t n = 0; n < num_events; ++n) {
+            if (times[n] < previous_time) {
+                throw std::invalid_argument("events must be fed in time order");
+            }
+            previous_time = times[n];
+        }
+        if (num_events > 0) {
+            latest_time = previous_time;
+        }
+    }
+
+    // Track a single event (event_id, when not negative, is recorded in the particle's event_ids)
+    void process_event(int x, int y, float time, int64_t event_id = -1) {
+        // Find every particle with a recent event close enough to the new event
+        index.adapt(particles.size());
+        index.find_matches(x, y, time, forest, match_ids);
+
+        // If no overlap with any particle, create a new particle
+        if (match_ids.empty()) {
+            particle_id_counter++; // Add 1 to particle ID
+            auto inserted = particles.emplace_hint(particles.end(), particle_id_counter, Particle(particle_id_counter, x, y, time, index, event_id));
+            if (count_bin_width > 0) {
+                inserted->second.event_counts.add(time, count_bin_width);
+            }
+            schedule(inserted->second);
+        // If overlap exists, add the event to the overlapping particle with the smallest ID
+        } else {
+            std::sort(match_ids.begin(), match_ids.end());
+            auto overlapping = particles.find(match_ids[0]);
+            overlapping->second.add_event(x, y, time, index, centroid_window, event_id);
+            if (count_bin_width > 0) {
+                overlapping->second.event_counts.add(time, count_bin_width);
+            }
+
+            // If the same event overlaps with multiple particles, the event joins them: merge all of them
+            for (size_t k = 1; k < match_ids.size(); ++k) {
+                overlapping = merge(overlapping, particles.find(match_ids[k]), time);
+            }
+            schedule(overlapping->second);
+        }
+
+        expire(time);
+    }
+
+    // Return the particles retired since the last call, in ID order
+    std::vector<Particle> pop_retired() {
+        std::vector<Particle> out;
+        out.swap(retired);
+        std::sort(out.begin(), out.end(),
+            [](const Particle& a, const Particle& b) { return a.particle_id < b.particle_id; });
+        return out;
+    }
+
+    // At final time step, remove particles whose mass is below threshold and return every particle not yet popped
+    std::vector<Particle> finalize() {
+        for (auto& entry : particles) {
+            release(entry.second);
+            if (entry.second.is_active_final(final_m_threshold)) {
+                retired.push_back(std::move(entry.second));
+            }
+        }
+        particles.clear();
+        light_queue = ExpiryQueue();
+        heavy_queue = ExpiryQueue();
+        return pop_retired();
+    }
+
+    size_t num_active() const {
+        return particles.size();
+    }
+
+    // Keep every particle on retirement and at the end, whatever its mass (the caller applies the mass filter, e.g. after
+    // stitching tiles). Light particles are still dropped after activity_window without events unless keep_light accepts them.
+    void keep_all_particles() {
+        final_m_threshold = -1;
+    }
+
+    // Retire the light particles accepted by keep instead of discarding them once they have been inactive for activity_window.
+    // They leave the index all the same, so later events cannot join them (tiles keep the pieces a neighbouring tile may
+    // complete, see track_tile).
+    void keep_light_particles(std::function<bool(const Particle&)> keep) {
+        keep_light = std::move(keep);
+    }
+
+    // Count the events of every particle in bins of bin_width (0 stops counting). Call before feeding events.
+    void count_events(double bin_width) {
+        check_count_bin_width(bin_width);
+        count_bin_width = bin_width;
+    }
+
+    double event_count_bin_width() const {
+        return count_bin_width;
+    }
+
+private:
+    struct Expiry {
+        float time;
+        int particle_id;
+        bool operator>(const Expiry& other) const {
+            return time > other.time;
+        }
+    };
+    typedef std::priority_queue<Expiry, std::vector<Expiry>, std::greater<Expiry>> ExpiryQueue;
+
+    double sigma_x, sigma_t, gaussian_threshold;
+    int m_threshold;
+    int final_m_threshold;  // Mass a particle must exceed to be returned (m_threshold unless keep_all_particles was called)
+    double centroid_window, activity_window;
+    bool retire_particles;
+    double count_bin_width;  // Bin width of the particles' event counts (0 when they are not counted)
+    int particle_id_counter;
+    float latest_time;  // Time of the newest event fed so far (streaming only)
+    RecentEventIndex index;  // Spatial index of the recent events of all particles, used to find overlap candidates
+    ParticleForest forest;  // Resolves the IDs of absorbed particles (still filed in the index) to live particles
+    std::map<int, Particle> particles;  // Live particles by ID
+    std::vector<Particle> retired;  // Retired particles not yet popped
+    std::vector<int> match_ids;  // Particles matched by the current event
+    std::function<bool(const Particle&)> keep_light;  // Light particles retired rather than discarded (none when empty)
+    ExpiryQueue light_queue;  // Keyed on the latest event time of particles at or below the mass threshold
+    ExpiryQueue heavy_queue;  // Keyed on the latest event time of particles above the mass threshold
+
+    // Queue state and key a particle should currently have
+    int queue_state(const Particle& particle) const {
+        return particle.mass > m_threshold ? 2 : 1;
+    }
+
+    float queue_key(const Particle& particle) const {
+        return particle.last_time;
+    }
+
+    // Merge two live particles and return the survivor. The side joining more fragments survives (union by size), so
+    // an event is re-linked O(log n) times at most; the events of the first particle still come first.
+    std::map<int, Particle>::iterator merge(std::map<int, Particle>::iterator first, std::map<int, Particle>::iterator second, float time) {
+        if (second->second.fragment_count() > first->second.fragment_count()) {
+            std::swap(first, second);
+            first->second.merge(second->second, time, true);
+        } else {
+            first->second.merge(second->second, time, false);
+        }
+        forest.link(second->first, first->first);
+        particles.erase(second);
+        return first;
+    }
+
+    // Remove a particle's recent events from the index and forget the IDs it absorbed
+    void release(Particle& particle) {
+        particle.release(index);
+        for (int absorbed_id : particle.absorbed_ids) {
+            forest.forget(absorbed_id);
+        }
+    }
+
+    // Push a new entry when the particle changed queue or its key dropped below the queued one
+    void schedule(Particle& particle) {
+        int state = queue_state(particle);
+        float key = queue_key(particle);
+        if (state == particle.queued_state && !(key < particle.queued_time)) {
+            return;
+        }
+        particle.queued_state = state;
+        particle.queued_time = key;
+        if (state == 1) {
+            light_queue.push(Expiry{key, particle.particle_id});
+        } else if (retire_particles) {
+            heavy_queue.push(Expiry{key, particle.particle_id});
+        }
+    }
+
+    // Pop the entries of a queue that are due before cutoff. Returns the particle to expire, or particles.end() when the
+    // queue has nothing due left. Outdated entries are dropped and particles with a newer key are re-queued.
+    std::map<int, Particle>::iterator pop_due(ExpiryQueue& queue, int state, double cutoff) {
+        while (!queue.empty() && queue.top().time < cutoff) {
+            Expiry entry = queue.top();
+            queue.pop();
+            auto it = particles.find(entry.particle_id);
+            if (it == particles.end() || it->second.queued_state != state || it->second.queued_time != entry.time) {
+                continue;
+            }
+            float key = queue_key(it->second);
+            if (key < cutoff) {
+                return it;
+            }
+            it->second.queued_time = key;
+            queue.push(Expiry{key, entry.particle_id});
+        }
+        return particles.end();
+    }
+
+    // Drop light particles that have been inactive for activity_window and retire heavy particles out of reach at the given time
+    void expire(float time) {
+        double light_cutoff = time - activity_window;
+        for (auto it = pop_due(light_queue, 1, light_cutoff); it != particles.end(); it = pop_due(light_queue, 1, light_cutoff)) {
+            release(it->second);
+            if (keep_light && keep_light(it->second)) {
+                retired.push_back(std::move(it->second));
+            }
+            particles.erase(it);
+        }
+
+        double heavy_cutoff = time - index.time_reach();
+        for (auto it = pop_due(heavy_queue, 2, heavy_cutoff); it != particles.end(); it = pop_due(heavy_queue, 2, heavy_cutoff)) {
+            release(it->second);
+            if (it->second.is_active_final(final_m_threshold)) {
+                retired.push_back(std::move(it->second));
+            }
+            particles.erase(it);
+        }
+    }
+};
 
 // Event-based particle tracking algorithm. Takes in event data, tracks particles, and returns a final list of particles.
-std::vector<ParticleResult> track_particles_cpp(const std::vector<std::tuple<int, int, float>>& data, double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold) {
-    // Create empty particle vector
-    std::vector<Particle> particles;
-    int particle_id_counter = 0; // Reset particle ID counter
+// event_at(i, x, y, time) retrieves the i-th of num_events events, so the same loop serves both the tuple and NumPy inputs.
+template <typename EventAt>
+std::vector<Particle> track_events(size_t num_events, EventAt event_at, double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold,
+    double centroid_window, double activity_window, double count_bin_width = 0.0) {
+    // Retiring particles relies on time-ordered events; unordered input keeps every heavy particle live until the end
+    bool time_ordered = true;
+    float previous_time = -std::numeric_limits<float>::infinity();
+    for (size_t n = 0; n < num_events && time_ordered; ++n) {
+        int x, y;
+        float time;
+        event_at(n, x, y, time);
+        time_ordered = !(time < previous_time);
+        previous_time = time;
+    }
+    ParticleTracker tracker(sigma_x, sigma_t, gaussian_threshold, m_threshold, centroid_window, activity_window, time_ordered);
+    tracker.count_events(count_bin_width);
 
     // Perform particle tracking for each event in the data
-    for (const auto& event : data) {
+    for (size_t n = 0; n < num_events; ++n) {
         // Retrieve x, y, time from the event
-        int x = std::get<0>(event);
-        int y = std::get<1>(event);
-        float time = std::get<2>(event);
-
-        // Check whether the new event should be added to an existing particle
-        bool found_overlap = false;
-        size_t overlapping_particle_index = std::numeric_limits<size_t>::max(); //If overlap with existing particle found, store the index
-
-        // For each particle (and its events), calculate distance from the new event to check for overlap
-        for (size_t i = 0; i < particles.size(); ++i) {
-            Particle& particle = particles[i];
-
-            // Loop over recent events of the particle and calculate distance to new event
-            for (const auto& recent_event : particle.recent_events) {
-                // Calculate distance based on Gaussian distribution
-                double gaussian_score = gaussian_distance(x, y, time, std::get<0>(recent_event), std::get<1>(recent_event), std::get<2>(recent_event), sigma_x, sigma_t);
-
-                // If score exceeds threshold, add event index
-                if (gaussian_score >= gaussian_threshold) {
-                    particle.add_event(x, y, time);
-                    found_overlap = true;
-                    overlapping_particle_index = i;
+        int x, y;
+        float time;
+        event_at(n, x, y, time);
+        tracker.process_event(x, y, time);
+    }
+
+    return tracker.finalize();
+}
+
+// Convert the surviving particles into ParticleResult objects
+std::vector<ParticleResult> to_particle_results(const std::vector<Particle>& particles) {
+    std::vector<ParticleResult> results;
+    for (const auto& particle : particles) {
+        results.push_back(particle.get_result());
+    }
+    return results;
+}
+
+// Hand a vector over to NumPy without copying. The vector is moved to the heap and freed by the array's capsule.
+template <typename T>
+pybind11::array_t<T> vector_to_numpy(std::vector<T>&& values) {
+    std::vector<T>* owned = new std::vector<T>(std::move(values));
+    pybind11::capsule owner(owned, [](void* p) { delete reinterpret_cast<std::vector<T>*>(p); });
+    return pybind11::array_t<T>(owned->size(), owned->data(), owner);
+}
+
+// Hand a ColumnarResult over to NumPy as a dict of columns
+pybind11::dict columnar_to_dict(ColumnarResult&& result) {
+    pybind11::dict columns;
+    columns["particle_id"] = vector_to_numpy(std::move(result.particle_id));
+    columns["event_offsets"] = vector_to_numpy(std::move(result.event_offsets));
+    columns["x"] = vector_to_numpy(std::move(result.event_x));
+    columns["y"] = vector_to_numpy(std::move(result.event_y));
+    columns["t"] = vector_to_numpy(std::move(result.event_t));
+    columns["centroid_offsets"] = vector_to_numpy(std::move(result.centroid_offsets));
+    columns["centroid_t"] = vector_to_numpy(std::move(result.centroid_t));
+    columns["centroid_x"] = vector_to_numpy(std::move(result.centroid_x));
+    columns["centroid_y"] = vector_to_numpy(std::move(result.centroid_y));
+    if (result.count_bin_width > 0) {
+        columns["count_offsets"] = vector_to_numpy(std::move(result.count_offsets));
+        columns["count_start"] = vector_to_numpy(std::move(result.count_start));
+        columns["counts"] = vector_to_numpy(std::move(result.counts));
+    }
+    return columns;
+}
+
+// Convert the surviving particles into a dict of NumPy columns (see ColumnarResult), with their event counts when
+// count_bin_width > 0
+pybind11::dict to_columnar_dict(const std::vector<Particle>& particles, double count_bin_width = 0.0) {
+    ColumnarResult result(count_bin_width);
+    for (const auto& particle : particles) {
+        particle.append_to(result);
+    }
+    return columnar_to_dict(std::move(result));
+}
+
+// Track particles from a list of (x, y, time) tuples
+std::vector<ParticleResult> track_particles_cpp(const std::vector<std::tuple<int, int, float>>& data, double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold,
+    double centroid_window, double activity_window) {
+    return to_particle_results(track_events(data.size(), [&data](size_t n, int& x, int& y, float& time) {
+        x = std::get<0>(data[n]);
+        y = std::get<1>(data[n]);
+        time = std::get<2>(data[n]);
+    }, sigma_x, sigma_t, gaussian_threshold, m_threshold, centroid_window, activity_window));
+}
+
+// Event columns accepted from NumPy. Contiguous int32 / float32 arrays are read in place; other dtypes are converted once
+// by pybind11 instead of going through Python tuples.
+typedef pybind11::array_t<int32_t, pybind11::array::c_style | pybind11::array::forcecast> CoordinateArray;
+typedef pybind11::array_t<float, pybind11::array::c_style | pybind11::array::forcecast> TimeArray;
+
+// Check that x, y and t are one-dimensional arrays of the same length and return that length
+size_t check_event_arrays(const CoordinateArray& x, const CoordinateArray& y, const TimeArray& t) {
+    if (x.ndim() != 1 || y.ndim() != 1 || t.ndim() != 1) {
+        throw std::invalid_argument("x, y and t must be one-dimensional arrays");
+    }
+    if (x.shape(0) != y.shape(0) || x.shape(0) != t.shape(0)) {
+        throw std::invalid_argument("x, y and t must have the same length");
+    }
+    return static_cast<size_t>(x.shape(0));
+}
+
+// Track particles from x, y and time NumPy arrays.
+// Returns the columnar result as a dict of NumPy arrays (see ColumnarResult).
+pybind11::dict track_particles_np(CoordinateArray x, CoordinateArray y, TimeArray t,
+    double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold, double centroid_window, double activity_window,
+    double count_bin_width) {
+    size_t num_events = check_event_arrays(x, y, t);
+    const int32_t* x_data = x.data();
+    const int32_t* y_data = y.data();
+    const float* t_data = t.data();
+    std::vector<Particle> particles;
+    {
+        // The arrays stay referenced by the arguments, so other Python threads may run while tracking
+        pybind11::gil_scoped_release release;
+        particles = track_events(num_events, [x_data, y_data, t_data](size_t n, int& event_x, int& event_y, float& event_time) {
+            event_x = x_data[n];
+            event_y = y_data[n];
+            event_time = t_data[n];
+        }, sigma_x, sigma_t, gaussian_threshold, m_threshold, centroid_window, activity_window, count_bin_width);
+    }
+    return to_columnar_dict(particles, count_bin_width);
+}
+
+// Grid of tiles over the bounding box of a recording. Each tile is widened by margin on its inner sides, so an event
+// near a seam belongs to every tile whose widened extent holds it.
+struct TileGrid {
+    int tiles_x, tiles_y;
+    double min_x, min_y, tile_width, tile_height, margin;
+
+    int num_tiles() const {
+        return tiles_x * tiles_y;
+    }
+
+    bool holds(int tile, int x, int y) const {
+        int column = tile % tiles_x, row = tile / tiles_x;
+        return spans(x, min_x, tile_width, column, tiles_x) && spans(y, min_y, tile_height, row, tiles_y);
+    }
+
+    // Whether an event of the tile is also held by a neighbouring tile (it lies in the overlap along one of the seams)
+    bool on_seam(int tile, int x, int y) const {
+        int column = tile % tiles_x, row = tile / tiles_x;
+        return near_seam(x, min_x, tile_width, column, tiles_x) || near_seam(y, min_y, tile_height, row, tiles_y);
+    }
+
+private:
+    bool spans(double v, double origin, double size, int k, int count) const {
+        return (k == 0 || v >= origin + k * size - margin) && (k == count - 1 || v < origin + (k + 1) * size + margin);
+    }
+
+    bool near_seam(double v, double origin, double size, int k, int count) const {
+        return (k > 0 && v < origin + k * size + margin) || (k < count - 1 && v >= origin + (k + 1) * size - margin);
+    }
+};
+
+// Track the events of one tile, recording their input positions. The mass threshold only applies once the pieces of all
+// tiles have been stitched, so every piece is kept whatever its mass, including the light pieces that expire with an event
+// on a seam: their particle may be heavy once its pieces in the neighbouring tiles are joined. Light pieces that expire
+// away from the seams are whole particles and are dropped as the single tracker drops them.
+std::vector<Particle> track_tile(const TileGrid& grid, int tile, size_t num_events, const int32_t* x, const int32_t* y, const float* t,
+    double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold, double centroid_window, double activity_window, bool time_ordered,
+    double count_bin_width) {
+    ParticleTracker tracker(sigma_x, sigma_t, gaussian_threshold, m_threshold, centroid_window, activity_window, time_ordered);
+    tracker.keep_all_particles();
+    tracker.keep_light_particles([&grid, tile](const Particle& piece) {
+        for (const auto& chunk : piece.events) {
+            for (const auto& event : chunk) {
+                if (grid.on_seam(tile, std::get<0>(event), std::get<1>(event))) {
+                    return true;
+                }
+            }
+        }
+        return false;
+    });
+    tracker.count_events(count_bin_width);
+    for (size_t n = 0; n < num_events; ++n) {
+        if (grid.holds(tile, x[n], y[n])) {
+            tracker.process_event(x[n], y[n], t[n], static_cast<int64_t>(n));
+        }
+    }
+    return tracker.finalize();
+}
+
+// Append a stitched particle made of the given input events (in input order) to result. Its centroid history is
+// recomputed over the centroid window, as the tracker does for a particle that grows one event at a time, and so are its
+// event counts.
+void append_stitched(int particle_id, const std::vector<int64_t>& event_ids, const int32_t* x, const int32_t* y, const float* t,
+    double centroid_window, ColumnarResult& result) {
+    result.particle_id.push_back(particle_id);
+    size_t window_start = 0;
+    int64_t sum_x = 0, sum_y = 0;
+    for (size_t k = 0; k < event_ids.size(); ++k) {
+        int64_t n = event_ids[k];
+        result.event_x.push_back(x[n]);
+        result.event_y.push_back(y[n]);
+        result.event_t.push_back(t[n]);
+        sum_x += x[n];
+        sum_y += y[n];
+        float cutoff_time = t[n] - centroid_window;
+        while (t[event_ids[window_start]] < cutoff_time) {
+            sum_x -= x[event_ids[window_start]];
+            sum_y -= y[event_ids[window_start]];
+            window_start++;
+        }
+        double count = static_cast<double>(k + 1 - window_start);
+        result.centroid_t.push_back(t[n]);
+        result.centroid_x.push_back(sum_x / count);
+        result.centroid_y.push_back(sum_y / count);
+    }
+    result.event_offsets.push_back(static_cast<int64_t>(result.event_t.size()));
+    result.centroid_offsets.push_back(static_cast<int64_t>(result.centroid_t.size()));
+    result.append_counts(event_ids.size(), [&event_ids, t](size_t k) { return t[event_ids[k]]; });
+}
+
+// Stitch the pieces tracked in every tile and append the particles heavier than m_threshold to result, numbered in the
+// order of their first event. Pieces sharing an input event belong to the same particle (union-find over pieces). A
+// piece that shares nothing is kept as tracked; stitched particles hold each shared event once.
+void stitch_tiles(std::vector<std::vector<Particle>>& tiles, size_t num_events, const int32_t* x, const int32_t* y, const float* t,
+    int m_threshold, double centroid_window, ColumnarResult& result) {
+    std::vector<Particle*> pieces;
+    for (auto& tile : tiles) {
+        for (auto& piece : tile) {
+            pieces.push_back(&piece);
+        }
+    }
+    std::vector<int> parent(pieces.size());
+    for (size_t k = 0; k < pieces.size(); ++k) {
+        parent[k] = static_cast<int>(k);
+    }
+    auto find = [&parent](int k) {
+        while (parent[k] != k) {
+            parent[k] = parent[parent[k]];
+            k = parent[k];
+        }
+        return k;
+    };
+    std::vector<int> piece_of_event(num_events, -1);
+    std::vector<int64_t> first_event(pieces.size(), std::numeric_limits<int64_t>::max());
+    for (size_t k = 0; k < pieces.size(); ++k) {
+        for (const auto& chunk : pieces[k]->event_ids) {
+            for (int64_t n : chunk) {
+                first_event[k] = std::min(first_event[k], n);
+                int other = piece_of_event[n];
+                if (other < 0) {
+                    piece_of_event[n] = static_cast<int>(k);
+                    continue;
+                }
+                int a = find(static_cast<int>(k)), b = find(other);
+                if (a != b) {
+                    parent[std::max(a, b)] = std::min(a, b);
+                }
+            }
+        }
+    }
+
+    // Gather the pieces of each particle and order the particles by their first event
+    std::vector<std::vector<int>> members(pieces.size());
+    for (size_t k = 0; k < pieces.size(); ++k) {
+        int root = find(static_cast<int>(k));
+        members[root].push_back(static_cast<int>(k));
+        first_event[root] = std::min(first_event[root], first_event[k]);
+    }
+    std::vector<int> roots;
+    for (size_t k = 0; k < pieces.size(); ++k) {
+        if (!members[k].empty()) {
+            roots.push_back(static_cast<int>(k));
+        }
+    }
+    std::sort(roots.begin(), roots.end(), [&first_event](int a, int b) { return first_event[a] < first_event[b]; });
+
+    int particle_id = 0;
+    for (int root : roots) {
+        if (members[root].size() == 1) {
+            Particle& piece = *pieces[root];
+            if (piece.is_active_final(m_threshold)) {
+                piece.particle_id = ++particle_id;
+                piece.append_to(result);
+            }
+            continue;
+        }
+        std::vector<int64_t> event_ids;
+        for (int k : members[root]) {
+            for (const auto& chunk : pieces[k]->event_ids) {
+                event_ids.insert(event_ids.end(), chunk.begin(), chunk.end());
+            }
+        }
+        std::sort(event_ids.begin(), event_ids.end());
+        event_ids.erase(std::unique(event_ids.begin(), event_ids.end()), event_ids.end());
+        if (static_cast<int64_t>(event_ids.size()) > m_threshold) {
+            append_stitched(++particle_id, event_ids, x, y, t, centroid_window, result);
+        }
+    }
+}
+
+// Track particles from x, y and time NumPy arrays, cutting the sensor into tiles_x x tiles_y tiles tracked in parallel on
+// num_threads threads (0 uses every core). Tiles are widened by the spatial reach of the Gaussian threshold, so a particle
+// crossing a seam is seen on both sides; its pieces share the events near the seam and are stitched back together.
+// Particles are numbered in order of their first event. Returns the columnar result as a dict of NumPy arrays.
+pybind11::dict track_particles_tiled(CoordinateArray x, CoordinateArray y, TimeArray t,
+    double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold, double centroid_window, double activity_window,
+    int tiles_x, int tiles_y, int num_threads, double count_bin_width) {
+    size_t num_events = check_event_arrays(x, y, t);
+    if (tiles_x < 1 || tiles_y < 1) {
+        throw std::invalid_argument("tiles_x and tiles_y must be at least 1");
+    }
+    const int32_t* x_data = x.data();
+    const int32_t* y_data = y.data();
+    const float* t_data = t.data();
+    check_count_bin_width(count_bin_width);
+    ColumnarResult result(count_bin_width);
+    if (num_events == 0) {
+        return columnar_to_dict(std::move(result));
+    }
+    {
+        pybind11::gil_scoped_release release;
+
+        bool time_ordered = true;
+        int32_t min_x = x_data[0], max_x = x_data[0], min_y = y_data[0], max_y = y_data[0];
+        for (size_t n = 1; n < num_events; ++n) {
+            time_ordered = time_ordered && !(t_data[n] < t_data[n - 1]);
+            min_x = std::min(min_x, x_data[n]);
+            max_x = std::max(max_x, x_data[n]);
+            min_y = std::min(min_y, y_data[n]);
+            max_y = std::max(max_y, y_data[n]);
+        }
+        double spatial_reach = gaussian_reach(sigma_x, gaussian_threshold);
+        if (!std::isfinite(spatial_reach)) {
+            tiles_x = tiles_y = 1;  // Every pair of events matches: there is nothing to split
+        }
+        TileGrid grid;
+        grid.tiles_x = tiles_x;
+        grid.tiles_y = tiles_y;
+        grid.min_x = min_x;
+        grid.min_y = min_y;
+        grid.tile_width = (max_x - min_x + 1.0) / tiles_x;
+        grid.tile_height = (max_y - min_y + 1.0) / tiles_y;
+        grid.margin = std::isfinite(spatial_reach) ? spatial_reach * (1.0 + 1e-9) + 1.0 : 0.0;
+
+        int num_tiles = grid.num_tiles();
+        std::vector<std::vector<Particle>> tiles(num_tiles);
+        std::vector<std::exception_ptr> errors(num_tiles);
+        std::atomic<int> next_tile(0);
+        auto worker = [&]() {
+            for (int tile = next_tile++; tile < num_tiles; tile = next_tile++) {
+                try {
+                    tiles[tile] = track_tile(grid, tile, num_events, x_data, y_data, t_data, sigma_x, sigma_t, gaussian_threshold,
+                        m_threshold, centroid_window, activity_window, time_ordered, count_bin_width);
+                } catch (...) {
+                    errors[tile] = std::current_exception();
+                }
+            }
+        };
+        if (num_threads <= 0) {
+            num_threads = std::max(1u, std::thread::hardware_concurrency());
+        }
+        std::vector<std::thread> threads;
+        for (int k = 1; k < std::min(num_threads, num_tiles); ++k) {
+            threads.emplace_back(worker);
+        }
+        worker();
+        for (auto& thread : threads) {
+            thread.join();
+        }
+        for (const auto& error : errors) {
+            if (error) {
+                std::rethrow_exception(error);
+            }
+        }
+
+        stitch_tiles(tiles, num_events, x_data, y_data, t_data, m_threshold, centroid_window, result);
+    }
+    return columnar_to_dict(std::move(result));
+}
+
+// Feed a time-ordered chunk of events to a ParticleTracker
+void feed_tracker(ParticleTracker& tracker, CoordinateArray x, CoordinateArray y, TimeArray t) {
+    size_t num_events = check_event_arrays(x, y, t);
+    const int32_t* x_data = x.data();
+    const int32_t* y_data = y.data();
+    const float* t_data = t.data();
+    pybind11::gil_scoped_release release;
+    tracker.check_time_order(t_data, num_events);
+    for (size_t n = 0; n < num_events; ++n) {
+        tracker.process_event(x_data[n], y_data[n], t_data[n]);
+    }
+}
+
+// Error opening or reading an event file, raised in Python as OSError (FileNotFoundError when the file is missing)
+struct EventFileError : std::runtime_error {
+    int error_number;
+    std::string path;
+    EventFileError(int error_number, const std::string& path)
+        : std::runtime_error(path), error_number(error_number), path(path) {}
+};
+
+// Events read from a file, as typed columns
+struct EventBlock {
+    std::vector<int32_t> x, y;
+    std::vector<int8_t> polarity;
+    std::vector<float> t;
+
+    size_t size() const {
+        return t.size();
+    }
+
+    void clear() {
+        x.clear();
+        y.clear();
+        polarity.clear();
+        t.clear();
+    }
+
+    void push_back(int32_t event_x, int32_t event_y, int8_t event_polarity, float event_time) {
+        x.push_back(event_x);
+        y.push_back(event_y);
+        polarity.push_back(event_polarity);
+        t.push_back(event_time);
+    }
+};
+
+// Number of events parsed and tracked at a time when feeding a file
+const size_t file_block_events = 1 << 16;
+
+// Parse a decimal integer spanning exactly [begin, end) (surrounding blanks allowed)
+bool parse_integer(const char* begin, const char* end, long long min_value, long long max_value, long long& value) {
+    while (begin < end && (*begin == ' ' || *begin == '\t')) ++begin;
+    while (end > begin && (end[-1] == ' ' || end[-1] == '\t')) --end;
+    bool negative = begin < end && *begin == '-';
+    if (begin < end && (*begin == '-' || *begin == '+')) ++begin;
+    if (begin == end || end - begin > 18) {
+        return false;
+    }
+    long long magnitude = 0;
+    for (const char* p = begin; p < end; ++p) {
+        if (*p < '0' || *p > '9') {
+            return false;
+        }
+        magnitude = magnitude * 10 + (*p - '0');
+    }
+    value = negative ? -magnitude : magnitude;
+    return value >= min_value && value <= max_value;
+}
+
+// Parse a decimal number spanning exactly [begin, end). Plain decimals of up to 15 digits (the usual timestamps) take a
+// fast path: the digits and the power of ten are both exact doubles, so one division is correctly rounded. Anything else
+// goes through strtod, so the value is rounded like any other CSV parser would.
+bool parse_real(const char* begin, const char* end, double& value) {
+    static const double powers_of_ten[] = {1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11, 1e12, 1e13, 1e14, 1e15};
+    const char* p = begin;
+    while (p < end && (*p == ' ' || *p == '\t')) ++p;
+    const char* last = end;
+    while (last > p && (last[-1] == ' ' || last[-1] == '\t')) --last;
+    bool negative = p < last && *p == '-';
+    if (p < last && (*p == '-' || *p == '+')) ++p;
+    long long mantissa = 0;
+    int num_digits = 0, num_decimals = 0;
+    bool seen_point = false, plain = p < last;
+    for (; p < last && plain; ++p) {
+        if (*p >= '0' && *p <= '9') {
+            mantissa = mantissa * 10 + (*p - '0');
+            num_digits++;
+            num_decimals += seen_point ? 1 : 0;
+        } else if (*p == '.' && !seen_point) {
+            seen_point = true;
+        } else {
+            plain = false;
+        }
+    }
+    if (plain && num_digits > 0 && num_digits <= 15) {
+        value = static_cast<double>(mantissa) / powers_of_ten[num_decimals];
+        value = negative ? -value : value;
+        return true;
+    }
+    char text[64];
+    size_t length = static_cast<size_t>(end - begin);
+    if (length == 0 || length >= sizeof(text)) {
+        return false;
+    }
+    std::memcpy(text, begin, length);
+    text[length] = '\0';
+    char* parsed_end = nullptr;
+    value = std::strtod(text, &parsed_end);
+    while (*parsed_end == ' ' || *parsed_end == '\t') ++parsed_end;
+    return parsed_end != text && *parsed_end == '\0';
+}
+
+// Reader of x,y,polarity,time CSV files (no header, as recorded; a non-numeric first line is skipped as a header).
+// The file is read in large buffers and parsed straight into typed columns, without going through Python objects.
+class CsvEventReader {
+public:
+    explicit CsvEventReader(const std::string& path)
+        : path(path), file(std::fopen(path.c_str(), "rb")), buffer(1 << 22), begin(0), filled(0), line_number(0), at_eof(false) {
+        if (file == nullptr) {
+            throw EventFileError(errno, path);
+        }
+    }
+
+    ~CsvEventReader() {
+        std::fclose(file);
+    }
+
+    CsvEventReader(const CsvEventReader&) = delete;
+    CsvEventReader& operator=(const CsvEventReader&) = delete;
+
+    // Append up to max_events events to block and return how many were added (0 once the file is exhausted)
+    size_t read(EventBlock& block, size_t max_events) {
+        size_t added = 0;
+        while (added < max_events) {
+            const char* start = buffer.data() + begin;
+            const char* newline = static_cast<const char*>(std::memchr(start, '\n', filled - begin));
+            if (newline == nullptr) {
+                if (!at_eof) {
+                    refill();
+                    continue;
+                }
+                if (begin == filled) {
                     break;
                 }
+                newline = buffer.data() + filled;  // Last line without a trailing newline
             }
-            if (found_overlap) {
+            added += parse_line(start, newline, block);
+            begin = std::min(filled, static_cast<size_t>(newline - buffer.data()) + 1);
+        }
+        return added;
+    }
+
+private:
+    std::string path;
+    std::FILE* file;
+    std::vector<char> buffer;
+    size_t begin, filled;  // Unparsed bytes are buffer[begin:filled]
+    size_t line_number;
+    bool at_eof;
+
+    // Move the unparsed tail to the front and read more bytes after it
+    void refill() {
+        std::memmove(buffer.data(), buffer.data() + begin, filled - begin);
+        filled -= begin;
+        begin = 0;
+        if (filled == buffer.size()) {
+            buffer.resize(buffer.size() * 2);  // A single line longer than the buffer
+        }
+        size_t count = std::fread(buffer.data() + filled, 1, buffer.size() - filled, file);
+        if (count == 0) {
+            if (std::ferror(file)) {
+                throw EventFileError(errno, path);
+            }
+            at_eof = true;
+        }
+        filled += count;
+    }
+
+    // Parse one line into block and return the number of events added (0 for blank and header lines)
+    size_t parse_line(const char* start, const char* end, EventBlock& block) {
+        line_number++;
+        if (end > start && end[-1] == '\r') {
+            --end;
+        }
+        if (start == end) {
+            return 0;
+        }
+        const char* fields[4];
+        const char* field_ends[4];
+        const char* p = start;
+        size_t num_fields = 0;
+        while (num_fields < 4) {
+            const char* comma = static_cast<const char*>(std::memchr(p, ',', end - p));
+            fields[num_fields] = p;
+            field_ends[num_fields] = comma != nullptr ? comma : end;
+            num_fields++;
+            if (comma == nullptr) {
                 break;
             }
+            p = comma + 1;
+        }
+        long long x, y, polarity;
+        double time;
+        if (num_fields == 4 && field_ends[3] == end
+            && parse_integer(fields[0], field_ends[0], std::numeric_limits<int32_t>::min(), std::numeric_limits<int32_t>::max(), x)
+            && parse_integer(fields[1], field_ends[1], std::numeric_limits<int32_t>::min(), std::numeric_limits<int32_t>::max(), y)
+            && parse_integer(fields[2], field_ends[2], std::numeric_limits<int8_t>::min(), std::numeric_limits<int8_t>::max(), polarity)
+            && parse_real(fields[3], field_ends[3], time)) {
+            block.push_back(static_cast<int32_t>(x), static_cast<int32_t>(y), static_cast<int8_t>(polarity), static_cast<float>(time));
+            return 1;
         }
+        if (line_number == 1) {
+            return 0;  // Header
+        }
+        throw std::invalid_argument("malformed event row at line " + std::to_string(line_number) + " of " + path);
+    }
+};
 
-        // If no overlap with any particle, create a new particle
-        if (!found_overlap) {
-            particle_id_counter++; // Add 1 to particle ID
-            Particle new_particle(particle_id_counter, x, y, time);
-            particles.push_back(new_particle);
-        // If overlap exists, merge with overlapping particle
-        } else if (overlapping_particle_index != std::numeric_limits<size_t>::max()) {
-            // If the same event overlaps with multiple particles, compare recent events of the two particles and check for overlap. If threshold is exceeded, merge particles
-            for (size_t i = 0; i < particles.size(); ++i) {
-                if (i != overlapping_particle_index) {
-                    Particle& particle = particles[i];
-
-                    // Check overlap between two particles using same Gaussian distance condition
-                    for (const auto& recent_event : particle.recent_events) {
-                        double gaussian_score = gaussian_distance(
-                            std::get<0>(particles[overlapping_particle_index].recent_events.back()),
-                            std::get<1>(particles[overlapping_particle_index].recent_events.back()),
-                            std::get<2>(particles[overlapping_particle_index].recent_events.back()),
-                            std::get<0>(recent_event),
-                            std::get<1>(recent_event),
-                            std::get<2>(recent_event),
-                            sigma_x, sigma_t);
-
-                        if (gaussian_score >= gaussian_threshold) {
-                            // Merge particles
-                            particles[overlapping_particle_index].merge(particle);
-                            particles.erase(particles.begin() + i);  // Remove after merge
-                            break;
-                        }
-                    }
+// Read-only memory map of a whole file
+class MappedFile {
+public:
+    explicit MappedFile(const std::string& path) : bytes(nullptr), length(0) {
+#ifdef _WIN32
+        file = CreateFileA(path.c_str(), GENERIC_READ, FILE_SHARE_READ, nullptr, OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, nullptr);
+        if (file == INVALID_HANDLE_VALUE) {
+            throw EventFileError(GetLastError() == ERROR_FILE_NOT_FOUND ? ENOENT : EACCES, path);
+        }
+        LARGE_INTEGER file_size;
+        GetFileSizeEx(file, &file_size);
+        length = static_cast<size_t>(file_size.QuadPart);
+        mapping = nullptr;
+        if (length > 0) {
+            mapping = CreateFileMappingA(file, nullptr, PAGE_READONLY, 0, 0, nullptr);
+            bytes = mapping != nullptr ? static_cast<const char*>(MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0)) : nullptr;
+            if (bytes == nullptr) {
+                if (mapping != nullptr) {
+                    CloseHandle(mapping);
                 }
+                CloseHandle(file);
+                throw EventFileError(EIO, path);
+            }
+        }
+#else
+        fd = open(path.c_str(), O_RDONLY);
+        if (fd < 0) {
+            throw EventFileError(errno, path);
+        }
+        struct stat file_stat;
+        if (fstat(fd, &file_stat) != 0) {
+            int error_number = errno;
+            close(fd);
+            throw EventFileError(error_number, path);
+        }
+        length = static_cast<size_t>(file_stat.st_size);
+        if (length > 0) {
+            void* address = mmap(nullptr, length, PROT_READ, MAP_PRIVATE, fd, 0);
+            if (address == MAP_FAILED) {
+                int error_number = errno;
+                close(fd);
+                throw EventFileError(error_number, path);
             }
+            bytes = static_cast<const char*>(address);
+            madvise(address, length, MADV_SEQUENTIAL);
         }
+#endif
+    }
 
-        // Remove particles if more than 2000ms have passed since last event and mass is below threshold
-        particles.erase(std::remove_if(particles.begin(), particles.end(),
-            [time, m_threshold](const Particle& p) { return !p.is_active(time, m_threshold); }), particles.end());
+    ~MappedFile() {
+#ifdef _WIN32
+        if (bytes != nullptr) {
+            UnmapViewOfFile(bytes);
+            CloseHandle(mapping);
+        }
+        CloseHandle(file);
+#else
+        if (bytes != nullptr) {
+            munmap(const_cast<char*>(bytes), length);
+        }
+        close(fd);
+#endif
     }
 
-    // At final time step, remove particles whose mass is below threshold
-    particles.erase(std::remove_if(particles.begin(), particles.end(),
-        [m_threshold](const Particle& p) { return !p.is_active_final(m_threshold); }), particles.end());
+    MappedFile(const MappedFile&) = delete;
+    MappedFile& operator=(const MappedFile&) = delete;
 
-    // Return results
-    std::vector<ParticleResult> results;
-    for (const auto& particle : particles) {
-        results.push_back(particle.get_result());
+    const char* data() const {
+        return bytes;
     }
 
-    return results;
+    size_t size() const {
+        return length;
+    }
+
+private:
+#ifdef _WIN32
+    HANDLE file, mapping;
+#else
+    int fd;
+#endif
+    const char* bytes;
+    size_t length;
+};
+
+// Reader of .npy event files through a memory map. Two layouts are accepted:
+//  - a 1-D structured array with fields x, y and time (or t), and optionally polarity (or p); other fields are skipped,
+//  - a 2-D numeric array with columns x, y, polarity, time (the CSV layout) or x, y, time (the tracker's events), in C or
+//    Fortran order.
+// Fields may be any little-endian integer or float type; records are converted block by block as they are read.
+class NpyEventReader {
+public:
+    explicit NpyEventReader(const std::string& path) : path(path), file(path), next(0) {
+        parse_header();
+    }
+
+    // Append up to max_events events to block and return how many were added (0 once the file is exhausted)
+    size_t read(EventBlock& block, size_t max_events) {
+        size_t stop = num_events - next < max_events ? num_events : next + max_events;
+        size_t added = stop - next;
+        for (; next < stop; ++next) {
+            const char* record = records + next * record_size;
+            block.push_back(static_cast<int32_t>(x.read(record)), static_cast<int32_t>(y.read(record)),
+                polarity.size > 0 ? static_cast<int8_t>(polarity.read(record)) : static_cast<int8_t>(0),
+                static_cast<float>(time.read(record)));
+        }
+        return added;
+    }
+
+private:
+    // Location and type of one field inside a record (size 0 when absent)
+    struct Field {
+        size_t offset;
+        char kind;  // 'i', 'u' or 'f'
+        size_t size;
+
+        Field() : offset(0), kind(0), size(0) {}
+
+        double read(const char* record) const {
+            const char* p = record + offset;
+            switch (kind) {
+            case 'i':
+                switch (size) {
+                case 1: return load<int8_t>(p);
+                case 2: return load<int16_t>(p);
+                case 4: return load<int32_t>(p);
+                default: return static_cast<double>(load<int64_t>(p));
+                }
+            case 'u':
+                switch (size) {
+                case 1: return load<uint8_t>(p);
+                case 2: return load<uint16_t>(p);
+                case 4: return load<uint32_t>(p);
+                default: return static_cast<double>(load<uint64_t>(p));
+                }
+            default:
+                return size == 4 ? load<float>(p) : load<double>(p);
+            }
+        }
+
+        template <typename T>
+        static T load(const char* p) {
+            T value;
+            std::memcpy(&value, p, sizeof(T));
+            return value;
+        }
+    };
+
+    std::string path;
+    MappedFile file;
+    const char* records;
+    size_t record_size, num_events, next;
+    Field x, y, polarity, time;
+
+    [[noreturn]] void fail(const std::string& reason) const {
+        throw std::invalid_argument("unsupported .npy event file " + path + ": " + reason);
+    }
+
+    // Parse a numpy type string such as '<f4' into a field (only native little-endian numbers are supported)
+    Field parse_type(const std::string& type, size_t offset) const {
+        Field field;
+        if (type.size() < 3 || (type[0] != '<' && type[0] != '|') || (type[1] != 'i' && type[1] != 'u' && type[1] != 'f')) {
+            fail("field type " + type + " is not a little-endian integer or float");
+        }
+        field.offset = offset;
+        field.kind = type[1];
+        field.size = static_cast<size_t>(std::atoi(type.c_str() + 2));
+        bool valid = field.kind == 'f' ? (field.size == 4 || field.size == 8)
+            : (field.size == 1 || field.size == 2 || field.size == 4 || field.size == 8);
+        if (!valid) {
+            fail("field type " + type + " has an unsupported size");
+        }
+        return field;
+    }
+
+    // Size of a type string, also accepting void padding such as '|V3'
+    static size_t type_size(const std::string& type) {
+        return type.size() >= 3 ? static_cast<size_t>(std::atoi(type.c_str() + 2)) : 0;
+    }
+
+    // Return the quoted strings of a header fragment in order
+    static std::vector<std::string> quoted_strings(const std::string& text) {
+        std::vector<std::string> strings;
+        size_t pos = 0;
+        while ((pos = text.find('\'', pos)) != std::string::npos) {
+            size_t close = text.find('\'', pos + 1);
+            if (close == std::string::npos) {
+                break;
+            }
+            strings.push_back(text.substr(pos + 1, close - pos - 1));
+            pos = close + 1;
+        }
+        return strings;
+    }
+
+    void parse_header() {
+        const char* data = file.data();
+        size_t size = file.size();
+        if (size < 10 || std::memcmp(data, "\x93NUMPY", 6) != 0) {
+            fail("not a .npy file");
+        }
+        size_t header_length, header_start;
+        if (static_cast<unsigned char>(data[6]) == 1) {
+            header_length = static_cast<unsigned char>(data[8]) | (static_cast<unsigned char>(data[9]) << 8);
+            header_start = 10;
+        } else {
+            if (size < 12) {
+                fail("truncated header");
+            }
+            header_length = 0;
+            for (int k = 3; k >= 0; --k) {
+                header_length = (header_length << 8) | static_cast<unsigned char>(data[8 + k]);
+            }
+            header_start = 12;
+        }
+        if (header_start + header_length > size) {
+            fail("truncated header");
+        }
+        std::string header(data + header_start, header_length);
+        records = data + header_start + header_length;
+
+        // Shape: the integers between the parentheses after 'shape'
+        size_t shape_pos = header.find("'shape'");
+        size_t open = header.find('(', shape_pos);
+        size_t close = header.find(')', open);
+        if (shape_pos == std::string::npos || open == std::string::npos || close == std::string::npos) {
+            fail("missing shape");
+        }
+        std::vector<size_t> shape;
+        std::string dims = header.substr(open + 1, close - open - 1);
+        for (size_t pos = 0; pos < dims.size();) {
+            size_t comma = dims.find(',', pos);
+            std::string dim = dims.substr(pos, comma == std::string::npos ? std::string::npos : comma - pos);
+            if (dim.find_first_of("0123456789") != std::string::npos) {
+                shape.push_back(static_cast<size_t>(std::strtoull(dim.c_str(), nullptr, 10)));
+            }
+            pos = comma == std::string::npos ? dims.size() : comma + 1;
+        }
+        bool fortran_order = header.find("'fortran_order': True") != std::string::npos;
+
+        size_t descr_pos = header.find("'descr'");
+        if (descr_pos == std::string::npos) {
+            fail("missing descr");
+        }
+        size_t value_pos = header.find_first_not_of(" :", descr_pos + 7);
+        if (value_pos != std::string::npos && header[value_pos] == '[') {
+            // Structured records: a list of ('name', 'type') pairs
+            size_t list_end = header.find(']', value_pos);
+            std::string fields = header.substr(value_pos, list_end - value_pos + 1);
+            // Every field must be a plain ('name', 'type') pair: no sub-arrays or nested records
+            std::vector<std::string> strings = quoted_strings(fields);
+            size_t num_pairs = static_cast<size_t>(std::count(fields.begin(), fields.end(), '('));
+            if (shape.size() != 1 || strings.empty() || strings.size() != 2 * num_pairs) {
+                fail("structured events must be a 1-D array of scalar fields");
+            }
+            size_t offset = 0;
+            for (size_t k = 0; k + 1 < strings.size(); k += 2) {
+                const std::string& name = strings[k];
+                const std::string& type = strings[k + 1];
+                if (name == "x") {
+                    x = parse_type(type, offset);
+                } else if (name == "y") {
+                    y = parse_type(type, offset);
+                } else if (name == "time" || name == "t") {
+                    time = parse_type(type, offset);
+                } else if (name == "polarity" || name == "p") {
+                    polarity = parse_type(type, offset);
+                }
+                offset += type_size(type);
+            }
+            if (x.size == 0 || y.size == 0 || time.size == 0) {
+                fail("structured events need x, y and time fields");
+            }
+            record_size = offset;
+            num_events = shape[0];
+        } else {
+            // Plain numeric columns
+            std::vector<std::string> strings = quoted_strings(header.substr(descr_pos + 7, header.find(',', descr_pos + 7) - descr_pos - 7));
+            if (strings.empty()) {
+                fail("cannot parse descr");
+            }
+            Field column = parse_type(strings[0], 0);
+            if (shape.size() != 2 || (shape[1] != 3 && shape[1] != 4)) {
+                fail("plain arrays must have shape (N, 4) with columns x, y, polarity, time or (N, 3) with x, y, time");
+            }
+            // In C order a record is a row; in Fortran order each column is contiguous and a record is one value wide
+            num_events = shape[0];
+            size_t column_step = fortran_order ? num_events * column.size : column.size;
+            record_size = fortran_order ? column.size : shape[1] * column.size;
+            x = y = time = column;
+            y.offset = column_step;
+            if (shape[1] == 4) {
+                polarity = column;
+                polarity.offset = 2 * column_step;
+            }
+            time.offset = (shape[1] - 1) * column_step;
+        }
+        size_t data_size = fortran_order && shape.size() == 2 ? record_size * shape[1] : record_size;
+        if (num_events > (size - (header_start + header_length)) / std::max<size_t>(data_size, 1)) {
+            fail("file is shorter than its header says");
+        }
+    }
+};
+
+// Whether a path names a .npy file (anything else is read as CSV)
+bool is_npy_path(const std::string& path) {
+    if (path.size() < 4) {
+        return false;
+    }
+    std::string extension = path.substr(path.size() - 4);
+    std::transform(extension.begin(), extension.end(), extension.begin(), [](char c) { return static_cast<char>(std::tolower(c)); });
+    return extension == ".npy";
+}
+
+// Track every event of a reader block by block, calling on_block (when set) after each block
+template <typename Reader>
+size_t feed_reader(ParticleTracker& tracker, Reader& reader, const std::function<void()>& on_block) {
+    EventBlock block;
+    size_t num_events = 0;
+    while (true) {
+        block.clear();
+        if (reader.read(block, file_block_events) == 0) {
+            break;
+        }
+        tracker.check_time_order(block.t.data(), block.size());
+        for (size_t n = 0; n < block.size(); ++n) {
+            tracker.process_event(block.x[n], block.y[n], block.t[n]);
+        }
+        num_events += block.size();
+        if (on_block) {
+            on_block();
+        }
+    }
+    return num_events;
+}
+
+// Feed a time-ordered CSV or .npy event file to a ParticleTracker and return the number of events read. on_block, when
+// set, is called after every block of file_block_events events (e.g. to pop the particles retired so far).
+size_t feed_file(ParticleTracker& tracker, const std::string& path, const std::function<void()>& on_block = nullptr) {
+    if (is_npy_path(path)) {
+        NpyEventReader reader(path);
+        return feed_reader(tracker, reader, on_block);
+    }
+    CsvEventReader reader(path);
+    return feed_reader(tracker, reader, on_block);
+}
+
+// ParticleTracker.feed_file: the file is read and tracked without the GIL, which on_block (a Python callable, or None)
+// takes back while it runs
+size_t feed_file_py(ParticleTracker& tracker, const std::string& path, pybind11::object on_block) {
+    std::function<void()> callback;
+    if (!on_block.is_none()) {
+        callback = [&on_block]() {
+            pybind11::gil_scoped_acquire acquire;
+            on_block();
+        };
+    }
+    pybind11::gil_scoped_release release;
+    return feed_file(tracker, path, callback);
+}
+
+// Read a whole CSV or .npy event file into a dict of x, y (int32), polarity (int8) and t (float32) NumPy arrays
+pybind11::dict read_events(const std::string& path) {
+    EventBlock block;
+    {
+        pybind11::gil_scoped_release release;
+        if (is_npy_path(path)) {
+            NpyEventReader reader(path);
+            reader.read(block, std::numeric_limits<size_t>::max());
+        } else {
+            CsvEventReader reader(path);
+            reader.read(block, std::numeric_limits<size_t>::max());
+        }
+    }
+    pybind11::dict columns;
+    columns["x"] = vector_to_numpy(std::move(block.x));
+    columns["y"] = vector_to_numpy(std::move(block.y));
+    columns["polarity"] = vector_to_numpy(std::move(block.polarity));
+    columns["t"] = vector_to_numpy(std::move(block.t));
+    return columns;
+}
+
+// Track particles from a time-ordered CSV or .npy event file without materialising the events in Python.
+// Returns the columnar result as a dict of NumPy arrays (see ColumnarResult).
+pybind11::dict track_particles_file(const std::string& path, double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold,
+    double centroid_window, double activity_window, double count_bin_width) {
+    std::vector<Particle> particles;
+    {
+        pybind11::gil_scoped_release release;
+        ParticleTracker tracker(sigma_x, sigma_t, gaussian_threshold, m_threshold, centroid_window, activity_window);
+        tracker.count_events(count_bin_width);
+        feed_file(tracker, path);
+        particles = tracker.finalize();
+    }
+    return to_columnar_dict(particles, count_bin_width);
 }
 
 PYBIND11_MODULE(particle_tracking, m) {
+    pybind11::register_exception_translator([](std::exception_ptr error) {
+        try {
+            if (error) {
+                std::rethrow_exception(error);
+            }
+        } catch (const EventFileError& e) {
+            errno = e.error_number;
+            PyErr_SetFromErrnoWithFilename(PyExc_OSError, e.path.c_str());
+        }
+    });
+
     pybind11::class_<ParticleResult>(m, "ParticleResult")
         .def_readonly("particle_id", &ParticleResult::particle_id)
         .def_readonly("centroid_history", &ParticleResult::centroid_history)
         .def_readonly("events", &ParticleResult::events);
 
-    m.def("track_particles_cpp", &track_particles_cpp, "Track particles in C++");
+    // Tracking releases the GIL, so several recordings can be tracked from Python threads at once (a single
+    // ParticleTracker must still be used by one thread at a time)
+    m.def("track_particles_cpp", &track_particles_cpp, "Track particles in C++",
+        pybind11::call_guard<pybind11::gil_scoped_release>(),
+        pybind11::arg("data"), pybind11::arg("sigma_x"), pybind11::arg("sigma_t"), pybind11::arg("gaussian_threshold"), pybind11::arg("m_threshold"),
+        pybind11::arg("centroid_window") = 2000.0, pybind11::arg("activity_window") = 2000.0);
+    // count_bin_width > 0 adds the per-particle event counts (count_offsets, count_start, counts) to the columnar results
+    m.def("track_particles_np", &track_particles_np, "Track particles in C++ from x, y and time NumPy arrays",
+        pybind11::arg("x"), pybind11::arg("y"), pybind11::arg("t"),
+        pybind11::arg("sigma_x"), pybind11::arg("sigma_t"), pybind11::arg("gaussian_threshold"), pybind11::arg("m_threshold"),
+        pybind11::arg("centroid_window") = 2000.0, pybind11::arg("activity_window") = 2000.0, pybind11::arg("count_bin_width") = 0.0);
+    m.def("track_particles_tiled", &track_particles_tiled,
+        "Track particles in C++ from x, y and time NumPy arrays, tracking spatial tiles in parallel and stitching them at the seams",
+        pybind11::arg("x"), pybind11::arg("y"), pybind11::arg("t"),
+        pybind11::arg("sigma_x"), pybind11::arg("sigma_t"), pybind11::arg("gaussian_threshold"), pybind11::arg("m_threshold"),
+        pybind11::arg("centroid_window") = 2000.0, pybind11::arg("activity_window") = 2000.0,
+        pybind11::arg("tiles_x") = 4, pybind11::arg("tiles_y") = 2, pybind11::arg("num_threads") = 0, pybind11::arg("count_bin_width") = 0.0);
+    m.def("track_particles_file", &track_particles_file, "Track particles in C++ from a time-ordered CSV or .npy event file",
+        pybind11::arg("path"),
+        pybind11::arg("sigma_x"), pybind11::arg("sigma_t"), pybind11::arg("gaussian_threshold"), pybind11::arg("m_threshold"),
+        pybind11::arg("centroid_window") = 2000.0, pybind11::arg("activity_window") = 2000.0, pybind11::arg("count_bin_width") = 0.0);
+    m.def("read_events", &read_events, "Read a CSV or .npy event file into x, y, polarity and t NumPy arrays",
+        pybind11::arg("path"));
+
+    pybind11::class_<ParticleTracker>(m, "ParticleTracker")
+        .def(pybind11::init([](double sigma_x, double sigma_t, double gaussian_threshold, int m_threshold,
+                double centroid_window, double activity_window, double count_bin_width) {
+                std::unique_ptr<ParticleTracker> tracker(new ParticleTracker(sigma_x, sigma_t, gaussian_threshold, m_threshold,
+                    centroid_window, activity_window));
+                tracker->count_events(count_bin_width);
+                return tracker;
+            }),
+            pybind11::arg("sigma_x"), pybind11::arg("sigma_t"), pybind11::arg("gaussian_threshold"), pybind11::arg("m_threshold"),
+            pybind11::arg("centroid_window") = 2000.0, pybind11::arg("activity_window") = 2000.0, pybind11::arg("count_bin_width") = 0.0)
+        .def("feed", &feed_tracker, "Track a time-ordered chunk of events given as x, y and time arrays",
+            pybind11::arg("x"), pybind11::arg("y"), pybind11::arg("t"))
+        .def("feed_file", &feed_file_py,
+            "Track a time-ordered CSV or .npy event file and return the number of events read, calling on_block() after every block",
+            pybind11::arg("path"), pybind11::arg("on_block") = pybind11::none())
+        .def("pop_retired", [](ParticleTracker& tracker) { return to_columnar_dict(tracker.pop_retired(), tracker.event_count_bin_width()); },
+            "Return the particles retired since the last call as columnar NumPy arrays")
+        .def("finalize", [](ParticleTracker& tracker) { return to_columnar_dict(tracker.finalize(), tracker.event_count_bin_width()); },
+            "Apply the final mass filter and return every particle not yet popped as columnar NumPy arrays")
+        .def_property_readonly("num_active", &ParticleTracker::num_active);
 }
@@ -1,7 +1,9 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 import argparse
+import functools
 import os
 
 plt.rcParams.update({
@@ -17,12 +19,19 @@ plt.rcParams.update({
     'figure.figsize': (12, 8),
 })
 
-parser = argparse.ArgumentParser(description='Plot all events from CSV files.')
-parser.add_argument('-i', '--input', required=True, help='Path to the input CSV file or directory.')
-args = parser.parse_args()
-
 sampling_ratio = 0.5
 
+# Density mode: events are binned instead of drawn one by one
+sensor_width = 1280  # Sensor size (pixels)
+sensor_height = 720
+density_time_bin = 10.0  # Width of the time bins (ms)
+density_pixel_bin = 4  # Width of the x/y bins (pixels)
+density_max_time_bins = 2048  # Time bins kept at most: longer recordings get wider bins (time_bin doubles until they fit)
+chunk_events = 1000000  # Events read from the CSV at a time
+
+CSV_COLUMNS = ['x', 'y', 'polarity', 'time']
+CSV_DTYPES = {'x': np.int32, 'y': np.int32, 'polarity': np.int8, 'time': np.float64}
+
 def process_csv_file(csv_file, outputs_dir):
     os.makedirs(outputs_dir, exist_ok=True)
 
@@ -65,18 +74,197 @@ def process_csv_file(csv_file, outputs_dir):
     plt.close()
 
 
-input_path = args.input
-
-if os.path.isdir(input_path):
-    outputs_dir = os.path.join(input_path, 'outputs')
-    for filename in os.listdir(input_path):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(input_path, filename)
-            print(f"Processing file: {file_path}")
-            process_csv_file(file_path, outputs_dir)
-elif os.path.isfile(input_path) and input_path.endswith('.csv'):
-    outputs_dir = os.path.join(os.path.dirname(input_path), 'outputs')
-    print(f"Processing file: {input_path}")
-    process_csv_file(input_path, outputs_dir)
-else:
-    print(f"Error: {input_path} is not a valid CSV file or directory.")
+def add_counts(counts, flat_index):
+    """Add one to counts (in place) at each flat index"""
+    counts += np.bincount(flat_index, minlength=counts.size).reshape(counts.shape)
+
+
+class EventDensity:
+    """Event counts per polarity on fixed bins: an x-y image and time-x / time-y projections. Time bins are
+    floor(time / time_bin), so chunks in any order add up. The time axis grows as events arrive, in buffers whose
+    capacity doubles, and holds max_time_bins bins at most: when a recording needs more, time_bin doubles and
+    neighbouring bins are merged. Memory is therefore bounded whatever the length of the recording, and each chunk
+    only touches the bins of its own time range"""
+
+    def __init__(self, time_bin=density_time_bin, pixel_bin=density_pixel_bin,
+                 width=sensor_width, height=sensor_height, max_time_bins=density_max_time_bins):
+        self.time_bin = time_bin
+        self.pixel_bin = pixel_bin
+        self.max_time_bins = max_time_bins
+        self.num_x = -(-width // pixel_bin)
+        self.num_y = -(-height // pixel_bin)
+        self.first_bin = None
+        self.num_bins = 0
+        self.buffer_start = 0  # Time bin held by the first row of the projection buffers
+        self.capacity = 0  # Rows of the projection buffers
+        self.xy = {}  # polarity -> (num_y, num_x) counts
+        self._time_x = {}  # polarity -> (capacity, num_x) buffer of the time-x counts
+        self._time_y = {}  # polarity -> (capacity, num_y) buffer of the time-y counts
+
+    @property
+    def time_x(self):
+        """polarity -> (num_bins, num_x) counts"""
+        return {polarity: self._used(counts) for polarity, counts in self._time_x.items()}
+
+    @property
+    def time_y(self):
+        """polarity -> (num_bins, num_y) counts"""
+        return {polarity: self._used(counts) for polarity, counts in self._time_y.items()}
+
+    def _used(self, buffer):
+        offset = (self.first_bin or 0) - self.buffer_start
+        return buffer[offset:offset + self.num_bins]
+
+    def _coarsen(self):
+        """Double time_bin, merging each pair of bins"""
+        self.time_bin *= 2
+        if self.first_bin is None:
+            return
+        first, last = self.first_bin // 2, (self.first_bin + self.num_bins - 1) // 2
+        offset = self.first_bin - 2 * first
+        for buffers in (self._time_x, self._time_y):
+            for polarity, counts in buffers.items():
+                pairs = np.zeros((2 * (last - first + 1), counts.shape[1]), dtype=counts.dtype)
+                pairs[offset:offset + self.num_bins] = self._used(counts)
+                buffers[polarity] = pairs.reshape(-1, 2, counts.shape[1]).sum(axis=1)
+        self.first_bin, self.num_bins = first, last - first + 1
+        self.buffer_start, self.capacity = first, self.num_bins
+
+    def _extend(self, first_bin, last_bin):
+        """Grow the time axis to cover first_bin..last_bin, reallocating the buffers (twice as large, up to
+        max_time_bins, with the room on the side being extended) only when they cannot hold it"""
+        if self.first_bin is not None:
+            first_bin = min(first_bin, self.first_bin)
+            last_bin = max(last_bin, self.first_bin + self.num_bins - 1)
+        if first_bin < self.buffer_start or last_bin >= self.buffer_start + self.capacity:
+            capacity = max(last_bin - first_bin + 1, min(2 * self.capacity, self.max_time_bins))
+            start = last_bin + 1 - capacity if first_bin < self.buffer_start else first_bin
+            offset = (self.first_bin or 0) - start
+            for buffers in (self._time_x, self._time_y):
+                for polarity, counts in buffers.items():
+                    grown = np.zeros((capacity, counts.shape[1]), dtype=counts.dtype)
+                    grown[offset:offset + self.num_bins] = self._used(counts)
+                    buffers[polarity] = grown
+            self.buffer_start, self.capacity = start, capacity
+        self.first_bin, self.num_bins = first_bin, last_bin - first_bin + 1
+
+    def add(self, x, y, polarity, time):
+        """Add events (time in ms); events outside the sensor are ignored"""
+        x = np.asarray(x) // self.pixel_bin
+        y = np.asarray(y) // self.pixel_bin
+        inside = (x >= 0) & (x < self.num_x) & (y >= 0) & (y < self.num_y)
+        x, y, polarity = x[inside], y[inside], np.asarray(polarity)[inside]
+        time = np.asarray(time)[inside]
+        if len(time) == 0:
+            return
+        time_bin = np.floor(time / self.time_bin).astype(np.int64)
+        first_bin, last_bin = int(time_bin.min()), int(time_bin.max())
+        while True:
+            if self.first_bin is not None:
+                span = max(last_bin, self.first_bin + self.num_bins - 1) - min(first_bin, self.first_bin) + 1
+            else:
+                span = last_bin - first_bin + 1
+            if span <= self.max_time_bins:
+                break
+            # floor(floor(t / b) / 2) == floor(t / 2b): halving the bins matches the coarser grid exactly
+            self._coarsen()
+            time_bin //= 2
+            first_bin, last_bin = first_bin // 2, last_bin // 2
+        self._extend(first_bin, last_bin)
+
+        # Count over the chunk's own bins and add them into that slice of the projections
+        rows = slice(first_bin - self.buffer_start, last_bin + 1 - self.buffer_start)
+        time_bin -= first_bin
+        for value in np.unique(polarity).tolist():
+            selected = polarity == value
+            if value not in self.xy:
+                self.xy[value] = np.zeros((self.num_y, self.num_x), dtype=np.int64)
+                self._time_x[value] = np.zeros((self.capacity, self.num_x), dtype=np.int64)
+                self._time_y[value] = np.zeros((self.capacity, self.num_y), dtype=np.int64)
+            px, py, pt = x[selected], y[selected], time_bin[selected]
+            add_counts(self.xy[value], py * self.num_x + px)
+            add_counts(self._time_x[value][rows], pt * self.num_x + px)
+            add_counts(self._time_y[value][rows], pt * self.num_y + py)
+
+    def time_range(self):
+        """Start and end (ms) of the time axis"""
+        return self.first_bin * self.time_bin, (self.first_bin + self.num_bins) * self.time_bin
+
+
+def accumulate_density(csv_file, time_bin=density_time_bin, pixel_bin=density_pixel_bin,
+                       max_time_bins=density_max_time_bins):
+    """EventDensity of an event CSV, read chunk_events rows at a time"""
+    density = EventDensity(time_bin, pixel_bin, max_time_bins=max_time_bins)
+    for chunk in pd.read_csv(csv_file, header=None, names=CSV_COLUMNS, dtype=CSV_DTYPES, chunksize=chunk_events):
+        density.add(chunk['x'].to_numpy(), chunk['y'].to_numpy(), chunk['polarity'].to_numpy(),
+                    chunk['time'].to_numpy() * 1e-3)
+    return density
+
+
+def plot_density(density, output_image_file):
+    """One row per polarity: x-y image, time-x and time-y projections, on a log colour scale"""
+    polarities = sorted(density.xy, reverse=True)
+    fig, axes = plt.subplots(max(1, len(polarities)), 3, figsize=(18, 5 * max(1, len(polarities))), squeeze=False)
+    width, height = density.num_x * density.pixel_bin, density.num_y * density.pixel_bin
+    start, end = density.time_range() if density.num_bins else (0.0, density.time_bin)
+
+    for row, polarity in enumerate(polarities):
+        panels = [
+            (density.xy[polarity], [0, width, height, 0], 'X Coordinate (pixels)', 'Y Coordinate (pixels)'),
+            (density.time_x[polarity].T, [start, end, width, 0], 'Time (milliseconds)', 'X Coordinate (pixels)'),
+            (density.time_y[polarity].T, [start, end, height, 0], 'Time (milliseconds)', 'Y Coordinate (pixels)'),
+        ]
+        for ax, (counts, extent, xlabel, ylabel) in zip(axes[row], panels):
+            image = ax.imshow(np.ma.masked_equal(counts, 0), extent=extent, aspect='auto', cmap='Greys',
+                              norm=LogNorm(vmin=1, vmax=max(1, counts.max())), interpolation='nearest')
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            ax.grid(False)
+            fig.colorbar(image, ax=ax, label='Events')
+        axes[row, 0].set_title(f'Polarity {polarity}')
+
+    plt.tight_layout()
+    plt.savefig(output_image_file)
+    plt.close(fig)
+
+
+def process_csv_file_density(csv_file, outputs_dir, time_bin=density_time_bin, pixel_bin=density_pixel_bin,
+                             max_time_bins=density_max_time_bins):
+    os.makedirs(outputs_dir, exist_ok=True)
+    density = accumulate_density(csv_file, time_bin, pixel_bin, max_time_bins)
+    base_filename = os.path.splitext(os.path.basename(csv_file))[0]
+    plot_density(density, os.path.join(outputs_dir, f'{base_filename}_density.png'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot all events from CSV files.')
+    parser.add_argument('-i', '--input', required=True, help='Path to the input CSV file or directory.')
+    parser.add_argument('--density', action='store_true',
+                        help='Stream the CSV and plot binned event densities instead of a scatter of sampled events.')
+    parser.add_argument('--time-bin', type=float, default=density_time_bin, help='With --density, time bin width (ms).')
+    parser.add_argument('--pixel-bin', type=int, default=density_pixel_bin, help='With --density, x/y bin width (pixels).')
+    parser.add_argument('--max-time-bins', type=int, default=density_max_time_bins,
+                        help='With --density, time bins kept at most (the time bin widens for longer recordings).')
+    args = parser.parse_args()
+
+    if args.density:
+        process_file = functools.partial(process_csv_file_density, time_bin=args.time_bin, pixel_bin=args.pixel_bin,
+                                         max_time_bins=args.max_time_bins)
+    else:
+        process_file = process_csv_file
+
+    input_path = args.input
+
+    if os.path.isdir(input_path):
+        outputs_dir = os.path.join(input_path, 'outputs')
+        for filename in os.listdir(input_path):
+            if filename.endswith('.csv'):
+                file_path = os.path.join(input_path, filename)
+                print(f"Processing file: {file_path}")
+                process_file(file_path, outputs_dir)
+    elif os.path.isfile(input_path) and input_path.endswith('.csv'):
+        outputs_dir = os.path.join(os.path.dirname(input_path), 'outputs')
+        print(f"Processing file: {input_path}")
+        process_file(input_path, outputs_dir)
+    else:
+        print(f"Error: {input_path} is not a valid CSV file or directory.")
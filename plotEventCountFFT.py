@@ -11,17 +11,17 @@ import os
 from time_fft_to_pdf import *
 from process_fft import *
 from detect_peaks import *
+from particle_results import (
+    RESULTS_EXTENSION,
+    RESULTS_EXTENSIONS,
+    ParticleResults,
+    open_results,
+    particles_to_columnar,
+    results_files,
+)
+from fft_cache import CACHE_DIRNAME, CACHE_MAX_BYTES, FFTCache
 
 
-parser = argparse.ArgumentParser(description="Particle tracking script.")
-parser.add_argument(
-    "-i",
-    "--input",
-    required=True,
-    help="Path to the input pickle file or directory.",
-)
-args = parser.parse_args()
-input_path = args.input
 # FOLDERS = ["momojiro"]
 # DATA_LABELS = [
 #     "$Myotis\\ macrodactylus$",
@@ -40,33 +40,43 @@ DATA_LABELS = [
 
 
 def read_pickles(input_path, folder_name):
-    files = glob.glob(f"{input_path}/{folder_name}/*.pkl")
+    files = results_files(sorted(
+        f
+        for extension in RESULTS_EXTENSIONS
+        for f in glob.glob(f"{input_path}/{folder_name}/*{extension}")
+    ))
 
     return files
 
 
-def process_pickle_file(particle_output_file):
-    output_directory = os.path.dirname(particle_output_file)
+TIME_BIN_SIZE = 1  # Width of the event-count bins (ms)
 
-    fft_results_dir = os.path.join(output_directory, "windowed_fft_results")
-    os.makedirs(
-        fft_results_dir, exist_ok=True
-    )
 
-    # File name handling: use the part after the third "_" from the beginning, and remove ".pkl"
-    base_filename = os.path.basename(particle_output_file)
-    base_filename = "_".join(base_filename.split("_")[3:]).replace(".pkl", "")
+def load_event_coords(particle_output_file):
+    """Events (x, y, time) of the densest particle of a results file, reading only
+    that particle's events; a pickled event array (e.g. an upper/lower half written
+    by splitTrajectory.py) is returned as is"""
+    if particle_output_file.endswith(".pkl"):
+        with open(particle_output_file, "rb") as f:
+            particle_data = pickle.load(f)
+        if not isinstance(particle_data, dict):
+            return np.asarray(particle_data)
+        results = ParticleResults(particles_to_columnar(particle_data))
+    else:
+        results = open_results(particle_output_file)
+
+    with results:
+        densest_particle_id = results.densest()
+        if densest_particle_id is None:
+            return np.empty((0, 3), dtype=np.float32)
+        return results.events(densest_particle_id)
 
-    with open(particle_output_file, "rb") as f:
-        particle_data = pickle.load(f)
 
-    # Extract the particle with the maximum number of events
-    # max_particle_id = max(
-    #     particle_data, key=lambda p: len(particle_data[p]["events"])
-    # )
-    # particle_info = particle_data[max_particle_id]
-    particle_info = particle_data
-    event_coords = np.array(particle_info)
+def count_events(event_coords, time_bin_size=TIME_BIN_SIZE):
+    """Number of events in each time_bin_size ms bin, from the first event on
+    (an empty series when there are no events, e.g. no particle passed m_threshold)"""
+    if len(event_coords) == 0:
+        return np.zeros(0, dtype=np.int64)
 
     # Convert to milliseconds
     event_times = event_coords[:, 2] * 1e-3
@@ -74,74 +84,310 @@ def process_pickle_file(particle_output_file):
     # Get minimum and maximum time
     min_time, max_time = np.min(event_times), np.max(event_times)
 
-    # Create time bins with 1ms intervals
-    time_bin_size = 1  # ms
+    # Create time bins with time_bin_size intervals
     time_bins = np.arange(min_time, max_time + time_bin_size, time_bin_size)
 
     # Count number of events in each time bin
     event_counts, _ = np.histogram(event_times, bins=time_bins)
+    return event_counts
+
+
+def load_event_counts(particle_output_file, time_bin_size=TIME_BIN_SIZE):
+    """Event counts in time_bin_size ms bins of the densest particle of a results file.
+    The counts recorded by the tracker are used when they have that bin width, so the
+    events are not read at all; otherwise the events are loaded and counted"""
+    if particle_output_file.endswith(RESULTS_EXTENSION):
+        with open_results(particle_output_file) as results:
+            densest_particle_id = results.densest()
+            if (
+                densest_particle_id is not None
+                and results.count_bin_width == time_bin_size * 1e3
+            ):
+                return np.array(results.count_series(densest_particle_id)[1])
 
-if os.path.isdir(input_path):
-    # Process all files in the directory
-    all_peak_freqs = []
-    dict_peak_freqs = {}
-    dict_file_names = {}
-    for folder_name in FOLDERS:
-        pickle_list = read_pickles(input_path, folder_name)
-        event_num_list = []
-        folder_peak_freqs = []
-        folder_file_names = []
-        for pkl_data in pickle_list:
-            base_name = os.path.basename(pkl_data)
-            print(f"Processing file: {base_name}")
-            event_num_arr = process_pickle_file(pkl_data)
-            freqs, fft_magnitude = calc_fft(event_num_arr)
-            peak_indices, max_peak_idx = calc_peak(freqs, fft_magnitude)
-            if len(peak_indices) == 0:
-                event_num_list.append(event_num_arr)
-                folder_peak_freqs.append(np.nan)
-                folder_file_names.extend([base_name])
+    return count_events(load_event_coords(particle_output_file), time_bin_size)
+
+
+def particle_wingbeat_tracks(particle_output_file, time_bin_size=TIME_BIN_SIZE):
+    """Wingbeat frequency over time (WingbeatTracker) of every particle of a results
+    file lasting at least one sliding-DFT window: {particle_id: (times in s, frequencies)}.
+    The counts recorded by the tracker are used when they have that bin width"""
+    tracks = {}
+    with open_results(particle_output_file) as results:
+        recorded = results.count_bin_width == time_bin_size * 1e3
+        for particle_id in results.particle_ids.tolist():
+            if recorded:
+                start, event_counts = results.count_series(particle_id)
             else:
-                peak_freqs = freqs[peak_indices]
-                max_peak_freq = freqs[max_peak_idx]
-                peak_freqs = detect_wingfreq(peak_freqs, max_peak_freq)
-                folder_peak_freqs.append(round(peak_freqs, 1))
-                folder_file_names.extend([base_name])
-                event_num_list.append(event_num_arr)
+                event_coords = results.events(particle_id)
+                start = float(np.min(event_coords[:, 2]))
+                event_counts = count_events(event_coords, time_bin_size)
+            if len(event_counts) < SDFT_WINDOW:
+                continue
+            times, wingfreqs = wingbeat_track(event_counts, fs=1e3 / time_bin_size)
+            tracks[particle_id] = (start * 1e-6 + times, wingfreqs)
+    return tracks
 
-        dict_peak_freqs[folder_name] = folder_peak_freqs
-        dict_file_names[folder_name] = folder_file_names
 
-        all_peak_freqs.append(folder_peak_freqs)
+def save_wingbeat_tracks(tracks, output_path):
+    """Write the tracks of particle_wingbeat_tracks as CSV rows (particle_id, time_s, wingbeat_hz)"""
+    frames = [
+        pd.DataFrame({"particle_id": particle_id, "time_s": times, "wingbeat_hz": wingfreqs})
+        for particle_id, (times, wingfreqs) in tracks.items()
+    ]
+    columns = ["particle_id", "time_s", "wingbeat_hz"]
+    df_tracks = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    df_tracks.to_csv(output_path, index=False)
 
-        output_pdf_path = os.path.join(
-            input_path, f"{folder_name}_analysis.pdf"
-        )
-        plot_and_save_time_series_fft_to_pdf(
-            folder_name, event_num_list, folder_file_names, output_pdf_path
+
+def write_wingbeat_tracks(particle_output_file):
+    """Save the wingbeat tracks of every particle of a results file under windowed_fft_results"""
+    output_directory = os.path.dirname(particle_output_file)
+
+    fft_results_dir = os.path.join(output_directory, "windowed_fft_results")
+    os.makedirs(
+        fft_results_dir, exist_ok=True
+    )
+
+    # File name handling: use the part after the third "_" from the beginning, and remove the extension
+    base_filename = os.path.basename(particle_output_file)
+    base_filename = "_".join(os.path.splitext(base_filename)[0].split("_")[3:])
+
+    save_wingbeat_tracks(
+        particle_wingbeat_tracks(particle_output_file),
+        os.path.join(fft_results_dir, f"{base_filename}_wingbeat_tracks.csv"),
+    )
+
+
+def process_pickle_file(particle_output_file, tracks=False):
+    # Count the events of the particle with the maximum number of events in 1 ms bins
+    event_counts = load_event_counts(particle_output_file)
+
+    # Wingbeat frequency over time of every particle
+    if tracks and particle_output_file.endswith(RESULTS_EXTENSION):
+        write_wingbeat_tracks(particle_output_file)
+    return event_counts
+
+
+def calc_fft(event_num_list, welch=False, zoom=None):
+    """FFT of every event-count series of a folder at once: the series are
+    preprocessed into one zero-padded 2-D array and transformed by a single rfft.
+    With welch, each series is instead averaged over all its windows (WelchSpectrum)
+    rather than cut to the first WINDOW_LENGTH ms. With zoom (a resolution in Hz),
+    only the FILTER_LOW..FILTER_HIGH band is evaluated, at that resolution (zoom_fft).
+    Returns the frequency axis and an (n_series, n_freqs) amplitude array, whose rows
+    are NaN for empty series (no peak, hence a NaN wingbeat frequency, is found there)"""
+    if welch and zoom:
+        raise ValueError("The Welch and zoom spectra cannot be combined")
+    if welch:
+        freqs, fft_magnitude = batch_welch(event_num_list)
+    elif zoom:
+        freqs, fft_magnitude = zoom_fft(stack_time_series(event_num_list), resolution=zoom)
+    else:
+        freqs, fft_magnitude = batch_fft(stack_time_series(event_num_list))
+    fft_magnitude[[len(series) == 0 for series in event_num_list]] = np.nan
+    return freqs, fft_magnitude
+
+
+def calc_peak(freqs, fft_magnitude):
+    """Peaks of every spectrum of the batch (see batch_peak_detection)"""
+    return batch_peak_detection(fft_magnitude, freqs)
+
+
+def wingbeat_frequencies(freqs, peak_indices, max_peak_idx):
+    """batch_detect_wingfreq of the peaks found by calc_peak (NaN where there is none)"""
+    peak_freqs = np.where(peak_indices >= 0, freqs[peak_indices], np.nan)
+    max_peak_freq = np.where(max_peak_idx >= 0, freqs[max_peak_idx], np.nan)
+    return batch_detect_wingfreq(peak_freqs, max_peak_freq)
+
+
+def estimate_wingfreqs(event_num_list, welch=False, zoom=None):
+    """Wingbeat frequency of every event-count series in one pass (NaN where no peak is found).
+    Returns the frequency axis, the spectra and the wingbeat frequencies"""
+    freqs, fft_magnitude = calc_fft(event_num_list, welch, zoom)
+    peak_indices, max_peak_idx = calc_peak(freqs, fft_magnitude)
+    return freqs, fft_magnitude, wingbeat_frequencies(freqs, peak_indices, max_peak_idx)
+
+
+def fft_parameters(welch=False, zoom=None):
+    """Everything the cached counts, spectra and peaks of a file depend on besides its content"""
+    parameters = {
+        "fs": FS,
+        "window_length": WINDOW_LENGTH,
+        "filter_low": FILTER_LOW,
+        "filter_high": FILTER_HIGH,
+        "time_bin_size": TIME_BIN_SIZE,
+        "spectrum": "welch" if welch else "zoom" if zoom else "fft",
+    }
+    if welch:
+        parameters["welch_overlap"] = WELCH_OVERLAP
+    if zoom:
+        parameters["zoom_resolution"] = zoom
+    return parameters
+
+
+def analyse_files(files, welch=False, zoom=None, tracks=False, cache=None):
+    """Event counts, file names, wingbeat frequencies and spectra (freqs, fft_magnitude,
+    peak_indices, as the FFT report draws them) of results files. With an FFTCache,
+    files analysed before with the same parameters are read from it and only the
+    others are counted and transformed (in one batch), then cached"""
+    parameters = fft_parameters(welch, zoom)
+    folder_file_names = [os.path.basename(f) for f in files]
+    event_num_list = [None] * len(files)
+    wingfreqs = np.full(len(files), np.nan)
+    spectra = [None] * len(files)
+    keys = [None] * len(files)
+    missing = []
+    for k, pkl_data in enumerate(files):
+        print(f"Processing file: {folder_file_names[k]}")
+        entry = None
+        if cache is not None:
+            keys[k] = cache.key(pkl_data, parameters)
+            entry = cache.load(keys[k])
+        if entry is None:
+            event_num_list[k] = process_pickle_file(pkl_data, tracks)
+            missing.append(k)
+            continue
+        event_num_list[k] = entry["event_counts"]
+        wingfreqs[k] = entry["wingfreq"]
+        spectra[k] = (entry["freqs"], entry["fft_magnitude"], entry["peak_indices"])
+        if tracks and pkl_data.endswith(RESULTS_EXTENSION):
+            write_wingbeat_tracks(pkl_data)
+
+    if missing:
+        freqs, fft_magnitude = calc_fft([event_num_list[k] for k in missing], welch, zoom)
+        peak_indices, max_peak_idx = calc_peak(freqs, fft_magnitude)
+        wingfreqs[missing] = wingbeat_frequencies(freqs, peak_indices, max_peak_idx)
+        for row, k in enumerate(missing):
+            spectra[k] = (freqs, fft_magnitude[row], peak_indices[row])
+        if cache is not None:
+            for row, k in enumerate(missing):
+                cache.store(keys[k], {
+                    "event_counts": event_num_list[k],
+                    "freqs": freqs,
+                    "fft_magnitude": fft_magnitude[row],
+                    "peak_indices": peak_indices[row],
+                    "max_peak_idx": max_peak_idx[row],
+                    "wingfreq": wingfreqs[k],
+                })
+
+    folder_peak_freqs = [round(f, 1) if not np.isnan(f) else np.nan for f in wingfreqs.tolist()]
+    if spectra:
+        spectra = (
+            spectra[0][0],
+            np.stack([spectrum[1] for spectrum in spectra]),
+            np.stack([spectrum[2] for spectrum in spectra]),
         )
+    else:
+        spectra = None
+    return event_num_list, folder_file_names, folder_peak_freqs, spectra
 
-    # Save violin plot to a single PDF
-    violin_pdf_path = os.path.join(input_path, "peak_frequency_comparison.pdf")
-    plot_and_save_violin_to_pdf(all_peak_freqs, violin_pdf_path, DATA_LABELS)
 
-    # Save data to CSV (including peak frequency and file names)
-    df_peak_freqs = pd.DataFrame(
-        dict([(k, pd.Series(v)) for k, v in dict_peak_freqs.items()])
+def process_folder(input_path, folder_name, welch=False, zoom=None, tracks=False, cache_size=CACHE_MAX_BYTES):
+    """Event counts, file names, wingbeat frequencies and spectra of every results file of a folder,
+    cached under its windowed_fft_results directory (up to cache_size bytes; 0 disables the cache)"""
+    files = read_pickles(input_path, folder_name)
+    if not files or not cache_size:
+        return analyse_files(files, welch, zoom, tracks)
+    cache_dir = os.path.join(input_path, folder_name, "windowed_fft_results", CACHE_DIRNAME)
+    with FFTCache(cache_dir, cache_size) as cache:
+        return analyse_files(files, welch, zoom, tracks, cache)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Particle tracking script.")
+    parser.add_argument(
+        "-i",
+        "--input",
+        required=True,
+        help="Path to the input particle tracking results (.npz or .pkl) or directory.",
+    )
+    spectrum = parser.add_mutually_exclusive_group()
+    spectrum.add_argument(
+        "--welch",
+        action="store_true",
+        help="Average the spectrum over the whole series (Welch) instead of its first 4096 ms.",
+    )
+    spectrum.add_argument(
+        "--zoom",
+        type=float,
+        metavar="RESOLUTION",
+        help="Evaluate only the 4-30 Hz band, every RESOLUTION Hz (e.g. 0.05).",
     )
-    print(df_peak_freqs)
-    df_file_names = pd.DataFrame(
-        dict([(k + "_file", pd.Series(v)) for k, v in dict_file_names.items()])
+    parser.add_argument(
+        "--tracks",
+        action="store_true",
+        help="Also write the wingbeat frequency over time of every particle (sliding DFT).",
     )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=CACHE_MAX_BYTES / 1024**2,
+        help="Size (MB) of the cache of counts, spectra and peaks per folder; 0 disables it.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes rendering the PDF report pages (0 uses every core).",
+    )
+    args = parser.parse_args()
+    input_path = args.input
+
+    if os.path.isdir(input_path):
+        # Process all files in the directory
+        all_peak_freqs = []
+        dict_peak_freqs = {}
+        dict_file_names = {}
+        for folder_name in FOLDERS:
+            event_num_list, folder_file_names, folder_peak_freqs, spectra = process_folder(
+                input_path,
+                folder_name,
+                args.welch,
+                args.zoom,
+                args.tracks,
+                int(args.cache_size * 1024**2),
+            )
+
+            dict_peak_freqs[folder_name] = folder_peak_freqs
+            dict_file_names[folder_name] = folder_file_names
+
+            all_peak_freqs.append(folder_peak_freqs)
+
+            output_pdf_path = os.path.join(
+                input_path, f"{folder_name}_analysis.pdf"
+            )
+            plot_and_save_time_series_fft_to_pdf(
+                folder_name,
+                event_num_list,
+                folder_file_names,
+                output_pdf_path,
+                spectra,
+                args.jobs if args.jobs > 0 else os.cpu_count(),
+            )
+
+        # Save violin plot to a single PDF
+        violin_pdf_path = os.path.join(input_path, "peak_frequency_comparison.pdf")
+        plot_and_save_violin_to_pdf(all_peak_freqs, violin_pdf_path, DATA_LABELS)
+
+        # Save data to CSV (including peak frequency and file names)
+        df_peak_freqs = pd.DataFrame(
+            dict([(k, pd.Series(v)) for k, v in dict_peak_freqs.items()])
+        )
+        print(df_peak_freqs)
+        df_file_names = pd.DataFrame(
+            dict([(k + "_file", pd.Series(v)) for k, v in dict_file_names.items()])
+        )
 
-    # Combine file names and peak frequencies into one DataFrame
-    df_combined = pd.concat([df_peak_freqs, df_file_names], axis=1)
+        # Combine file names and peak frequencies into one DataFrame
+        df_combined = pd.concat([df_peak_freqs, df_file_names], axis=1)
 
-    # Save the results to "peak_freqs.csv"
-    df_combined.to_csv(os.path.join(input_path, "peak_freqs.csv"))
+        # Save the results to "peak_freqs.csv"
+        df_combined.to_csv(os.path.join(input_path, "peak_freqs.csv"))
 
-elif os.path.isfile(input_path) and input_path.endswith(".pkl"):
-    print(f"Processing file: {input_path}")
-    process_pickle_file(input_path)
-else:
-    print(f"Error: {input_path} is not a valid pickle file or directory.")
+    elif os.path.isfile(input_path) and input_path.endswith(RESULTS_EXTENSIONS):
+        print(f"Processing file: {input_path}")
+        process_pickle_file(input_path, args.tracks)
+    else:
+        print(f"Error: {input_path} is not a valid results file or directory.")
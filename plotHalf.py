@@ -4,6 +4,9 @@ import matplotlib.pyplot as plt
 import argparse
 import os
 
+from particle_results import RESULTS_EXTENSION, load_split_results
+from plot_lod import MAX_POINTS, stratified_sample
+
 plt.rcParams.update({
     'lines.linewidth': 2,
     'grid.linestyle': '--',
@@ -17,22 +20,40 @@ plt.rcParams.update({
     'figure.figsize': (12, 8),
 })
 
-parser = argparse.ArgumentParser(description='Plot paired upper/lower event trajectories.')
-parser.add_argument('-i', '--input', required=True, help='Path to the directory containing upper and lower folders.')
-parser.add_argument('--2d', dest='plot_2d', action='store_true', help='Plot in 2D instead of 3D.')
-args = parser.parse_args()
+max_points = MAX_POINTS  # Events drawn per upper/lower set at most
 
-def load_points(events_path):
-    with open(events_path, 'rb') as f:
-        events = np.asarray(pickle.load(f), dtype=np.float32)
+def sample_points(events):
+    """(time in ms, x, y) of an (M, 3) x, y, time event set, at most max_points of them spread through time"""
+    events = np.asarray(events, dtype=np.float32)
     if events.size == 0:
         return np.empty((0, 3), dtype=np.float32)
+    events = events[stratified_sample(events[:, 2], max_points)]
     return np.column_stack((events[:, 2] * 1e-3, events[:, 0], events[:, 1]))
 
+def load_points(events_path):
+    """sample_points of a pickled event set"""
+    with open(events_path, 'rb') as f:
+        return sample_points(pickle.load(f))
+
 def process_event_pair(upper_file, lower_file, outputs_dir, plot_2d=False):
-    upper_points = load_points(upper_file)
-    lower_points = load_points(lower_file)
+    base_name = os.path.basename(upper_file).replace('_upper.pkl', '')
+    if not base_name:
+        base_name = os.path.splitext(os.path.basename(upper_file))[0]
+    plot_event_pair(load_points(upper_file), load_points(lower_file), outputs_dir, base_name, plot_2d)
 
+
+def process_split_file(split_file, outputs_dir, plot_2d=False):
+    """Plot the upper/lower sets of every particle of a split file (splitTrajectory.py --all-particles)"""
+    halves, _ = load_split_results(split_file)
+    base_filename = os.path.splitext(os.path.basename(split_file))[0]
+    for particle_id, (upper_events, lower_events) in halves.items():
+        print(f'Processing particle {particle_id} of {split_file}')
+        plot_event_pair(sample_points(upper_events), sample_points(lower_events), outputs_dir,
+                        f'{base_filename}_particle{particle_id}', plot_2d)
+
+
+def plot_event_pair(upper_points, lower_points, outputs_dir, base_name, plot_2d=False):
+    """Save <base_name>_trajectory.png of the sample_points of an upper and a lower set"""
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111) if plot_2d else fig.add_subplot(111, projection='3d')
 
@@ -73,9 +94,6 @@ def process_event_pair(upper_file, lower_file, outputs_dir, plot_2d=False):
     plt.tight_layout()
 
     os.makedirs(outputs_dir, exist_ok=True)
-    base_name = os.path.basename(upper_file).replace('_upper.pkl', '')
-    if not base_name:
-        base_name = os.path.splitext(os.path.basename(upper_file))[0]
     output_image_file = os.path.join(outputs_dir, f'{base_name}_trajectory.png')
     plt.savefig(output_image_file)
     plt.close(fig)
@@ -84,9 +102,17 @@ def process_event_pair(upper_file, lower_file, outputs_dir, plot_2d=False):
 def process_directory(input_directory, outputs_dir, plot_2d=False):
     upper_dir = os.path.join(input_directory, 'upper')
     lower_dir = os.path.join(input_directory, 'lower')
+    split_dir = os.path.join(input_directory, 'split')
+
+    split_files = []
+    if os.path.isdir(split_dir):
+        split_files = sorted(f for f in os.listdir(split_dir) if f.endswith(RESULTS_EXTENSION))
+        for filename in split_files:
+            process_split_file(os.path.join(split_dir, filename), outputs_dir, plot_2d)
 
     if not os.path.isdir(upper_dir) or not os.path.isdir(lower_dir):
-        print("Error: 'upper' and 'lower' directories do not exist in the specified path.")
+        if not split_files:
+            print("Error: neither 'upper' and 'lower' directories nor split files exist in the specified path.")
         return
 
     upper_files = sorted(f for f in os.listdir(upper_dir) if f.endswith('_upper.pkl'))
@@ -105,11 +131,19 @@ def process_directory(input_directory, outputs_dir, plot_2d=False):
         process_event_pair(upper_map[key], lower_map[key], outputs_dir, plot_2d)
 
 
-input_path = args.input
-plot_2d = args.plot_2d
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot paired upper/lower event trajectories.')
+    parser.add_argument('-i', '--input', required=True, help='Path to the directory containing upper and lower folders, or a split folder.')
+    parser.add_argument('--2d', dest='plot_2d', action='store_true', help='Plot in 2D instead of 3D.')
+    parser.add_argument('--max-points', type=int, default=max_points, help='Events drawn per upper/lower set at most.')
+    args = parser.parse_args()
+    max_points = args.max_points
 
-if os.path.isdir(input_path):
-    outputs_dir = os.path.join(input_path, 'outputs')
-    process_directory(input_path, outputs_dir, plot_2d=plot_2d)
-else:
-    print(f'Error: {input_path} is not a valid directory.')
+    input_path = args.input
+    plot_2d = args.plot_2d
+
+    if os.path.isdir(input_path):
+        outputs_dir = os.path.join(input_path, 'outputs')
+        process_directory(input_path, outputs_dir, plot_2d=plot_2d)
+    else:
+        print(f'Error: {input_path} is not a valid directory.')
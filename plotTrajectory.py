@@ -1,9 +1,11 @@
 import numpy as np
-import pickle
 import matplotlib.pyplot as plt
 import argparse
 import os
 
+from particle_results import RESULTS_EXTENSIONS, open_results, results_files
+from plot_lod import MAX_POINTS, MAX_VERTICES, simplify_polyline, stratified_sample
+
 plt.rcParams.update({
     'lines.linewidth': 2,
     'grid.linestyle': '--',
@@ -17,49 +19,39 @@ plt.rcParams.update({
     'figure.figsize': (12, 8),
 })
 
-parser = argparse.ArgumentParser(description='Particle tracking script.')
-parser.add_argument('-i', '--input', required=True, help='Path to the input pickle file or directory.')
-args = parser.parse_args()
-
 sampling_ratio = 0.5
+max_points = MAX_POINTS  # Events drawn per particle at most
+max_vertices = MAX_VERTICES  # Vertices of a centroid trajectory at most
 
 def process_pickle_file(particle_output_file, outputs_dir):
     os.makedirs(outputs_dir, exist_ok=True)
 
     base_filename = os.path.basename(particle_output_file)
-    base_filename = '_'.join(base_filename.split('_')[3:]).replace('.pkl', '')
+    base_filename = '_'.join(os.path.splitext(base_filename)[0].split('_')[3:])
     if not base_filename:
         base_filename = os.path.splitext(os.path.basename(particle_output_file))[0]
 
-    with open(particle_output_file, 'rb') as f:
-        particle_data = pickle.load(f)
-
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111, projection='3d')
 
-    for particle_id, particle_info in particle_data.items():
-        if 'centroid_history' in particle_info:
-            centroid_history = np.array(particle_info['centroid_history'])
+    with open_results(particle_output_file) as results:
+        for particle_id, num_events in sorted(results.event_counts().items()):
+            centroid_history = results.centroid_history(particle_id)
 
             if len(centroid_history) > 1:
+                centroid_history = centroid_history[simplify_polyline(centroid_history, max_vertices)]
                 ax.plot(centroid_history[:, 0] * 1e-3, centroid_history[:, 1], centroid_history[:, 2], label=f'Particle {particle_id} Centroid Trajectory')
 
-        events = particle_info.get('events', [])
-        if events:
-            event_coords = np.array(events)
-            event_times = event_coords[:, 2] * 1e-3
+            if num_events:
+                # Only the times and the sampled events are read from the mapped file
+                event_x, event_y, event_t = results.event_columns(particle_id)
 
-            num_events = len(events)
-            if sampling_ratio < 1.0:
-                sample_size = int(num_events * sampling_ratio)
+                sample_size = min(int(num_events * sampling_ratio), max_points)
                 if sample_size > 0:
-                    sampled_indices = np.random.choice(num_events, sample_size, replace=False)
-                    sampled_events = event_coords[sampled_indices]
-                    sampled_event_times = event_times[sampled_indices]
-                    
-                    ax.scatter(sampled_event_times, sampled_events[:, 0], sampled_events[:, 1], alpha=0.3, marker='.')
-            else:
-                ax.scatter(event_times, event_coords[:, 0], event_coords[:, 1], alpha=0.3, marker='.')
+                    sampled_indices = stratified_sample(event_t, sample_size)
+                    sampled_event_times = event_t[sampled_indices] * 1e-3
+
+                    ax.scatter(sampled_event_times, event_x[sampled_indices], event_y[sampled_indices], alpha=0.3, marker='.')
 
     ax.set_xlabel('Time (milliseconds)')
     ax.set_ylabel('X Coordinate (pixels)')
@@ -74,18 +66,26 @@ def process_pickle_file(particle_output_file, outputs_dir):
     plt.savefig(output_image_file)
     plt.close()
 
-input_path = args.input
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Particle tracking script.')
+    parser.add_argument('-i', '--input', required=True, help='Path to the input particle tracking results (.npz or legacy .pkl) or directory.')
+    parser.add_argument('--max-points', type=int, default=max_points, help='Events drawn per particle at most.')
+    parser.add_argument('--max-vertices', type=int, default=max_vertices, help='Vertices of a centroid trajectory at most.')
+    args = parser.parse_args()
+    max_points = args.max_points
+    max_vertices = args.max_vertices
+
+    input_path = args.input
 
-if os.path.isdir(input_path):
-    outputs_dir = os.path.join(input_path, 'outputs')
-    for filename in os.listdir(input_path):
-        if filename.endswith('.pkl'):
+    if os.path.isdir(input_path):
+        outputs_dir = os.path.join(input_path, 'outputs')
+        for filename in results_files(os.listdir(input_path)):
             file_path = os.path.join(input_path, filename)
             print(f"Processing file: {file_path}")
             process_pickle_file(file_path, outputs_dir)
-elif os.path.isfile(input_path) and input_path.endswith('.pkl'):
-    outputs_dir = os.path.join(os.path.dirname(input_path), 'outputs')
-    print(f"Processing file: {input_path}")
-    process_pickle_file(input_path, outputs_dir)
-else:
-    print(f"Error: {input_path} is not a valid pickle file or directory.")
+    elif os.path.isfile(input_path) and input_path.endswith(RESULTS_EXTENSIONS):
+        outputs_dir = os.path.join(os.path.dirname(input_path), 'outputs')
+        print(f"Processing file: {input_path}")
+        process_pickle_file(input_path, outputs_dir)
+    else:
+        print(f"Error: {input_path} is not a valid results file or directory.")
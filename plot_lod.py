@@ -0,0 +1,57 @@
+import numpy as np
+
+MAX_POINTS = 20000  # Events drawn per particle (or per event set) at most
+MAX_VERTICES = 1000  # Vertices of a simplified centroid trajectory at most
+
+
+def stratified_sample(times, max_points=MAX_POINTS):
+    """Ascending indices of at most max_points events spread through time.
+
+    The events, in time order, are split into max_points strata of equal size and the
+    middle event of each is kept: the sample is deterministic and busy periods keep
+    their share of points. Only unsorted times (e.g. merged particles) are sorted"""
+    num_events = len(times)
+    if num_events <= max_points:
+        return np.arange(num_events)
+    if max_points <= 0:
+        return np.arange(0)
+    ranks = ((np.arange(max_points) + 0.5) * (num_events / max_points)).astype(np.int64)
+    times = np.asarray(times)
+    if np.all(times[1:] >= times[:-1]):
+        return ranks
+    order = np.argsort(times, kind='stable')
+    return np.sort(order[ranks])
+
+
+def simplify_polyline(points, max_vertices=MAX_VERTICES):
+    """Ascending indices of at most max_vertices vertices of an (N, D) polyline, chosen by
+    Largest-Triangle-Three-Buckets: the first and last vertices are kept and, in each of
+    max_vertices - 2 buckets of the others, the vertex forming the largest triangle with
+    the vertex kept before and the mean of the next bucket. Every axis is scaled to its
+    range first, so time and pixels weigh the same"""
+    points = np.asarray(points, dtype=np.float64)
+    num_points = len(points)
+    if num_points <= max_vertices:
+        return np.arange(num_points)
+    if max_vertices < 3:
+        return np.array([0, num_points - 1])[:max(max_vertices, 0)]
+
+    span = np.ptp(points, axis=0)
+    points = (points - points.min(axis=0)) / np.where(span > 0, span, 1)
+    edges = np.linspace(1, num_points - 1, max_vertices - 1).astype(np.int64)
+
+    kept = np.empty(max_vertices, dtype=np.int64)
+    kept[0], kept[-1] = 0, num_points - 1
+    for bucket in range(max_vertices - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            following = points[stop:edges[bucket + 2]].mean(axis=0)
+        else:
+            following = points[-1]
+        previous = points[kept[bucket]]
+        # Squared triangle areas (times 4) in any dimension: |u|^2 |v|^2 - (u.v)^2
+        u = points[start:stop] - previous
+        v = following - previous
+        areas = np.einsum('ij,ij->i', u, u) * v.dot(v) - (u @ v) ** 2
+        kept[bucket + 1] = start + int(np.argmax(areas))
+    return kept
@@ -1,8 +1,18 @@
+from functools import lru_cache
+
 import numpy as np
+from scipy.signal import ZoomFFT
+
+from detect_peaks import FILTER_LOW, FILTER_HIGH, batch_peak_detection, batch_detect_wingfreq
 
 # Set constants
 FS = 1000  # Sampling frequency (Hz)
 WINDOW_LENGTH = 4096  # FFT window length
+WELCH_OVERLAP = 0.5  # Overlap of consecutive segments of the Welch spectrum
+WELCH_CHUNK = 65536  # Samples handed to WelchSpectrum at once by welch_spectrum
+ZOOM_RESOLUTION = 0.05  # Frequency step of the zoom spectrum (Hz)
+SDFT_WINDOW = 1000  # Window of the sliding DFT (samples); its bins are FS / SDFT_WINDOW apart
+SDFT_HOP = 50  # Samples between two points of a wingbeat track
 
 
 def preprocess_time_series(time_series):
@@ -31,3 +41,233 @@ def compute_fft(time_series, win_len=WINDOW_LENGTH, fs=FS):
     return freqs[: win_len // 2], 20 * np.log(
         np.abs(fft_result)[: win_len // 2]
     )
+
+
+@lru_cache(maxsize=None)
+def hanning_window(length):
+    """Hanning window of the given length, computed once per length"""
+    window = np.hanning(length)
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=None)
+def fft_frequencies(win_len=WINDOW_LENGTH, fs=FS):
+    """Frequency axis of compute_fft / batch_fft, computed once per window length"""
+    freqs = np.fft.rfftfreq(win_len, d=1 / fs)[: win_len // 2]
+    freqs.flags.writeable = False
+    return freqs
+
+
+def stack_time_series(series_list, target_length=WINDOW_LENGTH):
+    """Preprocess each time series (as preprocess_time_series does, over its full
+    length) and stack them into one zero-padded (n_series, target_length) array"""
+    batch = np.zeros((len(series_list), target_length))
+    for row, time_series in zip(batch, series_list):
+        time_series = np.asarray(time_series, dtype=float)
+        used = min(len(time_series), target_length)
+        if used == 0:
+            continue
+        window = hanning_window(len(time_series))[:used]
+        row[:used] = (time_series[:used] - np.mean(time_series)) * window
+    return batch
+
+
+def batch_fft(batch, win_len=WINDOW_LENGTH, fs=FS):
+    """compute_fft of every row of a stacked batch with a single real FFT.
+    Returns the frequency axis and an (n_series, win_len // 2) amplitude array"""
+    fft_result = np.fft.rfft(batch, n=win_len, axis=-1)[..., : win_len // 2]
+    with np.errstate(divide="ignore"):
+        amplitude = 20 * np.log(np.abs(fft_result))
+    return fft_frequencies(win_len, fs), amplitude
+
+
+@lru_cache(maxsize=None)
+def zoom_transform(
+    win_len=WINDOW_LENGTH, f_low=FILTER_LOW, f_high=FILTER_HIGH, resolution=ZOOM_RESOLUTION, fs=FS
+):
+    """Chirp-z transform evaluating the spectrum of win_len samples from f_low to
+    f_high (both included) every resolution Hz, built once per setting.
+    Returns the transform and its read-only frequency axis"""
+    num_freqs = int(round((f_high - f_low) / resolution)) + 1
+    transform = ZoomFFT(win_len, [f_low, f_high], num_freqs, fs=fs, endpoint=True)
+    freqs = np.linspace(f_low, f_high, num_freqs)
+    freqs.flags.writeable = False
+    return transform, freqs
+
+
+def zoom_fft(
+    batch, f_low=FILTER_LOW, f_high=FILTER_HIGH, resolution=ZOOM_RESOLUTION, fs=FS
+):
+    """Spectrum of every row of a stacked batch (see stack_time_series) in the band
+    f_low..f_high only, at a resolution finer than fs / win_len without zero-padding
+    to a longer FFT. Amplitudes are on the scale of compute_fft; returns the
+    frequency axis and an (n_series, n_freqs) amplitude array"""
+    transform, freqs = zoom_transform(batch.shape[-1], f_low, f_high, resolution, fs)
+    with np.errstate(divide="ignore"):
+        amplitude = 20 * np.log(np.abs(transform(batch, axis=-1)))
+    return freqs, amplitude
+
+
+class WelchSpectrum:
+    """Averaged periodogram (Welch) of a time series fed in chunks of any size.
+
+    Every win_len segment, shifted by win_len * (1 - overlap), has its mean removed and
+    is Hanning windowed; the power spectra are summed as the chunks arrive, so only
+    the samples of an unfinished segment are kept whatever the series length.
+    spectrum() returns the frequency axis and the amplitude on the scale of
+    compute_fft (20 * log of the RMS magnitude); a series shorter than one segment
+    gets compute_fft's zero-padded spectrum"""
+
+    def __init__(self, win_len=WINDOW_LENGTH, fs=FS, overlap=WELCH_OVERLAP):
+        self.win_len = win_len
+        self.fs = fs
+        self.step = max(1, int(round(win_len * (1 - overlap))))
+        self.power = np.zeros(win_len // 2)
+        self.segments = 0
+        self.pending = np.empty(0)
+
+    def update(self, chunk):
+        samples = np.concatenate((self.pending, np.asarray(chunk, dtype=float)))
+        num_segments = (
+            (len(samples) - self.win_len) // self.step + 1
+            if len(samples) >= self.win_len
+            else 0
+        )
+        if num_segments:
+            segments = np.lib.stride_tricks.sliding_window_view(samples, self.win_len)
+            segments = segments[:: self.step][:num_segments]
+            segments = (segments - segments.mean(axis=1, keepdims=True)) * hanning_window(
+                self.win_len
+            )
+            spectra = np.fft.rfft(segments, axis=1)[:, : self.win_len // 2]
+            self.power += np.sum(spectra.real**2 + spectra.imag**2, axis=0)
+            self.segments += num_segments
+        self.pending = samples[num_segments * self.step :].copy()
+        return self
+
+    def spectrum(self):
+        if self.segments == 0:
+            if len(self.pending) == 0:
+                return fft_frequencies(self.win_len, self.fs), np.full(self.win_len // 2, -np.inf)
+            return compute_fft(
+                pad_time_series(preprocess_time_series(self.pending), self.win_len),
+                self.win_len,
+                self.fs,
+            )
+        with np.errstate(divide="ignore"):
+            amplitude = 10 * np.log(self.power / self.segments)
+        return fft_frequencies(self.win_len, self.fs), amplitude
+
+
+def welch_spectrum(time_series, win_len=WINDOW_LENGTH, fs=FS, overlap=WELCH_OVERLAP):
+    """WelchSpectrum of a whole series, read WELCH_CHUNK samples at a time (so a
+    memory-mapped series is never loaded as a whole)"""
+    if not isinstance(time_series, np.ndarray):
+        time_series = np.asarray(time_series)
+    welch = WelchSpectrum(win_len, fs, overlap)
+    for start in range(0, len(time_series), WELCH_CHUNK):
+        welch.update(time_series[start : start + WELCH_CHUNK])
+    return welch.spectrum()
+
+
+def batch_welch(series_list, win_len=WINDOW_LENGTH, fs=FS, overlap=WELCH_OVERLAP):
+    """welch_spectrum of every series, stacked as batch_fft stacks its spectra"""
+    amplitude = np.empty((len(series_list), win_len // 2))
+    for row, time_series in zip(amplitude, series_list):
+        _, row[:] = welch_spectrum(time_series, win_len, fs, overlap)
+    return fft_frequencies(win_len, fs), amplitude
+
+
+class SlidingDFT:
+    """Hanning-windowed DFT of the last win_len samples, in the bins between f_low
+    and f_high only, updated as samples arrive.
+
+    Each new sample updates the bins recursively (X <- (X - oldest + newest) * e^(2pi j k / N)),
+    so a sample costs one operation per bin whatever the window length; a chunk of
+    samples is applied at once with a cumulative sum. The window is applied in the
+    frequency domain (0.5 X[k] - 0.25 (X[k-1] + X[k+1])), which also cancels the
+    mean of the counts in every band bin"""
+
+    def __init__(self, win_len=SDFT_WINDOW, f_low=FILTER_LOW, f_high=FILTER_HIGH, fs=FS):
+        self.win_len = win_len
+        band = np.arange(int(np.ceil(f_low * win_len / fs)), int(f_high * win_len / fs) + 1)
+        self.freqs = band * fs / win_len
+        # One more bin on each side for the window
+        self.bins = np.arange(band[0] - 1, band[-1] + 2)
+        # e^(2pi j k m / N) for every offset m in the window
+        self.twiddle = np.exp(2j * np.pi / win_len * np.outer(np.arange(win_len), self.bins))
+        self.state = np.zeros(len(self.bins), dtype=complex)
+        self.history = np.zeros(win_len)
+        self.samples = 0
+
+    def update(self, samples):
+        """Add samples; returns the complex bins after each of them, an
+        (n_samples, n_bins) array to pass to amplitude for the rows needed"""
+        samples = np.asarray(samples, dtype=float)
+        window = np.concatenate((self.history, samples))
+        change = samples - window[: len(samples)]
+
+        # X(n0 + r) = e^(2pi j k r / N) * (X(n0) + sum_{i <= r} e^(-2pi j k (i - 1) / N) * change_i)
+        steps = np.arange(len(samples)) % self.win_len
+        states = self.twiddle[(steps + 1) % self.win_len] * (
+            self.state + np.cumsum(self.twiddle[steps].conj() * change[:, None], axis=0)
+        )
+        if len(samples):
+            self.state = states[-1]
+        self.history = window[len(window) - self.win_len :]
+        self.samples += len(samples)
+        return states
+
+    @staticmethod
+    def amplitude(states):
+        """Amplitude spectrum (on the scale of compute_fft) of bins returned by update,
+        an (n_rows, n_freqs) array. Kept out of update, as the window, magnitude and
+        log cost more than the recursive update and are only needed at a hop"""
+        windowed = 0.5 * states[:, 1:-1] - 0.25 * (states[:, :-2] + states[:, 2:])
+        with np.errstate(divide="ignore"):
+            return 20 * np.log(np.abs(windowed))
+
+
+class WingbeatTracker:
+    """Wingbeat frequency over time from 1 ms event counts fed as they arrive: every
+    hop samples, the peaks of the SlidingDFT spectrum go through batch_peak_detection
+    and batch_detect_wingfreq. Times are the centres of the windows (s), as in
+    scipy.signal.spectrogram; frequencies are NaN where no peak is found"""
+
+    def __init__(self, win_len=SDFT_WINDOW, hop=SDFT_HOP, fs=FS):
+        self.sdft = SlidingDFT(win_len, fs=fs)
+        self.hop = hop
+        self.fs = fs
+
+    @property
+    def freqs(self):
+        return self.sdft.freqs
+
+    def update(self, samples):
+        """Add counts; returns the times and wingbeat frequencies of the windows
+        completed by them (empty until a full window has been seen)"""
+        first = self.sdft.samples
+        states = self.sdft.update(samples)
+        ends = np.arange(first + 1, self.sdft.samples + 1)
+        frames = (ends % self.hop == 0) & (ends >= self.sdft.win_len)
+        times = (ends[frames] - self.sdft.win_len / 2) / self.fs
+        if not frames.any():
+            return times, np.empty(0)
+
+        freqs = self.sdft.freqs
+        peak_indices, max_peak_idx = batch_peak_detection(self.sdft.amplitude(states[frames]), freqs)
+        peak_freqs = np.where(peak_indices >= 0, freqs[peak_indices], np.nan)
+        max_peak_freq = np.where(max_peak_idx >= 0, freqs[max_peak_idx], np.nan)
+        return times, batch_detect_wingfreq(peak_freqs, max_peak_freq)
+
+
+def wingbeat_track(time_series, win_len=SDFT_WINDOW, hop=SDFT_HOP, fs=FS):
+    """WingbeatTracker over a whole series, fed WELCH_CHUNK samples at a time"""
+    tracker = WingbeatTracker(win_len, hop, fs)
+    times, wingfreqs = [np.empty(0)], [np.empty(0)]
+    for start in range(0, len(time_series), WELCH_CHUNK):
+        chunk_times, chunk_freqs = tracker.update(time_series[start : start + WELCH_CHUNK])
+        times.append(chunk_times)
+        wingfreqs.append(chunk_freqs)
+    return np.concatenate(times), np.concatenate(wingfreqs)
@@ -7,7 +7,8 @@ ext_modules = [
         'particle_tracking',  # Module name
         ['particle_tracking.cpp'],  # C++ source file to compile
         include_dirs=[pybind11.get_include()],  # Directory for pybind11 header files
-        extra_compile_args=['-O3', '-std=c++11'],  # Add options to enable C++11 and optimization
+        extra_compile_args=['-O3', '-std=c++11', '-pthread'],  # Add options to enable C++11, optimization and threads
+        extra_link_args=['-pthread'],  # Tiled tracking runs tiles on std::thread
     ),
 ]
 
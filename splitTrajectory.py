@@ -2,11 +2,14 @@ import numpy as np
 import pickle
 from scipy.signal import savgol_filter
 import argparse
+import functools
+import itertools
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-parser = argparse.ArgumentParser(description='Split the densest particle trajectory into upper and lower event sets.')
-parser.add_argument('-i', '--input', required=True, help='Path to the input pickle file or directory.')
-args = parser.parse_args()
+from particle_results import RESULTS_EXTENSION, RESULTS_EXTENSIONS, open_results, results_files, save_split_results
+
+BATCHES_PER_JOB = 4  # Batches of particles handed to each worker process, to balance their load
 
 
 def compute_smoothed_centroid(centroid_history):
@@ -27,6 +30,52 @@ def compute_smoothed_centroid(centroid_history):
     return smoothed_x, smoothed_y
 
 
+def nearest_time_index(times, query_times):
+    """Index of the entry of times nearest to each query time, the same as np.argmin(np.abs(times - t)) for every t
+    (the first entry on ties). Sorted times (as in centroid histories) are searched in O(log len(times)) per query"""
+    times = np.asarray(times)
+    query_times = np.asarray(query_times)
+    num_times = len(times)
+    if np.any(times[1:] < times[:-1]):
+        # Unsorted times: brute force, in blocks of query times to bound the memory
+        index = np.empty(len(query_times), dtype=np.intp)
+        block = max(1, (1 << 22) // num_times)
+        for start in range(0, len(query_times), block):
+            index[start:start + block] = np.argmin(np.abs(times[None, :] - query_times[start:start + block, None]), axis=1)
+        return index
+
+    # Nearest entry at or after each query time, and the one before it
+    right = np.searchsorted(times, query_times, side='left')
+    left = right - 1
+    right_index = np.minimum(right, num_times - 1)
+    left_index = np.maximum(left, 0)
+    right_distance = np.where(right < num_times, np.abs(times[right_index] - query_times), np.inf)
+    left_distance = np.where(left >= 0, np.abs(times[left_index] - query_times), np.inf)
+    take_left = left_distance <= right_distance
+    index = np.where(take_left, left_index, right_index)
+
+    # argmin returns the first entry at the minimum distance. On the right that is right itself (searchsorted returns
+    # the first of equal times); on the left, step back to the first of equal times, then over earlier times whose
+    # rounded distance is the same
+    left_query = query_times[take_left]
+    left_min = left_distance[take_left]
+    first = np.searchsorted(times, times[index[take_left]], side='left')
+    tied = (first > 0) & (np.abs(times[np.maximum(first - 1, 0)] - left_query) == left_min)
+    if np.any(tied):
+        # Bisect for the first entry whose distance equals the minimum (distances do not increase up to the left entry)
+        low = np.zeros(np.count_nonzero(tied), dtype=np.intp)
+        high = first[tied] - 1
+        tied_query, tied_min = left_query[tied], left_min[tied]
+        while np.any(low < high):
+            middle = (low + high) // 2
+            at_minimum = np.abs(times[middle] - tied_query) <= tied_min
+            high = np.where(at_minimum, middle, high)
+            low = np.where(at_minimum, low, middle + 1)
+        first[tied] = low
+    index[take_left] = first
+    return index
+
+
 def split_events_by_centroid(particle_info):
     events = np.asarray(particle_info.get('events', []), dtype=np.float32)
     if events.size == 0 or 'centroid_history' not in particle_info:
@@ -36,18 +85,32 @@ def split_events_by_centroid(particle_info):
     if centroid_history.shape[0] == 0:
         return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.float32)
 
-    smoothed_x, smoothed_y = compute_smoothed_centroid(centroid_history)
+    is_upper = upper_mask(centroid_history, events[:, 1], events[:, 2])
+    return events[is_upper], events[~is_upper]
+
 
-    upper_events = []
-    lower_events = []
-    for event in events:
-        time_index = int(np.argmin(np.abs(centroid_history[:, 0] - event[2])))
-        if event[1] > smoothed_y[time_index]:
-            upper_events.append(event)
-        else:
-            lower_events.append(event)
+def upper_mask(centroid_history, event_y, event_t):
+    """Whether each event lies above the smoothed centroid path (at the nearest centroid time)"""
+    _, smoothed_y = compute_smoothed_centroid(centroid_history)
+    return event_y > smoothed_y[nearest_time_index(centroid_history[:, 0], event_t)]
+
+
+def particle_upper_mask(results, particle_id):
+    """upper_mask of a particle of a ParticleResults, read from its columns, or None when it has no centroid history
+    (split_events_by_centroid then drops its events)"""
+    centroid_history = np.asarray(results.centroid_history(particle_id), dtype=np.float32)
+    if centroid_history.shape[0] == 0:
+        return None
+    _, event_y, event_t = results.event_columns(particle_id)
+    return upper_mask(centroid_history, event_y, event_t)
 
-    return np.asarray(upper_events, dtype=np.float32), np.asarray(lower_events, dtype=np.float32)
+
+def packed_upper_masks(results_file, particle_ids):
+    """particle_upper_mask of particle_ids, packed to one bit per event. Runs in a worker process on its own mapping
+    of the results file, so only the IDs and the packed masks cross the process boundary"""
+    with open_results(results_file) as results:
+        masks = [particle_upper_mask(results, particle_id) for particle_id in particle_ids]
+    return [None if mask is None else np.packbits(mask) for mask in masks]
 
 
 def save_event_sets(output_root, base_filename, particle_id, upper_events, lower_events):
@@ -69,46 +132,99 @@ def save_event_sets(output_root, base_filename, particle_id, upper_events, lower
 
 
 def process_particle_file(pickle_file, output_root):
-    with open(pickle_file, 'rb') as f:
-        particle_data = pickle.load(f)
-
-    particle_event_counts = {
-        particle_id: len(info.get('events', []))
-        for particle_id, info in particle_data.items()
-        if len(info.get('events', []))
-    }
-
-    if not particle_event_counts:
-        print(f'Warning: No events found in {pickle_file}')
-        return
+    # Only the offset table is read to find the densest particle; its events are read from the mapped file afterwards
+    with open_results(pickle_file) as results:
+        target_particle = results.densest()
+        if target_particle is None:
+            print(f'Warning: No events found in {pickle_file}')
+            return
 
-    target_particle = max(particle_event_counts, key=particle_event_counts.get)
-    print(f'Processing particle {target_particle} with {particle_event_counts[target_particle]} events')
+        particle_info = results.particle(target_particle)
+    print(f'Processing particle {target_particle} with {len(particle_info["events"])} events')
 
-    upper_events, lower_events = split_events_by_centroid(particle_data[target_particle])
+    upper_events, lower_events = split_events_by_centroid(particle_info)
 
-    base_filename = os.path.basename(pickle_file).replace('.pkl', '')
-    if not base_filename:
-        base_filename = os.path.splitext(os.path.basename(pickle_file))[0]
+    base_filename = os.path.splitext(os.path.basename(pickle_file))[0]
 
     save_event_sets(output_root, base_filename, target_particle, upper_events, lower_events)
 
 
-def process_directory(input_directory, output_root):
-    for filename in sorted(os.listdir(input_directory)):
-        if filename.endswith('.pkl'):
-            file_path = os.path.join(input_directory, filename)
-            print(f'Processing file: {file_path}')
-            process_particle_file(file_path, output_root)
-
-
-input_path = args.input
-
-if os.path.isdir(input_path):
-    process_directory(input_path, input_path)
-elif os.path.isfile(input_path) and input_path.endswith('.pkl'):
-    output_root = os.path.dirname(input_path)
-    print(f'Processing file: {input_path}')
-    process_particle_file(input_path, output_root)
-else:
-    print(f'Error: {input_path} is not a valid pickle file or directory.')
+def split_particles(results, particle_ids, jobs=1, results_file=None):
+    """(upper_events, lower_events) of each of particle_ids (see split_events_by_centroid).
+
+    The smoothing of each centroid path dominates the cost. With jobs > 1 and the path of the columnar results file
+    the masks are computed in up to jobs worker processes, in batches of particles: each worker maps the file itself
+    and returns one bit per event, and the events are sliced here from the parent's mapping. Legacy pickles, which
+    every worker would have to load in full, are split in this process"""
+    if jobs > 1 and len(particle_ids) > 1 and results_file is not None and results_file.endswith(RESULTS_EXTENSION):
+        batches = [batch.tolist() for batch in np.array_split(particle_ids, min(len(particle_ids), jobs * BATCHES_PER_JOB))]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            packed = [mask for masks in executor.map(packed_upper_masks, itertools.repeat(results_file), batches)
+                      for mask in masks]
+        counts = results.event_counts()
+        masks = (None if mask is None else np.unpackbits(mask, count=counts[particle_id]).astype(bool)
+                 for particle_id, mask in zip(particle_ids, packed))
+    else:
+        masks = (particle_upper_mask(results, particle_id) for particle_id in particle_ids)
+
+    halves = []
+    for particle_id, mask in zip(particle_ids, masks):
+        events = results.events(particle_id)
+        if mask is None:
+            events = events[:0]
+            mask = np.zeros(0, dtype=bool)
+        halves.append((events[mask], events[~mask]))
+    return halves
+
+
+def process_all_particles(pickle_file, output_root, min_events=1, jobs=1):
+    """Split every particle with at least min_events events and save all the sets to <output_root>/split/<name>.npz"""
+    with open_results(pickle_file) as results:
+        particle_ids = sorted(particle_id for particle_id, num_events in results.event_counts().items()
+                              if num_events >= max(min_events, 1))
+        if not particle_ids:
+            print(f'Warning: No particles with at least {min_events} events found in {pickle_file}')
+            return
+
+        print(f'Processing {len(particle_ids)} particles with at least {min_events} events')
+        halves = split_particles(results, particle_ids, jobs, pickle_file)
+
+    split_dir = os.path.join(output_root, 'split')
+    os.makedirs(split_dir, exist_ok=True)
+    base_filename = os.path.splitext(os.path.basename(pickle_file))[0]
+    split_file = os.path.join(split_dir, f'{base_filename}{RESULTS_EXTENSION}')
+    save_split_results(split_file, particle_ids, halves, {'source': os.path.basename(pickle_file), 'min_events': min_events})
+
+    print(f'Saved upper and lower events of {len(particle_ids)} particles to {split_file}')
+
+
+def process_directory(input_directory, output_root, process_file=process_particle_file):
+    for filename in results_files(sorted(os.listdir(input_directory))):
+        file_path = os.path.join(input_directory, filename)
+        print(f'Processing file: {file_path}')
+        process_file(file_path, output_root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split the densest particle trajectory into upper and lower event sets.')
+    parser.add_argument('-i', '--input', required=True, help='Path to the input particle tracking results (.npz or legacy .pkl) or directory.')
+    parser.add_argument('--all-particles', action='store_true', help='Split every particle into one file per recording instead of the densest one.')
+    parser.add_argument('--min-events', type=int, default=1, help='With --all-particles, skip particles with fewer events.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='With --all-particles, number of worker processes (0 uses every core).')
+    args = parser.parse_args()
+
+    input_path = args.input
+    if args.all_particles:
+        jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+        process_file = functools.partial(process_all_particles, min_events=args.min_events, jobs=jobs)
+    else:
+        process_file = process_particle_file
+
+    if os.path.isdir(input_path):
+        process_directory(input_path, input_path, process_file)
+    elif os.path.isfile(input_path) and input_path.endswith(RESULTS_EXTENSIONS):
+        output_root = os.path.dirname(input_path)
+        print(f'Processing file: {input_path}')
+        process_file(input_path, output_root)
+    else:
+        print(f'Error: {input_path} is not a valid results file or directory.')
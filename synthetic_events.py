@@ -0,0 +1,102 @@
+import numpy as np
+
+SENSOR_WIDTH = 1280
+SENSOR_HEIGHT = 720
+EVENT_RATE = 20.0  # Mean events per ms emitted by each bat
+NOISE_RATE = 5.0  # Background events per ms over the whole sensor
+DURATION = 3000.0  # Length of a recording (ms)
+WINGBEAT_RANGE = (6.0, 20.0)  # Wingbeat frequencies are drawn uniformly from this range (Hz)
+MODULATION_DEPTH = 0.8  # Relative swing of a bat's event rate over a wingbeat
+BODY_RADIUS = 6.0  # Radius of the disc of body events (pixels)
+WING_SPAN = 12.0  # Horizontal reach of a wing from the body centre (pixels)
+WING_STROKE = 10.0  # Vertical travel of a wing tip from the body centre (pixels)
+BODY_FRACTION = 0.5  # Share of a bat's events emitted by its body, the rest by its wings
+DRIFT = 0.6  # Distance a bat flies over the recording, as a fraction of its cell
+
+
+def bat_paths(num_bats, crossings, duration_us, width=SENSOR_WIDTH, height=SENSOR_HEIGHT):
+    """Start positions (pixels) and velocities (pixels per µs) of bats spread over a grid of cells.
+    A bat drifts horizontally through the middle of its own cell; the first crossings pairs share
+    a cell and fly along its diagonals, so their paths cross at its centre half-way through"""
+    num_cells = num_bats - crossings
+    columns = int(np.ceil(np.sqrt(num_cells * width / height)))
+    rows = int(np.ceil(num_cells / columns))
+    cell = np.array([width / columns, height / rows])
+    centres = np.column_stack(((np.arange(num_cells) % columns + 0.5) * cell[0],
+                               (np.arange(num_cells) // columns + 0.5) * cell[1]))
+
+    offsets = np.zeros((num_bats, 2))
+    offsets[:2 * crossings:2] = [-1, -1]
+    offsets[1:2 * crossings:2] = [-1, 1]
+    offsets[2 * crossings:, 0] = np.where(np.arange(num_bats - 2 * crossings) % 2, 1, -1)
+    cell_index = np.concatenate((np.arange(2 * crossings) // 2, np.arange(crossings, num_cells)))
+    start = centres[cell_index] + offsets * DRIFT / 2 * cell
+    return start, -offsets * DRIFT * cell / duration_us
+
+
+def generate_events(num_bats, event_rate=EVENT_RATE, duration=DURATION, noise_rate=NOISE_RATE, crossings=0,
+                    wingbeat_range=WINGBEAT_RANGE, rng=None, width=SENSOR_WIDTH, height=SENSOR_HEIGHT):
+    """Synthetic event stream of num_bats flapping bats with known wingbeat frequencies.
+
+    Each bat emits event_rate events per ms on average for the whole recording: half from a disc
+    around its body and half along its wings, whose tips move up and down at the bat's wingbeat
+    frequency. The event rate swings by MODULATION_DEPTH over every wingbeat (an inhomogeneous
+    Poisson process), so the event counts of a tracked bat peak at its wingbeat frequency.
+    noise_rate background events per ms fall uniformly over the sensor, and the first crossings
+    pairs of bats fly through each other half-way through the recording (see bat_paths).
+
+    Returns a dict of time-ordered event columns x, y (int32), t (float32, µs) and bat (the index
+    of the emitting bat, -1 for noise), with the ground truth per bat: wingbeat (Hz), start
+    (pixels) and velocity (pixels per µs)"""
+    if not 0 <= 2 * crossings <= num_bats:
+        raise ValueError(f"{crossings} crossing pairs need at least {2 * crossings} bats, not {num_bats}")
+    rng = np.random.default_rng(rng)
+    duration_us = duration * 1e3
+    wingbeat = rng.uniform(*wingbeat_range, num_bats)
+    phase = rng.uniform(0, 2 * np.pi, num_bats)
+    start, velocity = bat_paths(num_bats, crossings, duration_us, width, height)
+
+    xs, ys, ts, bats = [], [], [], []
+    for bat in range(num_bats):
+        # Thinning: candidates at the highest rate, each kept with the relative rate at its time
+        t = rng.uniform(0, duration_us, rng.poisson(event_rate * (1 + MODULATION_DEPTH) * duration))
+        stroke = 2 * np.pi * wingbeat[bat] * t * 1e-6 + phase[bat]
+        keep = rng.uniform(0, 1 + MODULATION_DEPTH, len(t)) < 1 + MODULATION_DEPTH * np.cos(stroke)
+        t, stroke = t[keep], stroke[keep]
+
+        # Body events on a disc; wing events along a line whose tips follow the stroke
+        num_events = len(t)
+        is_body = rng.uniform(0, 1, num_events) < BODY_FRACTION
+        angle = rng.uniform(0, 2 * np.pi, num_events)
+        radius = BODY_RADIUS * np.sqrt(rng.uniform(0, 1, num_events))
+        along = rng.uniform(-1, 1, num_events)
+        dx = np.where(is_body, radius * np.cos(angle), along * WING_SPAN)
+        dy = np.where(is_body, radius * np.sin(angle), np.abs(along) * WING_STROKE * np.sin(stroke))
+        xs.append(start[bat, 0] + velocity[bat, 0] * t + dx)
+        ys.append(start[bat, 1] + velocity[bat, 1] * t + dy)
+        ts.append(t)
+        bats.append(np.full(num_events, bat))
+
+    num_noise = rng.poisson(noise_rate * duration)
+    xs.append(rng.uniform(0, width, num_noise))
+    ys.append(rng.uniform(0, height, num_noise))
+    ts.append(rng.uniform(0, duration_us, num_noise))
+    bats.append(np.full(num_noise, -1))
+
+    t = np.concatenate(ts).astype(np.float32)
+    order = np.argsort(t, kind='stable')
+    return {
+        'x': np.clip(np.concatenate(xs)[order], 0, width - 1).astype(np.int32),
+        'y': np.clip(np.concatenate(ys)[order], 0, height - 1).astype(np.int32),
+        't': t[order],
+        'bat': np.concatenate(bats)[order].astype(np.int32),
+        'wingbeat': wingbeat,
+        'start': start,
+        'velocity': velocity,
+    }
+
+
+def bat_centres(synthetic, t):
+    """(len(t), num_bats, 2) body centres of the bats of a generate_events result at times t (µs)"""
+    t = np.asarray(t, dtype=np.float64)
+    return synthetic['start'] + synthetic['velocity'] * t[:, None, None]
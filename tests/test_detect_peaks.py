@@ -1,5 +1,68 @@
 import numpy as np
-from detect_peaks import peak_detection, custom_peak_detection, detect_wingfreq
+from detect_peaks import (
+    peak_detection, custom_peak_detection, detect_wingfreq,
+    batch_peak_detection, batch_detect_wingfreq,
+    batch_custom_peak_detection, FILTER_LOW, FILTER_HIGH,
+)
+
+
+def loop_custom_peak_detection(fft_amp, fft_fq):
+    """The former pure-Python custom_peak_detection, kept as the reference"""
+    increase_cnter = 0
+    last_amp_point = fft_amp[0]
+    list_peak_idx = []
+
+    for i, amp_point in enumerate(fft_amp):
+        if amp_point > last_amp_point:
+            increase_cnter += 1
+        elif increase_cnter >= 1:
+            fq = fft_fq[i - 1]
+            top_fq = fq * 2
+            bottom_fq = fq / 2
+            peak_flg = 1
+
+            avg_amp = 0.0
+            tmp_cnter = 0
+            for j, fq_point in enumerate(fft_fq):
+                if fq_point <= bottom_fq:
+                    continue
+                elif top_fq < fq_point:
+                    increase_cnter = 0
+                    break
+                elif i == j:
+                    continue
+
+                if fft_amp[j] > last_amp_point:
+                    peak_flg = 0
+                    if j < i:
+                        increase_cnter = 0
+                    break
+
+                avg_amp += fft_amp[j]
+                tmp_cnter += 1
+
+            if peak_flg:
+                avg_amp /= tmp_cnter
+                amp_diff = last_amp_point - avg_amp
+                if (amp_diff > 10.0) and (amp_diff != np.inf):
+                    list_peak_idx.append(i - 1)
+                    increase_cnter = 0
+
+        last_amp_point = amp_point
+
+    if list_peak_idx:
+        # Extract only the largest peak
+        valid_peak_indices = [
+            idx
+            for idx in list_peak_idx
+            if FILTER_LOW <= fft_fq[idx] <= FILTER_HIGH
+        ]
+        if valid_peak_indices:
+
+            max_peak_idx = max(valid_peak_indices, key=lambda idx: fft_amp[idx])
+            # return [max_peak_idx]
+            return valid_peak_indices, max_peak_idx
+    return []
 
 
 def test_peak_detection_multiple_peaks():
@@ -53,3 +116,97 @@ def test_detect_wingfreq_selects_closest_half():
 def test_detect_wingfreq_defaults_to_max_without_harmonics():
     wing = detect_wingfreq([12.0, 15.0, 33.0], 18.0)
     assert wing == 18.0
+
+
+def test_batch_peak_detection_matches_peak_detection():
+    rng = np.random.default_rng(1)
+    freqs = np.arange(0, 50, 0.25)
+    amplitudes = rng.normal(0, 1, (200, len(freqs))) + 40
+    amplitudes[:50, 21::7] = amplitudes[:50, 20::7][:, : amplitudes[:50, 21::7].shape[1]]  # flat tops
+    amplitudes[50:100, 40:60] += 3 * np.sin(np.linspace(0, 6 * np.pi, 20))
+    peak_indices, max_peak_idx = batch_peak_detection(amplitudes, freqs)
+    for row, amplitude in enumerate(amplitudes):
+        peaks, max_idx = peak_detection(amplitude, freqs)
+        assert list(peak_indices[row][peak_indices[row] >= 0]) == list(peaks)
+        assert max_peak_idx[row] == (max_idx if len(peaks) else -1)
+
+
+def test_batch_peak_detection_orders_tied_peaks_as_peak_detection():
+    rng = np.random.default_rng(2)
+    freqs = np.arange(0, 50, 0.25)
+    # Integer-valued spectra: many peaks share the highest heights
+    amplitudes = rng.integers(0, 6, (300, len(freqs))).astype(float) + 40
+    amplitudes[0, 20:] = 40
+    amplitudes[0, [30, 40, 50, 60]] = 45
+    peak_indices, max_peak_idx = batch_peak_detection(amplitudes, freqs)
+    for row, amplitude in enumerate(amplitudes):
+        peaks, max_idx = peak_detection(amplitude, freqs)
+        assert list(peak_indices[row][peak_indices[row] >= 0]) == list(peaks)
+        assert max_peak_idx[row] == (max_idx if len(peaks) else -1)
+
+
+def test_batch_peak_detection_no_peaks():
+    freqs = np.array([0, 2, 4, 6, 8], dtype=float)
+    amplitudes = np.array([[1, 1.5, 2, 2.5, 3]], dtype=float)
+    peak_indices, max_peak_idx = batch_peak_detection(amplitudes, freqs)
+    assert np.all(peak_indices == -1)
+    assert max_peak_idx[0] == -1
+
+
+def test_batch_detect_wingfreq_matches_detect_wingfreq():
+    peak_freqs = [[4.5, 18], [4.2, 4.9], [12.0, 15.0], [9.0, np.nan]]
+    max_peak_freqs = [9.0, 9.0, 18.0, 9.0]
+    wingfreqs = batch_detect_wingfreq(peak_freqs, max_peak_freqs)
+    for row, wing in enumerate(wingfreqs):
+        peaks = [f for f in peak_freqs[row] if not np.isnan(f)]
+        assert wing == detect_wingfreq(peaks, max_peak_freqs[row])
+
+
+def random_spectra(rng, count):
+    """Short spectra on irregular ascending axes: noise, flat steps, spikes and -inf bins"""
+    for trial in range(count):
+        n = int(rng.integers(2, 60))
+        freqs = np.sort(rng.choice(np.arange(0, 40, 0.5), n, replace=False))
+        amplitudes = rng.normal(0, 10, n)
+        if trial % 4 == 1:
+            amplitudes = np.round(amplitudes)
+        elif trial % 4 == 2:
+            amplitudes[rng.integers(0, n, 3)] += rng.uniform(10, 40, 3)
+        elif trial % 4 == 3:
+            amplitudes[rng.integers(0, n, 2)] = -np.inf
+        yield amplitudes, freqs
+
+
+def test_custom_peak_detection_matches_loop():
+    rng = np.random.default_rng(0)
+    found = 0
+    with np.errstate(invalid="ignore"):
+        for amplitudes, freqs in random_spectra(rng, 2000):
+            expected = loop_custom_peak_detection(amplitudes, freqs)
+            result = custom_peak_detection(amplitudes, freqs)
+            if expected:
+                found += 1
+                assert result == (list(expected[0]), expected[1])
+            else:
+                assert result == []
+    assert found > 100
+
+
+def test_batch_custom_peak_detection_matches_loop():
+    rng = np.random.default_rng(1)
+    freqs = np.fft.rfftfreq(1024, d=1 / 1000)[:512]
+    t = np.arange(1024) / 1000
+    amplitudes = np.array([
+        20 * np.log(np.abs(np.fft.rfft(np.sin(2 * np.pi * f * t) + rng.normal(0, 0.5, len(t)))[:512]))
+        for f in rng.uniform(FILTER_LOW, FILTER_HIGH, 20)
+    ])
+    peak_mask, max_peak_idx = batch_custom_peak_detection(amplitudes, freqs)
+    assert peak_mask.shape == amplitudes.shape
+    for row, amplitude in enumerate(amplitudes):
+        expected = loop_custom_peak_detection(amplitude, freqs)
+        if expected:
+            assert np.flatnonzero(peak_mask[row]).tolist() == list(expected[0])
+            assert max_peak_idx[row] == expected[1]
+        else:
+            assert not peak_mask[row].any()
+            assert max_peak_idx[row] == -1
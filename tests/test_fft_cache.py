@@ -0,0 +1,106 @@
+import os
+from unittest import mock
+
+import numpy as np
+
+import fft_cache
+from fft_cache import FFTCache, file_digest
+
+
+def write(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_key_follows_content_and_parameters(tmp_path):
+    first = write(tmp_path / "a.npz", b"events")
+    renamed = write(tmp_path / "b.npz", b"events")
+    other = write(tmp_path / "c.npz", b"other events")
+    with FFTCache(str(tmp_path / "cache")) as cache:
+        key = cache.key(first, {"fs": 1000})
+        assert cache.key(renamed, {"fs": 1000}) == key
+        assert cache.key(other, {"fs": 1000}) != key
+        assert cache.key(first, {"fs": 2000}) != key
+
+
+def test_store_and_load(tmp_path):
+    with FFTCache(str(tmp_path / "cache")) as cache:
+        assert cache.load("missing") is None
+        cache.store("entry", {"counts": np.arange(5), "wingfreq": np.float64(9.5)})
+        entry = cache.load("entry")
+    assert np.array_equal(entry["counts"], np.arange(5))
+    assert entry["wingfreq"] == 9.5
+    assert not [name for name in os.listdir(tmp_path / "cache") if name.endswith(".tmp")]
+
+
+def test_digests_are_reused_until_the_file_changes(tmp_path):
+    path = write(tmp_path / "a.npz", b"events")
+    with FFTCache(str(tmp_path / "cache")) as cache:
+        key = cache.key(path, {})
+
+    with mock.patch.object(fft_cache, "file_digest", wraps=file_digest) as digest:
+        with FFTCache(str(tmp_path / "cache")) as cache:
+            assert cache.key(path, {}) == key
+        assert digest.call_count == 0
+
+        write(path, b"new events")
+        os.utime(path, ns=(0, 0))
+        with FFTCache(str(tmp_path / "cache")) as cache:
+            assert cache.key(path, {}) != key
+        assert digest.call_count == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    arrays = {"counts": np.zeros(1000)}
+    with FFTCache(str(tmp_path / "cache")) as cache:
+        for age, key in enumerate(["old", "used", "new"]):
+            cache.store(key, arrays)
+            os.utime(cache.entry_path(key), ns=(age * 10**9, age * 10**9))
+        # Room for two entries
+        cache.max_bytes = int(2.5 * os.path.getsize(cache.entry_path("old")))
+        cache.load("used")  # Now the most recently used
+        cache.evict()
+        assert cache.load("old") is None
+        assert cache.load("used") is not None and cache.load("new") is not None
+
+
+def test_evicted_entries_leave_the_digest_index(tmp_path):
+    inputs = [write(tmp_path / f"{name}.npz", name.encode()) for name in ["a", "b", "c"]]
+    arrays = {"counts": np.zeros(1000)}
+    with FFTCache(str(tmp_path / "cache")) as cache:
+        keys = [cache.key(path, {}) for path in inputs]
+        for key in keys:
+            cache.store(key, arrays)
+        entry_size = os.path.getsize(cache.entry_path(keys[0]))
+        # Two entries of a (different parameters): its digest stays while one of them is cached
+        second_a = cache.key(inputs[0], {"fs": 2000})
+        cache.store(second_a, arrays)
+        cache.max_bytes = int(3.5 * entry_size)
+        cache.evict()
+        assert cache.load(keys[0]) is None
+        assert sorted(cache.digests) == sorted(os.path.abspath(path) for path in inputs)
+
+        cache.max_bytes = int(1.5 * entry_size)
+        cache.evict()
+        assert cache.load(second_a) is not None
+        assert sorted(cache.digests) == [os.path.abspath(inputs[0])]
+
+    # The index is saved, and a reopened cache knows the entries and their sizes without scanning again
+    with FFTCache(str(tmp_path / "cache"), max_bytes=0) as cache:
+        assert sorted(cache.digests) == [os.path.abspath(inputs[0])]
+        assert cache.total_bytes == entry_size
+        cache.evict()
+        assert cache.digests == {} and cache.total_bytes == 0
+    assert os.listdir(tmp_path / "cache") == ["digests.json"]
+    with FFTCache(str(tmp_path / "cache")) as cache:
+        assert cache.digests == {} and cache.entry_files == {}
+
+
+def test_store_does_not_rescan_the_directory(tmp_path):
+    with FFTCache(str(tmp_path / "cache")) as cache:
+        with mock.patch.object(fft_cache.os, "listdir", wraps=os.listdir) as listdir:
+            for k in range(20):
+                cache.store(f"entry{k}", {"counts": np.arange(k)})
+        assert listdir.call_count == 0
+        assert cache.total_bytes == sum(os.path.getsize(cache.entry_path(f"entry{k}")) for k in range(20))
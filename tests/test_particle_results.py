@@ -0,0 +1,188 @@
+import json
+import pickle
+
+import numpy as np
+import pytest
+
+from particle_results import (COLUMN_DTYPES, RESULTS_FORMAT, columnar_to_particles, load_particles, load_results,
+                              map_npz, open_results, results_files, results_path, save_particles_pickle,
+                              save_results)
+
+
+def dummy_columns():
+    return {
+        'particle_id': np.array([4, 1], dtype=np.int32),
+        'event_offsets': np.array([0, 2, 3], dtype=np.int64),
+        'x': np.array([5, 6, 0], dtype=np.int32),
+        'y': np.array([7, 8, 0], dtype=np.int32),
+        't': np.array([10.0, 20.0, 0.0], dtype=np.float32),
+        'centroid_offsets': np.array([0, 2, 3], dtype=np.int64),
+        'centroid_t': np.array([10.0, 20.0, 0.0], dtype=np.float32),
+        'centroid_x': np.array([5.0, 5.5, 0.0]),
+        'centroid_y': np.array([7.0, 7.5, 0.0]),
+    }
+
+
+def test_results_path_is_next_to_the_event_file():
+    assert results_path("data/rec_1.csv") == "data/particle_tracking_results_both_rec_1.npz"
+    assert results_path("rec_1.npy", ".pkl") == "particle_tracking_results_both_rec_1.pkl"
+
+
+def test_results_files_prefer_the_columnar_copy():
+    files = ["a/particle_tracking_results_both_r1.npz", "a/particle_tracking_results_both_r1.pkl",
+             "a/particle_tracking_results_both_r2.pkl", "a/r1_upper.pkl", "a/notes.txt"]
+    assert results_files(files) == ["a/particle_tracking_results_both_r1.npz", "a/particle_tracking_results_both_r2.pkl",
+                                     "a/r1_upper.pkl"]
+
+
+def test_save_and_load_results_round_trip(tmp_path):
+    path = str(tmp_path / "results.npz")
+    columns = dummy_columns()
+    columns['x'] = columns['x'].astype(np.int64)  # Stored with the typed column dtypes whatever they came in as
+    save_results(path, columns, {'source': "rec.csv", 'parameters': {'sigma_x': 6.0}})
+
+    loaded, metadata = load_results(path)
+    assert set(loaded) == set(COLUMN_DTYPES)
+    for key, dtype in COLUMN_DTYPES.items():
+        assert loaded[key].dtype == dtype
+        assert np.array_equal(loaded[key], dummy_columns()[key])
+    assert metadata['num_particles'] == 2
+    assert metadata['source'] == "rec.csv"
+    assert metadata['parameters'] == {'sigma_x': 6.0}
+
+
+def test_save_results_keeps_the_given_extension(tmp_path):
+    path = tmp_path / "results.particles"
+    save_results(str(path), dummy_columns())
+    assert path.exists()
+    assert load_results(str(path))[0]['particle_id'].tolist() == [4, 1]
+
+
+def test_load_results_rejects_other_npz(tmp_path):
+    path = str(tmp_path / "other.npz")
+    np.savez(path, metadata=np.array(json.dumps({'format': 'something else'})), x=np.zeros(1))
+    with pytest.raises(ValueError):
+        load_results(path)
+
+
+def test_columnar_to_particles_splits_by_offsets():
+    particles = columnar_to_particles(dummy_columns())
+    assert list(particles) == [1, 4]
+    assert np.array_equal(particles[1]['events'], [[0, 0, 0.0]])
+    assert np.array_equal(particles[4]['events'], [[5, 7, 10.0], [6, 8, 20.0]])
+    assert np.allclose(particles[4]['centroid_history'], [[10.0, 5.0, 7.0], [20.0, 5.5, 7.5]])
+
+
+def test_load_particles_reads_both_formats(tmp_path):
+    npz_path = str(tmp_path / "results.npz")
+    pkl_path = str(tmp_path / "results.pkl")
+    save_results(npz_path, dummy_columns())
+    save_particles_pickle(pkl_path, dummy_columns())
+
+    from_npz = load_particles(npz_path)
+    with open(pkl_path, 'rb') as f:
+        from_pkl = pickle.load(f)
+    assert list(from_npz) == list(from_pkl) == [1, 4]
+    for particle_id in from_npz:
+        assert np.array_equal(from_npz[particle_id]['events'], from_pkl[particle_id]['events'])
+        assert np.array_equal(from_npz[particle_id]['centroid_history'], from_pkl[particle_id]['centroid_history'])
+
+
+def test_open_results_maps_columns_and_reads_summary(tmp_path):
+    path = str(tmp_path / "results.npz")
+    save_results(path, dummy_columns(), {'source': "rec.csv"})
+
+    with open_results(path) as results:
+        assert isinstance(results.columns['x'], np.memmap)
+        assert results.metadata['source'] == "rec.csv"
+        assert len(results) == 2 and 4 in results and 2 not in results
+        summary = results.summary()
+        assert summary['particle_id'].tolist() == [4, 1]
+        assert summary['event_count'].tolist() == [2, 1]
+        assert summary['t_start'].tolist() == [10.0, 0.0]
+        assert summary['t_end'].tolist() == [20.0, 0.0]
+        assert summary['x_min'].tolist() == [5, 0] and summary['x_max'].tolist() == [6, 0]
+        assert summary['y_min'].tolist() == [7, 0] and summary['y_max'].tolist() == [8, 0]
+        assert results.densest() == 4
+        assert np.array_equal(results.events(4), [[5, 7, 10.0], [6, 8, 20.0]])
+        assert np.allclose(results.centroid_history(4), [[10.0, 5.0, 7.0], [20.0, 5.5, 7.5]])
+
+
+def test_open_results_without_summary_columns(tmp_path):
+    # Version 1 files have no summary columns: the summary is computed from the events
+    path = str(tmp_path / "results.npz")
+    np.savez(path, metadata=np.array(json.dumps({'format': RESULTS_FORMAT, 'version': 1})), **dummy_columns())
+
+    with open_results(path) as results:
+        assert results.summary()['x_max'].tolist() == [6, 0]
+        assert results.summary()['t_end'].tolist() == [20.0, 0.0]
+
+
+def test_open_results_reads_legacy_pickles(tmp_path):
+    path = str(tmp_path / "results.pkl")
+    with open(path, 'wb') as f:
+        pickle.dump({2: {'events': [(1, 2, 3.0), (4, 5, 6.0)], 'centroid_history': [(3.0, 1.0, 2.0)]},
+                     7: {'events': [(0, 0, 1.0), (0, 1, 2.0)], 'centroid_history': []}}, f)
+
+    with open_results(path) as results:
+        assert results.event_counts() == {2: 2, 7: 2}
+        assert results.densest() == 2  # The smallest ID on ties, like max() over the legacy dicts
+        assert np.array_equal(results.particle(2)['events'], [[1, 2, 3.0], [4, 5, 6.0]])
+        assert results.centroid_history(7).shape == (0, 3)
+
+
+def test_open_results_rejects_event_pickles(tmp_path):
+    path = str(tmp_path / "upper.pkl")
+    with open(path, 'wb') as f:
+        pickle.dump(np.zeros((2, 3)), f)
+    with pytest.raises(ValueError):
+        open_results(path)
+
+
+def test_map_npz_loads_compressed_members(tmp_path):
+    path = str(tmp_path / "compressed.npz")
+    np.savez_compressed(path, a=np.arange(5), b=np.zeros((0, 3)))
+    members = map_npz(path)
+    assert members['a'].tolist() == [0, 1, 2, 3, 4]
+    assert members['b'].shape == (0, 3)
+
+
+def test_save_and_load_split_results_round_trip(tmp_path):
+    from particle_results import load_split_results, save_split_results
+
+    path = str(tmp_path / "split.npz")
+    halves = [
+        (np.array([[1, 2, 3.0], [4, 5, 6.0]], dtype=np.float32), np.empty((0, 3), dtype=np.float32)),
+        (np.array([[7, 8, 9.0]], dtype=np.float32), np.array([[0, 1, 2.0]], dtype=np.float32)),
+    ]
+    save_split_results(path, [3, 9], halves, {'source': "rec.npz"})
+
+    loaded, metadata = load_split_results(path)
+    assert list(loaded) == [3, 9]
+    assert metadata['source'] == "rec.npz" and metadata['num_particles'] == 2
+    for (upper, lower), (expected_upper, expected_lower) in zip(loaded.values(), halves):
+        assert np.array_equal(upper, expected_upper) and upper.shape[1] == 3
+        assert np.array_equal(lower, expected_lower) and lower.shape[1] == 3
+
+
+def test_event_counts_are_stored_and_read_per_particle(tmp_path):
+    path = str(tmp_path / "results.npz")
+    columns = dummy_columns()
+    columns.update(count_offsets=np.array([0, 3, 4]), count_start=np.array([0.0, 0.0]), counts=np.array([1, 0, 1, 1]))
+    save_results(path, columns, {'parameters': {'count_bin_width': 10.0}})
+
+    assert load_results(path)[0]['counts'].dtype == np.int32
+    with open_results(path) as results:
+        assert results.count_bin_width == 10.0
+        start, counts = results.count_series(4)
+        assert start == 0.0 and counts.tolist() == [1, 0, 1]
+        assert results.count_series(1)[1].tolist() == [1]
+
+
+def test_results_without_event_counts(tmp_path):
+    path = str(tmp_path / "results.npz")
+    save_results(path, dummy_columns())
+    assert 'counts' not in load_results(path)[0]
+    with open_results(path) as results:
+        assert results.count_bin_width is None
+        assert results.count_series(4) is None
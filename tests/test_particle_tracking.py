@@ -0,0 +1,372 @@
+import math
+
+import numpy as np
+import pytest
+
+particle_tracking = pytest.importorskip("particle_tracking")
+
+
+def gaussian_distance(x1, y1, t1, x2, y2, t2, sigma_x, sigma_t):
+    spatial = (x1 - x2) ** 2 + (y1 - y2) ** 2
+    temporal = (t1 - t2) ** 2
+    return math.exp(-spatial / (2 * sigma_x ** 2) - temporal / (2 * sigma_t ** 2))
+
+
+def reference_track(data, sigma_x, sigma_t, gaussian_threshold, m_threshold):
+    """Linear scan over every particle and recent event. An event joins the matching particle with the smallest ID and
+    merges every other particle it matches into it; the side made of more fragments keeps its ID."""
+    particles = []
+    counter = 0
+    for x, y, t in data:
+        matches = sorted((
+            p for p in particles
+            if any(gaussian_distance(x, y, t, *r, sigma_x, sigma_t) >= gaussian_threshold for r in p["recent"])
+        ), key=lambda p: p["id"])
+        if not matches:
+            counter += 1
+            particles.append({"id": counter, "events": [(x, y, t)], "recent": [(x, y, t)], "mass": 1, "last": t, "fragments": 1})
+        else:
+            match = matches[0]
+            match["events"].append((x, y, t))
+            match["recent"].append((x, y, t))
+            match["mass"] += 1
+            match["last"] = max(match["last"], t)
+            cutoff = float(np.float32(t - 2000.0))
+            match["recent"] = [r for r in match["recent"] if r[2] >= cutoff]
+            for other in matches[1:]:
+                if other["fragments"] > match["fragments"]:
+                    match["id"] = other["id"]
+                match["events"].extend(other["events"])
+                match["recent"].extend(other["recent"])
+                match["mass"] += other["mass"]
+                match["last"] = max(match["last"], other["last"])
+                match["fragments"] += other["fragments"]
+                particles.remove(other)
+        particles = [p for p in particles if not (p["last"] < t - 2000.0) or p["mass"] > m_threshold]
+    return sorted((p["id"], p["events"]) for p in particles if p["mass"] > m_threshold)
+
+
+def random_events(seed, n, size=40):
+    rng = np.random.default_rng(seed)
+    x = rng.integers(0, size, n)
+    y = rng.integers(0, size, n)
+    t = np.float32(np.sort(rng.uniform(0, n * 10, n)))
+    return list(zip(x.tolist(), y.tolist(), t.tolist()))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("params", [(6.0, 10000.0, 0.8, 5), (3.0, 500.0, 0.5, 2), (6.0, 10000.0, 0.0, 1)])
+def test_track_particles_matches_linear_scan(seed, params):
+    data = random_events(seed, 600)
+    particles = particle_tracking.track_particles_cpp(data, *params)
+    result = [(p.particle_id, [tuple(e) for e in p.events]) for p in particles]
+    assert result == reference_track(data, *params)
+    assert len({p.particle_id for p in particles}) == len(particles)
+
+
+def test_track_particles_matches_linear_scan_as_particles_come_and_go():
+    # One blob, then twelve, then one again: the index moves its events into cells and back
+    rng = np.random.default_rng(5)
+    data = []
+    for start, end, blobs in ((0, 3000, 1), (3000, 9000, 12), (9000, 20000, 1)):
+        for k in range(blobs):
+            n = (end - start) // 40
+            x = 20 + 30 * (k % 4) + rng.integers(-3, 4, n)
+            y = 20 + 30 * (k // 4) + rng.integers(-3, 4, n)
+            data += zip(x.tolist(), y.tolist(), np.float32(rng.uniform(start, end, n)).tolist())
+    data.sort(key=lambda event: event[2])
+    params = (3.0, 500.0, 0.5, 5)
+    particles = particle_tracking.track_particles_cpp(data, *params)
+    assert [(p.particle_id, [tuple(e) for e in p.events]) for p in particles] == reference_track(data, *params)
+
+
+def test_track_particles_separates_distant_blobs():
+    data = []
+    for k in range(400):
+        data.append((10 + k % 3, 10 + k % 2, float(k * 5)))
+        data.append((500 + k % 3, 300 + k % 2, float(k * 5 + 1)))
+    particles = particle_tracking.track_particles_cpp(data, 6.0, 10000.0, 0.8, 100)
+    assert len(particles) == 2
+    assert sorted(len(p.events) for p in particles) == [400, 400]
+
+
+def test_track_particles_np_columns_match_particle_results():
+    data = random_events(3, 800, size=120)
+    x, y, t = (np.array(column) for column in zip(*data))
+    columns = particle_tracking.track_particles_np(
+        x.astype(np.int32), y.astype(np.int32), t.astype(np.float32), 6.0, 10000.0, 0.8, 2
+    )
+    particles = particle_tracking.track_particles_cpp(data, 6.0, 10000.0, 0.8, 2)
+
+    assert columns["particle_id"].tolist() == [p.particle_id for p in particles]
+    event_offsets = columns["event_offsets"]
+    centroid_offsets = columns["centroid_offsets"]
+    for k, p in enumerate(particles):
+        start, end = event_offsets[k], event_offsets[k + 1]
+        events = list(zip(columns["x"][start:end].tolist(), columns["y"][start:end].tolist(), columns["t"][start:end].tolist()))
+        assert events == p.events
+        start, end = centroid_offsets[k], centroid_offsets[k + 1]
+        assert np.allclose(columns["centroid_x"][start:end], [c[1] for c in p.centroid_history])
+
+
+def test_particle_tracker_streaming_matches_batch():
+    rng = np.random.default_rng(7)
+    n = 6000
+    t = np.sort(rng.uniform(0, n * 20, n)).astype(np.float32)
+    blob = rng.integers(0, 6, n)
+    generation = (t // 20000).astype(int)  # blobs jump to a new place every 20 ms, retiring the old particles
+    x = ((blob * 37 + generation * 91) % 300 + rng.normal(0, 2, n)).astype(np.int32)
+    y = ((blob * 53 + generation * 17) % 200 + rng.normal(0, 2, n)).astype(np.int32)
+    batch = particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 20)
+
+    tracker = particle_tracking.ParticleTracker(6.0, 10000.0, 0.8, 20)
+    streamed = {}
+    for start in range(0, n, 500):
+        tracker.feed(x[start:start + 500], y[start:start + 500], t[start:start + 500])
+        retired = tracker.pop_retired()
+        streamed.update(zip(retired["particle_id"].tolist(), np.diff(retired["event_offsets"]).tolist()))
+    early = len(streamed)
+    final = tracker.finalize()
+    streamed.update(zip(final["particle_id"].tolist(), np.diff(final["event_offsets"]).tolist()))
+
+    assert early > 0
+    assert tracker.num_active == 0
+    assert streamed == dict(zip(batch["particle_id"].tolist(), np.diff(batch["event_offsets"]).tolist()))
+
+
+def test_particle_tracker_rejects_unordered_chunks():
+    tracker = particle_tracking.ParticleTracker(6.0, 10000.0, 0.8, 1)
+    tracker.feed(np.array([1, 1]), np.array([1, 1]), np.array([10.0, 20.0]))
+    with pytest.raises(ValueError):
+        tracker.feed(np.array([1]), np.array([1]), np.array([5.0]))
+
+
+def test_activity_window_controls_light_particle_expiry():
+    # Two bursts at the same place 3 ms apart, with an unrelated event in between that triggers the expiry check
+    data = [(5, 5, float(t)) for t in range(0, 50)] + [(300, 300, 2500.0)] + [(5, 5, float(t)) for t in range(3050, 3100)]
+    short = particle_tracking.track_particles_cpp(data, 6.0, 10000.0, 0.8, 60, activity_window=2000.0)
+    long = particle_tracking.track_particles_cpp(data, 6.0, 10000.0, 0.8, 60, activity_window=5000.0)
+    assert short == []
+    assert [len(p.events) for p in long] == [100]
+
+
+def test_centroid_history_is_sliding_window_mean():
+    rng = np.random.default_rng(11)
+    n = 3000
+    t = np.sort(rng.uniform(0, 20000, n)).astype(np.float32)
+    x = (100 + rng.integers(0, 3, n)).astype(np.int32)  # every event matches the previous ones, so there are no merges
+    y = (50 + rng.integers(0, 3, n)).astype(np.int32)
+    columns = particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 1, centroid_window=500.0)
+    assert columns["particle_id"].tolist() == [1]
+
+    expected_x, expected_y = [], []
+    for k in range(n):
+        cutoff = np.float32(t[k] - 500.0)
+        window = (t[: k + 1] >= cutoff)
+        expected_x.append(x[: k + 1][window].mean())
+        expected_y.append(y[: k + 1][window].mean())
+    assert np.allclose(columns["centroid_x"], expected_x)
+    assert np.allclose(columns["centroid_y"], expected_y)
+
+
+def test_bridging_event_merges_every_overlapping_particle():
+    # Three clusters out of reach of each other; the last event reaches all three and must merge them into one particle
+    data = []
+    for k in range(10):
+        data += [(7, 10, float(3 * k)), (13, 10, float(3 * k + 1)), (10, 13, float(3 * k + 2))]
+    data.append((10, 10, 100.0))
+    particles = particle_tracking.track_particles_cpp(data, 6.0, 10000.0, 0.8, 0)
+    assert len(particles) == 1
+    assert sorted(particles[0].events) == sorted(data)
+    # The merged centroid is the plain mean of every recent event (no double counting of mass)
+    _, centroid_x, centroid_y = particles[0].centroid_history[-1]
+    assert centroid_x == pytest.approx(np.mean([e[0] for e in data]))
+    assert centroid_y == pytest.approx(np.mean([e[1] for e in data]))
+
+
+def test_read_events_parses_csv_into_typed_columns(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_text("x,y,polarity,time\n1,2,1,10\r\n3,4,0,11.5\n\n5,6,1,1e2")
+    events = particle_tracking.read_events(str(path))
+    assert events["x"].dtype == np.int32 and events["polarity"].dtype == np.int8 and events["t"].dtype == np.float32
+    assert events["x"].tolist() == [1, 3, 5]
+    assert events["y"].tolist() == [2, 4, 6]
+    assert events["polarity"].tolist() == [1, 0, 1]
+    assert events["t"].tolist() == [10.0, 11.5, 100.0]
+
+
+def test_read_events_reports_bad_files(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        particle_tracking.read_events(str(tmp_path / "missing.csv"))
+    path = tmp_path / "bad.csv"
+    path.write_text("1,2,1,10\n3,oops,0,11\n")
+    with pytest.raises(ValueError, match="line 2"):
+        particle_tracking.read_events(str(path))
+
+
+def test_read_events_maps_npy_layouts(tmp_path):
+    records = np.zeros(3, dtype=[("x", "<u2"), ("y", "<u2"), ("polarity", "i1"), ("time", "<f8")])
+    records["x"], records["y"], records["polarity"], records["time"] = [1, 2, 3], [4, 5, 6], [1, 0, 1], [5.0, 6.0, 7.25]
+    np.save(tmp_path / "records.npy", records)
+    columns = np.array([[1, 4, 1, 5.0], [2, 5, 0, 6.0], [3, 6, 1, 7.25]])
+    np.save(tmp_path / "columns.npy", columns)
+    np.save(tmp_path / "fortran.npy", np.asfortranarray(columns))
+    for name in ["records.npy", "columns.npy", "fortran.npy"]:
+        events = particle_tracking.read_events(str(tmp_path / name))
+        assert events["x"].tolist() == [1, 2, 3]
+        assert events["y"].tolist() == [4, 5, 6]
+        assert events["polarity"].tolist() == [1, 0, 1]
+        assert events["t"].tolist() == [5.0, 6.0, 7.25]
+
+
+def test_track_particles_file_matches_arrays(tmp_path):
+    data = random_events(4, 3000, size=120)
+    x, y, t = (np.array(column) for column in zip(*data))
+    csv_path = tmp_path / "events.csv"
+    csv_path.write_text("".join(f"{a},{b},1,{c!r}\n" for a, b, c in data))
+    np.save(tmp_path / "events.npy", np.column_stack((x, y, np.ones_like(x), t)))
+    expected = particle_tracking.track_particles_np(x.astype(np.int32), y.astype(np.int32), t.astype(np.float32), 6.0, 10000.0, 0.8, 2)
+    for path in [csv_path, tmp_path / "events.npy"]:
+        columns = particle_tracking.track_particles_file(str(path), 6.0, 10000.0, 0.8, 2)
+        for key in expected:
+            assert np.array_equal(columns[key], expected[key]), key
+
+
+def crossing_blobs(num_blobs, per_blob, seed, width=1280, height=720):
+    """Time-ordered blobs drifting a few hundred pixels, so several of them cross tile seams."""
+    rng = np.random.default_rng(seed)
+    xs, ys, ts = [], [], []
+    for _ in range(num_blobs):
+        t = np.sort(rng.uniform(0, per_blob / 2, per_blob))
+        start = rng.uniform(50, [width - 50, height - 50])
+        velocity = rng.uniform(-1, 1, 2) * 400 / (per_blob / 2)
+        angle = rng.uniform(0, 2 * np.pi, per_blob)
+        radius = 8 * np.sqrt(rng.uniform(0, 1, per_blob))
+        xs.append(start[0] + velocity[0] * t + radius * np.cos(angle))
+        ys.append(start[1] + velocity[1] * t + radius * np.sin(angle))
+        ts.append(t)
+    order = np.argsort(np.concatenate(ts), kind="stable")
+    return (np.concatenate(xs)[order].astype(np.int32), np.concatenate(ys)[order].astype(np.int32),
+            np.concatenate(ts)[order].astype(np.float32))
+
+
+def particle_event_sets(columns):
+    events = list(zip(columns["x"].tolist(), columns["y"].tolist(), columns["t"].tolist()))
+    offsets = columns["event_offsets"]
+    return sorted(tuple(sorted(events[offsets[k]:offsets[k + 1]])) for k in range(len(offsets) - 1))
+
+
+def test_feed_file_calls_back_after_every_block(tmp_path):
+    # Four blobs one after another: each is retired while the next ones are read
+    rng = np.random.default_rng(6)
+    t = np.arange(200000, dtype=np.float32)
+    x = (100 + 200 * (t // 50000) + rng.integers(-3, 4, len(t))).astype(np.int32)
+    y = (300 + rng.integers(-3, 4, len(t))).astype(np.int32)
+    path = tmp_path / "events.npy"
+    np.save(path, np.column_stack((x, y, np.ones_like(x), t)))
+
+    tracker = particle_tracking.ParticleTracker(6.0, 10000.0, 0.8, 500)
+    parts = []
+    assert tracker.feed_file(str(path), lambda: parts.append(tracker.pop_retired())) == len(t)
+    assert len(parts) == 4  # Blocks of 65536 events
+    assert [len(part["particle_id"]) for part in parts] == [1, 1, 1, 0]
+    parts.append(tracker.finalize())
+    expected = particle_tracking.track_particles_file(str(path), 6.0, 10000.0, 0.8, 500)
+    assert sorted(sum((particle_event_sets(part) for part in parts), [])) == particle_event_sets(expected)
+
+
+@pytest.mark.parametrize("tiles", [(1, 1), (2, 2), (4, 2), (8, 6)])
+def test_tiled_tracking_matches_single_threaded(tiles):
+    x, y, t = crossing_blobs(8, 4000, seed=5)
+    single = particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 500)
+    tiled = particle_tracking.track_particles_tiled(x, y, t, 6.0, 10000.0, 0.8, 500, tiles_x=tiles[0], tiles_y=tiles[1], num_threads=3)
+    assert particle_event_sets(tiled) == particle_event_sets(single)
+    assert tiled["particle_id"].tolist() == list(range(1, len(tiled["particle_id"]) + 1))
+
+
+def test_tiled_tracking_keeps_particles_whose_halves_are_light():
+    # A dot sweeping across the seam of a 2x1 grid: each tile sees fewer than m_threshold of its 800 events, and goes on
+    # tracking a distant blob long after the dot has left it, so its piece of the dot expires as a light particle
+    num_dot, num_blob = 800, 3000
+    dot_x = np.arange(num_dot) * 100 // num_dot
+    dot_t = np.arange(num_dot) * 22.5
+    blob_t = np.arange(num_blob) * 6.0
+    x = np.concatenate((dot_x, np.full(num_blob, 5), np.full(num_blob, 95)))
+    y = np.concatenate((np.zeros(num_dot), np.full(2 * num_blob, 500)))
+    t = np.concatenate((dot_t, blob_t, blob_t + 3))
+    order = np.argsort(t, kind="stable")
+    x, y, t = x[order].astype(np.int32), y[order].astype(np.int32), t[order].astype(np.float32)
+
+    single = particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 500)
+    tiled = particle_tracking.track_particles_tiled(x, y, t, 6.0, 10000.0, 0.8, 500, tiles_x=2, tiles_y=1, num_threads=1)
+    assert sorted(np.diff(single["event_offsets"]).tolist()) == [num_dot, num_blob, num_blob]
+    assert particle_event_sets(tiled) == particle_event_sets(single)
+
+
+def test_tiled_tracking_handles_empty_input():
+    empty = np.zeros(0, dtype=np.int32)
+    columns = particle_tracking.track_particles_tiled(empty, empty, empty.astype(np.float32), 6.0, 10000.0, 0.8, 5)
+    assert columns["particle_id"].tolist() == []
+    assert columns["event_offsets"].tolist() == [0]
+
+
+def histogram_on_grid(t, bin_width):
+    """Start and counts of the event times on bins [b * bin_width, (b + 1) * bin_width)"""
+    bins = np.floor(t.astype(np.float64) / bin_width).astype(np.int64)
+    return bins.min() * bin_width, np.bincount(bins - bins.min())
+
+
+def assert_counts_match_events(columns, bin_width):
+    assert len(columns["count_offsets"]) == len(columns["particle_id"]) + 1
+    for k in range(len(columns["particle_id"])):
+        t = columns["t"][columns["event_offsets"][k]:columns["event_offsets"][k + 1]]
+        start, counts = histogram_on_grid(t, bin_width)
+        assert columns["count_start"][k] == start
+        assert columns["counts"][columns["count_offsets"][k]:columns["count_offsets"][k + 1]].tolist() == counts.tolist()
+
+
+def test_event_counts_match_histograms_of_the_particles():
+    x, y, t = crossing_blobs(6, 3000, seed=7)
+    columns = particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 500, count_bin_width=7.5)
+    assert len(columns["particle_id"]) > 0
+    assert_counts_match_events(columns, 7.5)
+
+    plain = particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 500)
+    assert "counts" not in plain
+
+
+def test_event_counts_add_up_when_particles_merge():
+    # The bridging event joins three particles: their histograms are summed bin by bin
+    data = []
+    for k in range(10):
+        data += [(7, 10, float(3 * k)), (13, 10, float(3 * k + 1)), (10, 13, float(3 * k + 2))]
+    data.append((10, 10, 100.0))
+    x, y, t = (np.array(column) for column in zip(*data))
+    columns = particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 0, count_bin_width=10.0)
+    assert len(columns["particle_id"]) == 1
+    assert columns["counts"].tolist() == [10, 10, 10, 0, 0, 0, 0, 0, 0, 0, 1]
+    assert_counts_match_events(columns, 10.0)
+
+
+def test_event_counts_of_streaming_and_tiled_tracking():
+    x, y, t = crossing_blobs(8, 4000, seed=5)
+    tracker = particle_tracking.ParticleTracker(6.0, 10000.0, 0.8, 500, count_bin_width=1000.0)
+    parts = []
+    for start in range(0, len(t), 5000):
+        tracker.feed(x[start:start + 5000], y[start:start + 5000], t[start:start + 5000])
+        parts.append(tracker.pop_retired())
+    parts.append(tracker.finalize())
+    for part in parts:
+        assert_counts_match_events(part, 1000.0)
+
+    tiled = particle_tracking.track_particles_tiled(x, y, t, 6.0, 10000.0, 0.8, 500, tiles_x=4, tiles_y=2,
+                                                    count_bin_width=1000.0)
+    assert_counts_match_events(tiled, 1000.0)
+
+
+def test_event_counts_reject_negative_bin_width():
+    x, y, t = (np.array(column) for column in zip(*random_events(0, 10)))
+    with pytest.raises(ValueError):
+        particle_tracking.track_particles_np(x, y, t, 6.0, 10000.0, 0.8, 0, count_bin_width=-1.0)
+    with pytest.raises(ValueError):
+        particle_tracking.ParticleTracker(6.0, 10000.0, 0.8, 0, count_bin_width=float("nan"))
@@ -0,0 +1,85 @@
+import os
+from unittest import mock
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+
+import plotAllData
+from plotAllData import EventDensity, accumulate_density, process_csv_file_density
+
+
+def random_events(num_events, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'x': rng.integers(0, 1280, num_events),
+        'y': rng.integers(0, 720, num_events),
+        'polarity': rng.integers(0, 2, num_events),
+        'time': np.sort(rng.integers(1000000, 3000000, num_events)),
+    })
+
+
+def test_density_matches_histograms_whatever_the_chunk_order():
+    events = random_events(5000)
+    density = EventDensity(time_bin=100.0, pixel_bin=10)
+    # Later chunk first: the time axis grows at both ends
+    for chunk in (events[2500:], events[:1000], events[1000:2500]):
+        density.add(chunk['x'], chunk['y'], chunk['polarity'], chunk['time'] * 1e-3)
+
+    assert density.time_range() == (1000.0, 3000.0)
+    for polarity in (0, 1):
+        selected = events[events['polarity'] == polarity]
+        xy, _, _ = np.histogram2d(selected['y'], selected['x'], bins=[np.arange(0, 730, 10), np.arange(0, 1290, 10)])
+        assert np.array_equal(density.xy[polarity], xy)
+        time_x, _, _ = np.histogram2d(selected['time'] * 1e-3, selected['x'],
+                                      bins=[np.arange(1000, 3001, 100), np.arange(0, 1290, 10)])
+        assert np.array_equal(density.time_x[polarity], time_x)
+        assert np.array_equal(density.time_y[polarity].sum(axis=0), xy.sum(axis=1))
+
+
+def test_long_recording_is_coarsened_to_match_the_eager_histograms():
+    # 1 hour at 10 ms bins would be 360000 bins: the axis is capped at 50, doubling the bin width as needed
+    rng = np.random.default_rng(2)
+    events = random_events(20000, seed=2)
+    events['time'] = np.sort(rng.uniform(-5e6, 3.6e9, len(events)))
+    density = EventDensity(time_bin=10.0, pixel_bin=40, max_time_bins=50)
+    bounds = np.linspace(0, len(events), 41).astype(int)
+    for index in rng.permutation(40):
+        chunk = events.iloc[bounds[index]:bounds[index + 1]]
+        density.add(chunk['x'], chunk['y'], chunk['polarity'], chunk['time'] * 1e-3)
+
+    assert density.num_bins <= 50 and density.capacity <= 50
+    assert density.time_bin == 10.0 * 2 ** 13
+    start, end = density.time_range()
+    time_bins = np.arange(start, end + density.time_bin / 2, density.time_bin)
+    for polarity in (0, 1):
+        selected = events[events['polarity'] == polarity]
+        time_x, _, _ = np.histogram2d(selected['time'] * 1e-3, selected['x'], bins=[time_bins, np.arange(0, 1290, 40)])
+        time_y, _, _ = np.histogram2d(selected['time'] * 1e-3, selected['y'], bins=[time_bins, np.arange(0, 730, 40)])
+        assert np.array_equal(density.time_x[polarity], time_x)
+        assert np.array_equal(density.time_y[polarity], time_y)
+
+
+def test_events_outside_the_sensor_are_ignored():
+    density = EventDensity()
+    density.add([-1, 1280, 5], [0, 0, 720], [1, 1, 1], [0.0, 0.0, 0.0])
+    assert density.xy == {}
+    density.add([5], [5], [0], [12.0])
+    assert density.xy[0].sum() == 1 and density.time_range() == (10.0, 20.0)
+
+
+def test_csv_is_streamed_in_chunks(tmp_path):
+    events = random_events(2000, seed=1)
+    csv_file = str(tmp_path / "recording.csv")
+    events.to_csv(csv_file, header=False, index=False)
+
+    with mock.patch.object(plotAllData, 'chunk_events', 300):
+        density = accumulate_density(csv_file)
+    assert sum(counts.sum() for counts in density.xy.values()) == len(events)
+    assert density.time_x[1].sum() == (events['polarity'] == 1).sum()
+
+    process_csv_file_density(csv_file, str(tmp_path / "outputs"))
+    assert os.path.exists(tmp_path / "outputs" / "recording_density.png")
@@ -1,5 +1,12 @@
 import os
-from plotEventCountFFT import read_pickles, process_pickle_file
+import pickle
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from particle_results import save_results
+import plotEventCountFFT
+from plotEventCountFFT import read_pickles, process_pickle_file, estimate_wingfreqs, particle_wingbeat_tracks, process_folder
 
 
 def test_read_pickles():
@@ -7,8 +14,137 @@ def test_read_pickles():
     assert any(f.endswith("_peaks.txt") for f in files) or files == []
 
 
+def test_read_pickles_skips_pickles_with_a_columnar_copy(tmp_path):
+    (tmp_path / "bats").mkdir()
+    for name in ("both_a.npz", "both_a.pkl", "both_b.pkl"):
+        (tmp_path / "bats" / f"particle_tracking_results_{name}").touch()
+    files = read_pickles(str(tmp_path), "bats")
+    assert [os.path.basename(f) for f in files] == [
+        "particle_tracking_results_both_a.npz", "particle_tracking_results_both_b.pkl"
+    ]
+
+
 def test_process_pickle_file_output():
     pkl = "sampleData/particle_tracking_results_recording_2023-09-14_20-42-19_39.pkl"
     result = process_pickle_file(pkl)
     assert result is not None
     assert len(result) > 0
+
+
+def test_estimate_wingfreqs_batch():
+    t = np.arange(2000) / 1000
+    rng = np.random.default_rng(0)
+    event_num_list = [
+        rng.poisson(50 + 40 * np.sin(2 * np.pi * freq * t[:n])) for freq, n in ((8.0, 2000), (15.0, 1200))
+    ]
+    event_num_list.append(np.zeros(500))
+    freqs, fft_magnitude, wingfreqs = estimate_wingfreqs(event_num_list)
+    assert fft_magnitude.shape == (3, len(freqs))
+    assert abs(wingfreqs[0] - 8.0) < 0.5
+    assert abs(wingfreqs[1] - 15.0) < 0.5
+    assert np.isnan(wingfreqs[2])
+
+
+def test_estimate_wingfreqs_welch_uses_whole_series():
+    # The wingbeat only starts after the first 4096 ms
+    t = np.arange(20000) / 1000
+    rate = np.where(t < 5, 50.0, 50 + 40 * np.sin(2 * np.pi * 12.0 * t))
+    event_num_list = [np.random.default_rng(0).poisson(rate)]
+    _, _, wingfreqs = estimate_wingfreqs(event_num_list, welch=True)
+    assert abs(wingfreqs[0] - 12.0) < 0.25
+
+
+def test_estimate_wingfreqs_zoom():
+    t = np.arange(3000) / 1000
+    event_num_list = [np.random.default_rng(1).poisson(50 + 40 * np.sin(2 * np.pi * 10.3 * t))]
+    freqs, _, wingfreqs = estimate_wingfreqs(event_num_list, zoom=0.02)
+    assert freqs[0] == 4.0 and freqs[-1] == 30.0
+    assert abs(wingfreqs[0] - 10.3) < 0.1
+
+
+def test_particle_wingbeat_tracks(tmp_path):
+    rng = np.random.default_rng(2)
+    counts = rng.poisson(50 + 40 * np.sin(2 * np.pi * 9.0 * np.arange(3000) / 1000))
+    columns = {
+        "particle_id": np.array([3, 5]),
+        "event_offsets": np.array([0, 1, 2]),
+        "x": np.zeros(2), "y": np.zeros(2), "t": np.array([2e6, 0.0]),
+        "centroid_offsets": np.array([0, 1, 2]),
+        "centroid_t": np.zeros(2), "centroid_x": np.zeros(2), "centroid_y": np.zeros(2),
+        "count_offsets": np.array([0, len(counts), len(counts) + 10]),
+        "count_start": np.array([2e6, 0.0]),
+        "counts": np.concatenate((counts, np.ones(10))),
+    }
+    path = str(tmp_path / "particle_tracking_results_both_rec.npz")
+    save_results(path, columns, {"parameters": {"count_bin_width": 1000.0}})
+
+    tracks = particle_wingbeat_tracks(path)
+    assert list(tracks) == [3]  # Particle 5 is shorter than a window
+    times, wingfreqs = tracks[3]
+    assert times[0] == 2.5
+    assert np.nanmedian(wingfreqs) == 9.0
+
+    process_pickle_file(path, tracks=True)
+    df_tracks = pd.read_csv(tmp_path / "windowed_fft_results" / "both_rec_wingbeat_tracks.csv")
+    assert list(df_tracks.columns) == ["particle_id", "time_s", "wingbeat_hz"]
+    assert len(df_tracks) == len(times)
+
+
+def test_process_folder_skips_results_without_particles(tmp_path):
+    folder = tmp_path / "bats"
+    folder.mkdir()
+    t = np.arange(3000)
+    counts = np.random.default_rng(4).poisson(20 + 15 * np.sin(2 * np.pi * 10.0 * t / 1000))
+    times = np.repeat(t * 1e3, counts).astype(np.float32)
+    columns = {
+        "particle_id": np.array([1]),
+        "event_offsets": np.array([0, len(times)]),
+        "x": np.zeros(len(times)), "y": np.zeros(len(times)), "t": times,
+        "centroid_offsets": np.array([0, 0]),
+        "centroid_t": np.zeros(0), "centroid_x": np.zeros(0), "centroid_y": np.zeros(0),
+    }
+    save_results(str(folder / "particle_tracking_results_both_a.npz"), columns)
+    # No particle passed m_threshold
+    empty = {key: np.zeros(0) for key in columns}
+    empty["event_offsets"] = empty["centroid_offsets"] = np.array([0])
+    save_results(str(folder / "particle_tracking_results_both_b.npz"), empty)
+
+    for welch, zoom in ((False, None), (True, None), (False, 0.05)):
+        event_num_list, file_names, peak_freqs, spectra = process_folder(str(tmp_path), "bats", welch, zoom, cache_size=0)
+        assert file_names == ["particle_tracking_results_both_a.npz", "particle_tracking_results_both_b.npz"]
+        assert len(event_num_list[1]) == 0
+        assert abs(peak_freqs[0] - 10.0) < 0.5 and np.isnan(peak_freqs[1])
+        assert np.isnan(spectra[1][1]).all() and np.all(spectra[2][1] == -1)
+
+
+def test_process_folder_reuses_cached_results(tmp_path):
+    folder = tmp_path / "bats"
+    folder.mkdir()
+    rng = np.random.default_rng(3)
+    for name, freq in (("a", 8.0), ("b", 12.0)):
+        t = np.arange(3000)
+        counts = rng.poisson(20 + 15 * np.sin(2 * np.pi * freq * t / 1000))
+        times = np.repeat(t * 1e3, counts).astype(np.float32)
+        with open(folder / f"particle_tracking_results_{name}.pkl", "wb") as f:
+            pickle.dump(np.column_stack((np.zeros_like(times), np.zeros_like(times), times)), f)
+
+    first = process_folder(str(tmp_path), "bats")
+    assert abs(first[2][0] - 8.0) < 0.5 and abs(first[2][1] - 12.0) < 0.5
+
+    with mock.patch.object(plotEventCountFFT, "process_pickle_file", wraps=process_pickle_file) as process:
+        second = process_folder(str(tmp_path), "bats")
+        assert process.call_count == 0
+        assert second[1:3] == first[1:3]
+        assert np.array_equal(second[3][1], first[3][1])
+        assert all(np.array_equal(a, b) for a, b in zip(second[0], first[0]))
+
+        # Only the modified file is processed again
+        with open(folder / "particle_tracking_results_b.pkl", "wb") as f:
+            pickle.dump(np.array([[0, 0, 0.0], [0, 0, 5e3]]), f)
+        third = process_folder(str(tmp_path), "bats")
+        assert process.call_count == 1
+        assert third[2][0] == first[2][0]
+
+        # Different parameters are cached apart
+        process_folder(str(tmp_path), "bats", welch=True)
+        assert process.call_count == 3
@@ -0,0 +1,46 @@
+import numpy as np
+
+from plot_lod import simplify_polyline, stratified_sample
+
+
+def test_stratified_sample_keeps_small_sets_whole():
+    assert np.array_equal(stratified_sample(np.arange(5.0), 10), np.arange(5))
+    assert len(stratified_sample(np.arange(5.0), 0)) == 0
+
+
+def test_stratified_sample_is_deterministic_and_spread_through_time():
+    rng = np.random.default_rng(0)
+    # A burst: half of the events fall in the first tenth of the time range
+    times = np.sort(np.concatenate((rng.uniform(0, 1, 50000), rng.uniform(1, 10, 50000)))).astype(np.float32)
+    indices = stratified_sample(times, 1000)
+    assert len(indices) == 1000
+    assert np.all(np.diff(indices) > 0)
+    assert np.array_equal(indices, stratified_sample(times, 1000))
+    assert np.sum(times[indices] < 1) == 500
+    assert np.histogram(times[indices], bins=9, range=(1, 10))[0].min() > 50
+
+
+def test_stratified_sample_of_unsorted_times():
+    # Events of a merged particle: two time-ordered runs one after the other
+    times = np.concatenate((np.arange(500.0, 1000.0), np.arange(0.0, 500.0)))
+    indices = stratified_sample(times, 100)
+    assert np.all(np.diff(indices) > 0)
+    assert np.sum(times[indices] < 500) == 50
+    assert np.all(np.diff(np.sort(times[indices])) == 10)
+
+
+def test_simplify_polyline_keeps_ends_and_sharp_turns():
+    t = np.arange(10000.0)
+    x = np.where(t == 6543, 500.0, 100.0 + 0.01 * t)
+    points = np.column_stack((t, x, np.full_like(t, 300.0)))
+    kept = simplify_polyline(points, 200)
+    assert len(kept) == 200
+    assert kept[0] == 0 and kept[-1] == len(t) - 1
+    assert np.all(np.diff(kept) > 0)
+    assert 6543 in kept
+
+
+def test_simplify_polyline_short_lines_unchanged():
+    points = np.random.default_rng(1).normal(size=(50, 3))
+    assert np.array_equal(simplify_polyline(points, 100), np.arange(50))
+    assert np.array_equal(simplify_polyline(points, 2), [0, 49])
@@ -1,5 +1,10 @@
 import numpy as np
-from process_fft import preprocess_time_series, pad_time_series, compute_fft, WINDOW_LENGTH, FS
+from process_fft import (
+    preprocess_time_series, pad_time_series, compute_fft, WINDOW_LENGTH, FS,
+    stack_time_series, batch_fft, fft_frequencies,
+    WelchSpectrum, welch_spectrum, batch_welch, zoom_fft,
+    SlidingDFT, WingbeatTracker, wingbeat_track,
+)
 
 
 def test_preprocess_time_series():
@@ -29,3 +34,117 @@ def test_compute_fft_peak():
     freqs, magnitude = compute_fft(signal)
     dominant = freqs[np.argmax(magnitude)]
     assert abs(dominant - freq) < 0.5
+
+
+def test_batch_fft_matches_compute_fft():
+    rng = np.random.default_rng(0)
+    series_list = [rng.poisson(20, n).astype(float) for n in (300, 1500, WINDOW_LENGTH, 6000)]
+    batch = stack_time_series(series_list)
+    assert batch.shape == (len(series_list), WINDOW_LENGTH)
+
+    freqs, magnitudes = batch_fft(batch)
+    for series, magnitude in zip(series_list, magnitudes):
+        expected_freqs, expected = compute_fft(pad_time_series(preprocess_time_series(series)))
+        assert np.allclose(freqs, expected_freqs)
+        assert np.allclose(magnitude, expected)
+
+
+def test_fft_frequencies_cached():
+    assert fft_frequencies() is fft_frequencies()
+    assert not fft_frequencies().flags.writeable
+    assert np.array_equal(fft_frequencies(), np.fft.fftfreq(WINDOW_LENGTH, d=1 / FS)[: WINDOW_LENGTH // 2])
+
+
+def test_welch_spectrum_independent_of_chunks():
+    rng = np.random.default_rng(0)
+    series = rng.poisson(30 + 20 * np.sin(2 * np.pi * 9 * np.arange(30000) / FS)).astype(float)
+    freqs, amplitude = welch_spectrum(series)
+
+    welch = WelchSpectrum()
+    start = 0
+    while start < len(series):
+        size = int(rng.integers(1, 5000))
+        welch.update(series[start : start + size])
+        start += size
+    assert len(welch.pending) < WINDOW_LENGTH
+    chunked_freqs, chunked = welch.spectrum()
+    assert np.allclose(chunked, amplitude)
+    assert abs(freqs[5 + np.argmax(amplitude[5:])] - 9.0) < 0.5
+
+
+def test_welch_spectrum_matches_scipy():
+    from scipy.signal import welch
+
+    rng = np.random.default_rng(1)
+    series = rng.normal(0, 1, 20000)
+    _, amplitude = welch_spectrum(series)
+    _, psd = welch(series, fs=FS, window=np.hanning(WINDOW_LENGTH), nperseg=WINDOW_LENGTH,
+                   noverlap=WINDOW_LENGTH // 2, detrend="constant")
+    # Same averaged periodogram up to scipy's density scaling
+    ratio = np.exp(amplitude / 10)[1:] / psd[1 : WINDOW_LENGTH // 2]
+    assert np.allclose(ratio, ratio[0])
+
+
+def test_welch_spectrum_short_series_matches_compute_fft():
+    series = np.arange(1000, dtype=float) % 7
+    freqs, amplitude = welch_spectrum(series)
+    expected_freqs, expected = compute_fft(pad_time_series(preprocess_time_series(series)))
+    assert np.allclose(amplitude, expected)
+
+    _, batch = batch_welch([series, np.tile(series, 10)])
+    assert batch.shape == (2, WINDOW_LENGTH // 2)
+    assert np.allclose(batch[0], expected)
+
+
+def test_zoom_fft_matches_padded_fft():
+    rng = np.random.default_rng(2)
+    batch = stack_time_series([rng.poisson(30, n).astype(float) for n in (800, 3000)])
+    freqs, amplitude = zoom_fft(batch, 4.0, 30.0, 0.05)
+    assert freqs[0] == 4.0 and freqs[-1] == 30.0 and len(freqs) == 521
+
+    # A zero-padded FFT of 20000 points has the same 0.05 Hz grid
+    padded = 20 * np.log(np.abs(np.fft.rfft(batch, n=20000, axis=1)))
+    assert np.allclose(amplitude, padded[:, 80:601])
+
+
+def test_zoom_fft_resolves_close_frequency():
+    t = np.arange(WINDOW_LENGTH) / FS
+    signal = np.sin(2 * np.pi * 9.37 * t)
+    freqs, amplitude = zoom_fft(stack_time_series([signal]), resolution=0.01)
+    assert abs(freqs[np.argmax(amplitude[0])] - 9.37) < 0.02
+
+
+def test_sliding_dft_matches_windowed_fft():
+    rng = np.random.default_rng(3)
+    series = rng.poisson(30, 3000).astype(float)
+    sdft = SlidingDFT(win_len=500)
+    # Chunks of any size, down to single samples
+    states = np.concatenate([sdft.update(series[:777]), sdft.update(series[777:778]), sdft.update(series[778:])])
+    amplitude = sdft.amplitude(states)
+    assert amplitude.shape == (len(series), len(sdft.freqs))
+    assert sdft.freqs[0] >= 4.0 and sdft.freqs[-1] <= 30.0
+
+    window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(500) / 500)
+    bins = np.round(sdft.freqs * 500 / FS).astype(int)
+    for end in (499, 1200, 2999):
+        expected = np.fft.fft(series[end - 499 : end + 1] * window)[bins]
+        assert np.allclose(amplitude[end], 20 * np.log(np.abs(expected)))
+
+
+def test_wingbeat_tracker_follows_frequency_change():
+    rng = np.random.default_rng(4)
+    freq = np.where(np.arange(12000) < 6000, 8.0, 14.0)
+    series = rng.poisson(50 + 40 * np.sin(2 * np.pi * np.cumsum(freq) / FS)).astype(float)
+    times, wingfreqs = wingbeat_track(series)
+    assert np.allclose(np.diff(times), 0.05)
+    assert times[0] == 0.5
+    assert np.nanmedian(wingfreqs[times < 5.5]) == 8.0
+    assert np.nanmedian(wingfreqs[times > 6.5]) == 14.0
+
+    # Fed count by count, as during a recording
+    tracker = WingbeatTracker()
+    live = [tracker.update(series[k : k + 1]) for k in range(3000)]
+    live_times = np.concatenate([t for t, _ in live])
+    live_freqs = np.concatenate([f for _, f in live])
+    assert np.array_equal(live_times, times[: len(live_times)])
+    assert np.allclose(live_freqs, wingfreqs[: len(live_freqs)], equal_nan=True)
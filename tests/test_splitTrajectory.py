@@ -111,3 +111,92 @@ def test_process_particle_file_outputs_next_to_pickle(tmp_path, split_module):
     lower_dir = tmp_path / "lower"
     assert upper_dir.exists()
     assert lower_dir.exists()
+
+
+def argmin_nearest(times, query_times):
+    return np.array([int(np.argmin(np.abs(times - t))) for t in query_times], dtype=np.intp)
+
+
+def test_nearest_time_index_matches_argmin_on_ties(split_module):
+    times = np.array([0.0, 2.0, 2.0, 4.0, 4.0, 8.0], dtype=np.float32)
+    query = np.array([-1.0, 1.0, 2.0, 3.0, 4.0, 6.0, 9.0], dtype=np.float32)
+    index = split_module.nearest_time_index(times, query)
+    assert index.tolist() == argmin_nearest(times, query).tolist() == [0, 0, 1, 1, 3, 3, 5]
+
+
+def test_nearest_time_index_matches_argmin_on_rounded_distances(split_module):
+    # Far from small times, float32 distances round to the same value and argmin keeps the first of them
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.uniform(0, 4, 50)).astype(np.float32)
+    query = rng.uniform(2e7, 3e7, 200).astype(np.float32)
+    assert np.array_equal(split_module.nearest_time_index(times, query), argmin_nearest(times, query))
+
+
+def test_nearest_time_index_unsorted_times(split_module):
+    rng = np.random.default_rng(1)
+    times = rng.integers(0, 50, 40).astype(np.float32)
+    query = rng.uniform(-5, 55, 300).astype(np.float32)
+    assert np.array_equal(split_module.nearest_time_index(times, query), argmin_nearest(times, query))
+
+
+def test_split_events_by_centroid_matches_event_loop(split_module):
+    rng = np.random.default_rng(2)
+    history_t = np.sort(rng.integers(0, 5000, 300)).astype(np.float32)
+    history = np.column_stack((history_t, rng.uniform(0, 100, 300), 50 + 10 * np.sin(history_t / 500)))
+    events = np.column_stack((rng.integers(0, 100, 2000), rng.integers(30, 70, 2000), rng.integers(0, 5000, 2000))).astype(np.float32)
+    upper, lower = split_module.split_events_by_centroid({'events': events, 'centroid_history': history})
+
+    centroid_history = history.astype(np.float32)
+    _, smoothed_y = split_module.compute_smoothed_centroid(centroid_history)
+    is_upper = np.array([event[1] > smoothed_y[int(np.argmin(np.abs(centroid_history[:, 0] - event[2])))] for event in events])
+    assert upper.dtype == lower.dtype == np.float32
+    assert np.array_equal(upper, events[is_upper])
+    assert np.array_equal(lower, events[~is_upper])
+
+
+def test_split_events_by_centroid_empty_half_keeps_columns(split_module):
+    particle = {"events": [(0.0, 1.0, 0.0)], "centroid_history": [(0.0, 0.0, 5.0)]}
+    upper, lower = split_module.split_events_by_centroid(particle)
+    assert upper.shape == (0, 3)
+    assert lower.shape == (1, 3)
+
+
+def write_three_particles(path):
+    rng = np.random.default_rng(3)
+    particle_data = {}
+    for particle_id, num_events in [(1, 40), (2, 5), (5, 60)]:
+        t = np.sort(rng.uniform(0, 1000, num_events)).astype(np.float32)
+        events = np.column_stack((rng.integers(0, 100, num_events), rng.integers(0, 100, num_events), t))
+        particle_data[particle_id] = {
+            "events": events.astype(np.float32),
+            "centroid_history": np.column_stack((t, np.full(num_events, 50.0), np.full(num_events, 50.0))),
+        }
+    with open(path, "wb") as f:
+        pickle.dump(particle_data, f)
+    return particle_data
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("extension", [".pkl", ".npz"])
+def test_process_all_particles_writes_one_split_file(tmp_path, split_module, jobs, extension):
+    from particle_results import load_split_results, particles_to_columnar, save_results
+
+    pickle_path = tmp_path / "particle_tracking_results_both_rec.pkl"
+    particle_data = write_three_particles(pickle_path)
+    if extension == ".npz":
+        # Columnar results: with jobs > 1, the workers map the file and return packed masks
+        results_path = tmp_path / "particle_tracking_results_both_rec.npz"
+        save_results(str(results_path), particles_to_columnar(particle_data), {})
+        pickle_path.unlink()
+        pickle_path = results_path
+
+    split_module.process_all_particles(str(pickle_path), str(tmp_path), min_events=10, jobs=jobs)
+
+    halves, metadata = load_split_results(str(tmp_path / "split" / "particle_tracking_results_both_rec.npz"))
+    assert sorted(halves) == [1, 5]
+    assert metadata['min_events'] == 10
+    for particle_id, (upper, lower) in halves.items():
+        expected_upper, expected_lower = split_module.split_events_by_centroid(particle_data[particle_id])
+        assert np.array_equal(upper, expected_upper)
+        assert np.array_equal(lower, expected_lower)
+    assert not (tmp_path / "upper").exists()
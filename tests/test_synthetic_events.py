@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from plotEventCountFFT import count_events, estimate_wingfreqs
+from synthetic_events import SENSOR_HEIGHT, SENSOR_WIDTH, WING_SPAN, WING_STROKE, bat_centres, generate_events
+
+
+def test_generate_events_columns():
+    synthetic = generate_events(3, event_rate=10.0, duration=500.0, noise_rate=2.0, rng=0)
+    assert synthetic['x'].dtype == np.int32 and synthetic['y'].dtype == np.int32
+    assert synthetic['t'].dtype == np.float32
+    assert np.all(np.diff(synthetic['t']) >= 0)
+    assert synthetic['t'][0] >= 0 and synthetic['t'][-1] <= 500e3
+    assert synthetic['x'].min() >= 0 and synthetic['x'].max() < SENSOR_WIDTH
+    assert synthetic['y'].min() >= 0 and synthetic['y'].max() < SENSOR_HEIGHT
+    assert set(np.unique(synthetic['bat'])) == {-1, 0, 1, 2}
+    # Mean rates: 10 events per ms per bat and 2 of noise
+    counts = np.bincount(synthetic['bat'] + 1)
+    assert abs(counts[0] - 1000) < 150
+    assert np.all(np.abs(counts[1:] - 5000) < 400)
+
+
+def test_generate_events_is_reproducible():
+    first = generate_events(2, duration=200.0, rng=7)
+    second = generate_events(2, duration=200.0, rng=7)
+    for name in ('x', 'y', 't', 'bat', 'wingbeat'):
+        assert np.array_equal(first[name], second[name])
+
+
+def test_events_follow_the_bats():
+    synthetic = generate_events(4, duration=1000.0, noise_rate=0.0, rng=1)
+    centres = bat_centres(synthetic, synthetic['t'])
+    own = centres[np.arange(len(centres)), synthetic['bat']]
+    distances = np.hypot(synthetic['x'] - own[:, 0], synthetic['y'] - own[:, 1])
+    # Wing tips are the furthest events; pixel coordinates are rounded down
+    assert distances.max() < np.hypot(WING_SPAN, WING_STROKE) + np.sqrt(2)
+
+
+def test_crossing_pairs_meet_half_way():
+    synthetic = generate_events(5, duration=1000.0, crossings=2, rng=2)
+    start, end = bat_centres(synthetic, [0.0, 1000e3])
+    middle = bat_centres(synthetic, [500e3])[0]
+    assert np.allclose(middle[0], middle[1]) and np.allclose(middle[2], middle[3])
+    assert not np.allclose(start[0], start[1]) and not np.allclose(end[0], end[1])
+    assert np.min(np.hypot(*(middle[4] - middle[:4]).T)) > 50
+
+
+def test_too_many_crossings():
+    with pytest.raises(ValueError):
+        generate_events(3, crossings=2)
+
+
+def test_event_counts_peak_at_the_wingbeat():
+    synthetic = generate_events(3, duration=4000.0, noise_rate=0.0, rng=3)
+    events = np.column_stack((synthetic['x'], synthetic['y'], synthetic['t']))
+    series = [count_events(events[synthetic['bat'] == bat]) for bat in range(3)]
+    _, _, wingfreqs = estimate_wingfreqs(series)
+    assert np.allclose(wingfreqs, synthetic['wingbeat'], atol=0.3)
@@ -0,0 +1,40 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pytest
+
+from detect_peaks import peak_detection
+from process_fft import compute_fft, pad_time_series, preprocess_time_series
+from time_fft_to_pdf import fft_report_spectra, plot_and_save_time_series_fft_to_pdf
+
+
+def series_list(count):
+    rng = np.random.default_rng(0)
+    t = np.arange(2000) / 1000
+    return [rng.poisson(30 + 20 * np.sin(2 * np.pi * f * t)) for f in rng.uniform(5, 25, count)]
+
+
+def test_fft_report_spectra_match_per_series_fft():
+    data_list = series_list(4)
+    freqs, fft_magnitude, peak_indices = fft_report_spectra(data_list)
+    for time_series, magnitude, peaks in zip(data_list, fft_magnitude, peak_indices):
+        expected_freqs, expected = compute_fft(pad_time_series(preprocess_time_series(time_series)))
+        assert np.allclose(magnitude, expected)
+        assert list(peaks[peaks >= 0]) == list(peak_detection(expected, expected_freqs)[0])
+
+
+def test_pages_rendered_in_parallel_are_merged_in_order(tmp_path):
+    pypdf = pytest.importorskip("pypdf")
+    data_list = series_list(7)
+    names = [f"rec_{k}.npz" for k in range(7)]
+    sequential = str(tmp_path / "sequential.pdf")
+    parallel = str(tmp_path / "parallel.pdf")
+    plot_and_save_time_series_fft_to_pdf("bats", data_list, names, sequential)
+    plot_and_save_time_series_fft_to_pdf("bats", data_list, names, parallel, jobs=2)
+
+    pages = pypdf.PdfReader(parallel).pages
+    assert len(pages) == len(pypdf.PdfReader(sequential).pages) == 2
+    assert "rec_0.npz" in pages[0].extract_text()
+    assert "rec_5.npz" in pages[1].extract_text()
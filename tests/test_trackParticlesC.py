@@ -1,28 +1,155 @@
 import os
 import csv
-import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from unittest import mock
-from trackParticlesC import process_file
 
+import numpy as np
 
-class DummyParticle:
-    def __init__(self, pid):
-        self.particle_id = pid
-        self.centroid_history = [(0, 0, 0)]
-        self.events = [(0, 0, 0)]
+import trackParticlesC
+from particle_results import load_results, load_particles
+from trackParticlesC import process_file, process_files, concat_columns
 
 
-def test_process_file_creates_pickle(tmp_path):
+def dummy_columns():
+    return {
+        'particle_id': np.array([1, 4], dtype=np.int32),
+        'event_offsets': np.array([0, 1, 3], dtype=np.int64),
+        'x': np.array([0, 5, 6], dtype=np.int32),
+        'y': np.array([0, 7, 8], dtype=np.int32),
+        't': np.array([0.0, 10.0, 20.0], dtype=np.float32),
+        'centroid_offsets': np.array([0, 1, 3], dtype=np.int64),
+        'centroid_t': np.array([0.0, 10.0, 20.0], dtype=np.float32),
+        'centroid_x': np.array([0.0, 5.0, 5.5]),
+        'centroid_y': np.array([0.0, 7.0, 7.5]),
+    }
+
+
+def empty_columns():
+    return {key: value[:1] if key.endswith('_offsets') else value[:0] for key, value in dummy_columns().items()}
+
+
+class DummyTracker:
+    def __init__(self, *args):
+        self.fed = 0
+
+    def feed(self, x, y, t):
+        self.fed += len(t)
+
+    def feed_file(self, path, on_block=None):
+        self.fed += 1
+        return 1
+
+    def pop_retired(self):
+        return empty_columns()
+
+    def finalize(self):
+        return dummy_columns()
+
+
+def test_process_file_creates_results(tmp_path):
     csv_path = tmp_path / "data.csv"
     with csv_path.open("w", newline="") as f:
         writer = csv.writer(f)
         writer.writerow([0, 0, 1, 0])
 
-    with mock.patch("trackParticlesC.track_particles_cpp", return_value=[DummyParticle(1)]):
-        process_file(str(csv_path))
+    with mock.patch("trackParticlesC.ParticleTracker", DummyTracker):
+        summary = process_file(str(csv_path))
+
+    output = tmp_path / "particle_tracking_results_both_data.npz"
+    assert summary['output'] == str(output)
+    columns, metadata = load_results(str(output))
+    assert columns['particle_id'].tolist() == [1, 4]
+    assert metadata['source'] == "data.csv"
+    assert metadata['num_events'] == 1
+    assert metadata['parameters']['sigma_x'] == trackParticlesC.sigma_x
+    assert metadata['parameters']['tiles'] is None
+    assert metadata['parameters']['count_bin_width'] == trackParticlesC.count_bin_width
+    assert not (tmp_path / "particle_tracking_results_both_data.pkl").exists()
+
+
+def test_process_file_legacy_pickle(tmp_path):
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("0,0,1,0\n")
+
+    with mock.patch("trackParticlesC.ParticleTracker", DummyTracker):
+        process_file(str(csv_path), write_pickle=True)
+
+    data = load_particles(str(tmp_path / "particle_tracking_results_both_data.pkl"))
+    assert sorted(data) == [1, 4]
+    assert np.array_equal(data[4]['events'], [[5, 7, 10.0], [6, 8, 20.0]])
+
+
+def test_concat_columns_shifts_offsets():
+    columns = concat_columns([dummy_columns(), empty_columns(), dummy_columns()])
+    assert columns['particle_id'].tolist() == [1, 4, 1, 4]
+    assert columns['event_offsets'].tolist() == [0, 1, 3, 4, 6]
+    assert columns['centroid_offsets'].tolist() == [0, 1, 3, 4, 6]
+    assert columns['x'].tolist() == [0, 5, 6, 0, 5, 6]
+
+
+class FailingTracker(DummyTracker):
+    def feed_file(self, path, on_block=None):
+        if "bad" in os.path.basename(path):
+            raise ValueError("events must be fed in time order")
+        return 1
+
+
+def test_process_files_isolates_errors_and_keeps_order(tmp_path):
+    paths = []
+    for name in ["b.csv", "bad.csv", "a.csv"]:
+        path = tmp_path / name
+        path.write_text("0,0,1,0\n")
+        paths.append(str(path))
+
+    with mock.patch("trackParticlesC.ParticleTracker", FailingTracker):
+        summaries = process_files(paths, jobs=3)
+
+    assert [s['file'] for s in summaries] == paths
+    assert [s['error'] is None for s in summaries] == [True, False, True]
+    assert "ValueError" in summaries[1]['error']
+    assert summaries[0]['particles'] == 2
+    assert (tmp_path / "particle_tracking_results_both_a.npz").exists()
+    assert not (tmp_path / "particle_tracking_results_both_bad.npz").exists()
+
+
+def test_process_files_passes_options_to_spawned_workers(tmp_path):
+    # Spawned workers re-import trackParticlesC: the options must reach them as arguments
+    rng = np.random.default_rng(0)
+    paths = []
+    for name in ["a.csv", "b.csv"]:
+        t = np.arange(600) * 10
+        events = np.column_stack((rng.integers(100, 104, 600), rng.integers(100, 104, 600), np.ones(600, dtype=int), t))
+        path = tmp_path / name
+        np.savetxt(path, events, fmt="%d", delimiter=",")
+        paths.append(str(path))
+
+    spawn_executor = partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn"))
+    with mock.patch("trackParticlesC.ProcessPoolExecutor", spawn_executor):
+        summaries = process_files(paths, jobs=2, processes=True, tiles=(2, 1), write_pickle=True)
+
+    assert [s['error'] for s in summaries] == [None, None]
+    for name in ["a", "b"]:
+        _, metadata = load_results(str(tmp_path / f"particle_tracking_results_both_{name}.npz"))
+        assert metadata['parameters']['tiles'] == [2, 1]
+        assert (tmp_path / f"particle_tracking_results_both_{name}.pkl").exists()
+
+
+def test_process_files_divides_the_cores_between_tiled_files(tmp_path):
+    paths = []
+    for name in ["a.csv", "b.csv", "c.csv", "d.csv"]:
+        (tmp_path / name).write_text("0,0,1,0\n")
+        paths.append(str(tmp_path / name))
+
+    threads = []
+    def track_tiled(*args, num_threads=0, **kwargs):
+        threads.append(num_threads)
+        return dummy_columns()
 
-    output = tmp_path / "particle_tracking_results_both_data.pkl"
-    assert output.exists()
-    with open(output, "rb") as f:
-        data = pickle.load(f)
-    assert 1 in data
+    with mock.patch("trackParticlesC.track_particles_tiled", track_tiled), mock.patch("os.cpu_count", return_value=8):
+        process_files(paths, jobs=4, tiles=(4, 2))
+        assert threads == [2, 2, 2, 2]
+        threads.clear()
+        process_files(paths[:1], jobs=4, tiles=(4, 2))
+        assert threads == [0]
@@ -1,10 +1,18 @@
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 from matplotlib.backends.backend_pdf import PdfPages
 from scipy.signal import spectrogram
 
+try:
+    from pypdf import PdfWriter
+except ImportError:  # Pages are then rendered one after another
+    PdfWriter = None
+
 from process_fft import *
 from detect_peaks import *
 
@@ -18,50 +26,96 @@ sns.set(
 )
 
 
-def plot_and_save_time_series_fft_to_pdf(
-    folder_name, data_list, folder_file_names, output_pdf_path
-):
-    """Save the time series data and FFT results of selected CSV files into a PDF"""
-    with PdfPages(output_pdf_path) as pdf:
-        for i in range(0, len(data_list), 5):
-            fig, axes = plt.subplots(5, 2, figsize=(15, 20))
+PAGE_ROWS = 5  # Series per page of the FFT report
 
-            for j in range(5):
-                if i + j >= len(data_list):
-                    break
 
-                time_series = data_list[i + j]
-                data_name = os.path.basename(folder_file_names[i + j])
+def fft_report_spectra(data_list):
+    """Spectra and peaks of every series in one batch, as drawn in the FFT report:
+    (frequency axis, (n_series, n_freqs) amplitudes, (n_series, 2) peak indices)"""
+    freqs, fft_magnitude = batch_fft(stack_time_series(data_list))
+    peak_indices, _ = batch_peak_detection(fft_magnitude, freqs)
+    return freqs, fft_magnitude, peak_indices
 
-                # Plot time series data
-                axes[j, 0].plot(time_series)
-                axes[j, 0].set_title(f"{data_name}")
-                axes[j, 0].set_xlabel("Time [ms]")
-                axes[j, 0].set_ylabel("Number of pixel")
 
-                # Compute and plot FFT
-                preprocessed_series = preprocess_time_series(time_series)
-                padded_series = pad_time_series(preprocessed_series)
-                freqs, fft_magnitude = compute_fft(padded_series)
+def draw_fft_page(data_list, data_names, freqs, fft_magnitudes, peak_indices):
+    """Figure of one FFT report page: time series and spectrum of up to PAGE_ROWS series"""
+    fig, axes = plt.subplots(PAGE_ROWS, 2, figsize=(15, 20))
 
-                # Custom peak detection
-                peak_indices, _ = peak_detection(fft_magnitude, freqs)
-                peak_freqs = freqs[peak_indices]
-                peak_values = fft_magnitude[peak_indices]
+    for j in range(len(data_list)):
+        time_series = data_list[j]
+        data_name = os.path.basename(data_names[j])
 
-                axes[j, 1].plot(freqs, fft_magnitude)
-                axes[j, 1].set_xlim((0, 30))
-                axes[j, 1].set_xlabel("Frequency [Hz]")
-                axes[j, 1].set_ylabel("Amplitude")
+        # Plot time series data
+        axes[j, 0].plot(time_series)
+        axes[j, 0].set_title(f"{data_name}")
+        axes[j, 0].set_xlabel("Time [ms]")
+        axes[j, 0].set_ylabel("Number of pixel")
 
-                # Plot detected peaks
-                if len(peak_freqs) > 0:
-                    axes[j, 1].plot(peak_freqs, peak_values, "rx")
-                    axes[j, 1].set_title(
-                        f"a peak is {round(peak_freqs[0], 1)} [Hz]"
-                    )
+        # Plot the FFT computed for the whole batch
+        fft_magnitude = fft_magnitudes[j]
+        peaks = peak_indices[j][peak_indices[j] >= 0]
+        peak_freqs = freqs[peaks]
+        peak_values = fft_magnitude[peaks]
 
-            plt.tight_layout()
+        axes[j, 1].plot(freqs, fft_magnitude)
+        axes[j, 1].set_xlim((0, 30))
+        axes[j, 1].set_xlabel("Frequency [Hz]")
+        axes[j, 1].set_ylabel("Amplitude")
+
+        # Plot detected peaks
+        if len(peak_freqs) > 0:
+            axes[j, 1].plot(peak_freqs, peak_values, "rx")
+            axes[j, 1].set_title(
+                f"a peak is {round(peak_freqs[0], 1)} [Hz]"
+            )
+
+    plt.tight_layout()
+    return fig
+
+
+def render_fft_page(page):
+    """One FFT report page as the bytes of a single-page PDF (run in worker processes)"""
+    fig = draw_fft_page(*page)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="pdf")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def plot_and_save_time_series_fft_to_pdf(
+    folder_name, data_list, folder_file_names, output_pdf_path, spectra=None, jobs=1
+):
+    """Save the time series data and FFT results of selected CSV files into a PDF.
+
+    spectra are the (freqs, fft_magnitude, peak_indices) of the series, computed in one
+    batch by fft_report_spectra when not given. With jobs > 1 (and pypdf installed)
+    the pages are rendered in a process pool and merged in order"""
+    if spectra is None:
+        spectra = fft_report_spectra(data_list)
+    freqs, fft_magnitude, peak_indices = spectra
+    pages = [
+        (
+            data_list[i : i + PAGE_ROWS],
+            folder_file_names[i : i + PAGE_ROWS],
+            freqs,
+            fft_magnitude[i : i + PAGE_ROWS],
+            peak_indices[i : i + PAGE_ROWS],
+        )
+        for i in range(0, len(data_list), PAGE_ROWS)
+    ]
+
+    if jobs > 1 and len(pages) > 1 and PdfWriter is not None:
+        writer = PdfWriter()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for page_pdf in executor.map(render_fft_page, pages):
+                writer.append(io.BytesIO(page_pdf))
+        with open(output_pdf_path, "wb") as f:
+            writer.write(f)
+        return
+
+    with PdfPages(output_pdf_path) as pdf:
+        for page in pages:
+            fig = draw_fft_page(*page)
             pdf.savefig(fig)
             plt.close(fig)
 
@@ -110,43 +164,13 @@ def plot_and_save_time_series_stft_to_pdf(
                 axes[j, 1].set_ylabel("Frequency [Hz]")
                 axes[j, 1].set_xlabel("Time [s]")
                 axes[j, 1].set_ylim(0, 25)
+
+                # Wingbeat frequency over time (sliding DFT)
+                track_times, wingfreqs = wingbeat_track(np.asarray(time_series, dtype=float))
+                axes[j, 1].plot(
+                    track_times, wingfreqs, "w.", markersize=4, label="Wingbeat"
+                )
                 axes[j, 1].legend()
-                # windows_num = (
-                #     len(event_num_arr) - target_data_len
-                # ) // shift_len + 1
-                # stft_peaks = []
-                # for i in range(windows_num):
-                #     if len(event_num_arr) < i * shift_len + windows_len:
-                #         target_arr = event_num_arr[
-                #             i * shift_len + windows_len :
-                #         ]
-                #         padded_series = pad_time_series(target_arr)
-                #     else:
-                #         target_arr = event_num_arr[
-                #             i * shift_len
-                #             + windows_len : (i + 1) * shift_len
-                #             + windows_len
-                #         ]
-                #         padded_series = pad_time_series(target_arr)
-                #     freqs, fft_magnitude = compute_fft(padded_series)
-
-                #     peak_indices, _ = peak_detection(fft_magnitude, freqs)
-
-                #     print(f"STFT peaks: {peak_indices}")
-                #     peak_freqs = freqs[peak_indices]
-                #     peak_values = fft_magnitude[peak_indices]
-                #     stft_peaks.append([peak_freqs, peak_values])
-
-                # for peak in stft_peaks:
-                #     if peak is None:
-                #         continue
-            #             axes[j, 1].plot(stft_peaks)
-
-            #             axes[j, 1].set_title(f"{folder_name} - peaks {i + j + 1}")
-            #             axes[j, 1].set_xlabel("frame")
-            #             axes[j, 1].set_ylabel("Frequency [Hz]")
-            #             axes[j, 1].set_xlim((0, 30))
-            #             axes[j, 1].legend()
             plt.tight_layout()
             pdf.savefig(fig)
             plt.close(fig)
@@ -1,66 +1,151 @@
-import pandas as pd
+import numpy as np
 import argparse
-import pickle
 import os
-from particle_tracking import track_particles_cpp  # import C++ module
-
-parser = argparse.ArgumentParser(description='Particle tracking script.')
-parser.add_argument('-i', '--input', required=True, help='Path to the input directory or file.')
-args = parser.parse_args()
-
-input_path = args.input
+import sys
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from particle_tracking import ParticleTracker, read_events, track_particles_tiled  # import C++ module
+from particle_results import results_path, save_particles_pickle, save_results
 
 # Parameters for particle tracking
 sigma_x = 6.0  # Spatial scale parameter: 6 for sperm, Bat, 9 for marine snow
 sigma_t = 10000.0  # Temporal scale parameter: 10000 for sperm, Bat, and marine snow
 gaussian_threshold = 0.8  # Threshold for Gaussian score, around 0.8 seems good
 m_threshold = 500  # Mass threshold, around 100
+centroid_window = 2000.0  # Time window of the events averaged into the centroid [us]
+activity_window = 2000.0  # Particles at or below m_threshold are dropped after this long without events [us]
+count_bin_width = 1000.0  # Bin width of the per-particle event counts saved with the results (1 ms for plotEventCountFFT.py), 0 to skip them [us]
+
+# Event files read by the tracker: x,y,polarity,time CSV or .npy (read through a memory map)
+EVENT_EXTENSIONS = ('.csv', '.npy')
 
-def process_file(file_path):
+def concat_columns(parts):
+    """Concatenate columnar tracker outputs (e.g. successive ParticleTracker.pop_retired() results), shifting the offsets"""
+    columns = {}
+    for key in parts[0]:
+        if key.endswith('_offsets'):
+            shifted = [np.zeros(1, dtype=np.int64)]
+            base = 0
+            for part in parts:
+                shifted.append(part[key][1:] + base)
+                base += part[key][-1]
+            columns[key] = np.concatenate(shifted)
+        else:
+            columns[key] = np.concatenate([part[key] for part in parts])
+    return columns
+
+def tracking_parameters(tiles=None):
+    """Tracking parameters recorded in the metadata header of the results"""
+    return {
+        'sigma_x': sigma_x,
+        'sigma_t': sigma_t,
+        'gaussian_threshold': gaussian_threshold,
+        'm_threshold': m_threshold,
+        'centroid_window': centroid_window,
+        'activity_window': activity_window,
+        'count_bin_width': count_bin_width,
+        'tiles': list(tiles) if tiles is not None else None,
+    }
+
+def process_file(file_path, tiles=None, write_pickle=False, tile_threads=0):
+    """Track one event file and save its particles next to it. tiles is (tiles_x, tiles_y) to track spatial tiles of the
+    recording in parallel on tile_threads threads (0 uses every core), or None for a single streaming tracker;
+    write_pickle also exports the legacy pickle of particle dicts next to the columnar .npz results. Returns a summary dict; errors are caught and reported in the summary so
+    that one bad file does not stop a batch"""
     print(f"Processing file: {file_path}")
-    
-    # Read CSV file
-    data_filtered = pd.read_csv(file_path, header=None, names=['x', 'y', 'polarity', 'time'])
-    
-    # Restrict to positive polarity data
-    #data_filtered = data[data['polarity'] == 1].copy()
-    
-    data_list = [tuple(row) for row in data_filtered[['x', 'y', 'time']].itertuples(index=False, name=None)]
-    
-    print(f"Number of data points after filtering: {len(data_filtered)}")
-    
+    summary = {'file': file_path, 'events': 0, 'particles': 0, 'output': None, 'error': None}
+
     try:
-        # Call the C++ function (using sigma_x, sigma_t, gaussian_threshold)
-        particles = track_particles_cpp(data_list, sigma_x, sigma_t, gaussian_threshold, m_threshold)
-    
-        particle_output = {}
-        for p in particles:
-            particle_output[p.particle_id] = {
-                'centroid_history': p.centroid_history,  # Centroid coordinates (x, y)
-                'events': p.events       # All events [(x, y, time), ...]
-            }
-    
-        # Save the pickle file in the same directory as the input file
-        output_file = os.path.join(os.path.dirname(file_path), f'particle_tracking_results_both_{os.path.basename(file_path).split(".")[0]}.pkl')
-        with open(output_file, 'wb') as f:
-            pickle.dump(particle_output, f)
+        if tiles is None:
+            # Parse the event file natively and stream it through the tracker (using sigma_x, sigma_t, gaussian_threshold).
+            # The retired particles are popped after every block, so that the tracker only holds the live ones and the
+            # finished ones wait as columnar arrays
+            tracker = ParticleTracker(sigma_x, sigma_t, gaussian_threshold, m_threshold, centroid_window, activity_window, count_bin_width)
+            parts = []
+            num_events = tracker.feed_file(file_path, lambda: parts.append(tracker.pop_retired()))
+            columns = concat_columns(parts + [tracker.pop_retired(), tracker.finalize()])
+        else:
+            # Track the tiles of the sensor on every core and stitch the particles crossing the seams
+            events = read_events(file_path)
+            num_events = len(events['t'])
+            columns = track_particles_tiled(events['x'], events['y'], events['t'], sigma_x, sigma_t, gaussian_threshold, m_threshold,
+                                            centroid_window, activity_window, tiles_x=tiles[0], tiles_y=tiles[1],
+                                            num_threads=tile_threads, count_bin_width=count_bin_width)
     
+        print(f"Number of data points after filtering: {num_events}")
+
+        # Save the columnar results (and optionally the legacy pickle) in the same directory as the input file
+        output_file = results_path(file_path)
+        save_results(output_file, columns, {
+            'source': os.path.basename(file_path),
+            'num_events': num_events,
+            'parameters': tracking_parameters(tiles),
+        })
+        if write_pickle:
+            save_particles_pickle(results_path(file_path, '.pkl'), columns)
+
         print(f"Particle tracking results saved to {output_file}")
-    
+        summary.update(events=num_events, particles=len(columns['particle_id']), output=output_file)
+
     except Exception as e:
         print("An error occurred during the particle tracking process.")
         print(f"Error message: {e}")
+        summary['error'] = f"{type(e).__name__}: {e}"
+
+    return summary
+
+def process_files(file_paths, jobs=1, processes=False, tiles=None, write_pickle=False):
+    """Track several event files, up to jobs at a time, and return their summaries in the order of file_paths.
+    The tracker releases the GIL, so a thread pool already keeps the cores busy; processes=True isolates each file in a
+    worker process instead. The options are passed to every process_file call (worker processes started with spawn
+    re-import this module, so they would not see values set on it). With tiles, the cores are shared between the files
+    tracked at once rather than each file starting a thread per core"""
+    if jobs <= 1 or len(file_paths) <= 1:
+        return [process_file(file_path, tiles, write_pickle) for file_path in file_paths]
+    tile_threads = max(1, (os.cpu_count() or 1) // min(jobs, len(file_paths)))
+    track = partial(process_file, tiles=tiles, write_pickle=write_pickle, tile_threads=tile_threads)
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=jobs) as executor:
+        return list(executor.map(track, file_paths))
+
+def print_summary(summaries):
+    """Print one line per file, in input order, and a total"""
+    print("Summary:")
+    for summary in summaries:
+        if summary['error'] is None:
+            print(f"  {summary['file']}: {summary['events']} events, {summary['particles']} particles -> {summary['output']}")
+        else:
+            print(f"  {summary['file']}: FAILED ({summary['error']})")
+    failed = sum(summary['error'] is not None for summary in summaries)
+    print(f"{len(summaries) - failed} of {len(summaries)} files tracked")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Particle tracking script.')
+    parser.add_argument('-i', '--input', required=True, help='Path to the input directory or file.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of files tracked in parallel (0 uses every core).')
+    parser.add_argument('--processes', action='store_true', help='Use worker processes instead of threads for --jobs.')
+    parser.add_argument('--tiles', type=int, nargs=2, metavar=('X', 'Y'), help='Track X by Y spatial tiles of each recording in parallel.')
+    parser.add_argument('--pickle', action='store_true', help='Also write the legacy pickle of particle dicts.')
+    args = parser.parse_args()
+
+    input_path = args.input
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+    # If input is a directory, process all event files in the directory
+    if os.path.isdir(input_path):
+        file_paths = [os.path.join(input_path, filename) for filename in sorted(os.listdir(input_path))
+                      if filename.endswith(EVENT_EXTENSIONS)]
 
-# If input is a directory, process all CSV files in the directory
-if os.path.isdir(input_path):
-    for filename in os.listdir(input_path):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(input_path, filename)
-            process_file(file_path)
+    # If input is an event file, process that file
+    elif os.path.isfile(input_path) and input_path.endswith(EVENT_EXTENSIONS):
+        file_paths = [input_path]
 
-# If input is a CSV file, process that file
-elif os.path.isfile(input_path) and input_path.endswith('.csv'):
-    process_file(input_path)
+    else:
+        print("Invalid input. Please provide a valid CSV/.npy file or directory.")
+        sys.exit(1)
 
-else:
-    print("Invalid input. Please provide a valid CSV file or directory.")
+    summaries = process_files(file_paths, jobs, args.processes, args.tiles, args.pickle)
+    print_summary(summaries)
+    if any(summary['error'] is not None for summary in summaries):
+        sys.exit(1)